@@ -0,0 +1,157 @@
+"""
+Compares the insert rate and resulting SQLite file size of the primary keys tried
+for the feedstock outputs: the legacy random row IDs (uuid3 of uuid1/uuid4), IDs
+hashed from the natural key (feedstock + package), and the composite primary key
+of integer surrogate IDs used by the current schema (see cfdb.models.schema).
+
+The rows arrive in random order, as the output blobs are listed, and are upserted
+in batches on their natural key, as the updater does.
+
+Usage:
+    python benchmarks/bench_row_ids.py [--rows 200000] [--batch 1000]
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import create_engine
+
+from cfdb.populate.loaders import chunked
+
+HASH = bytes(20)
+
+RANDOM_ID_SCHEMA = """
+CREATE TABLE feedstock_outputs (
+    id BLOB(16) NOT NULL, path VARCHAR, feedstock_name VARCHAR, package_name VARCHAR,
+    hash BLOB(20), PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX feedstock_output_index ON feedstock_outputs (feedstock_name, package_name)
+"""
+RANDOM_ID_UPSERT = (
+    "INSERT INTO feedstock_outputs VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT (feedstock_name, package_name) DO UPDATE SET hash = excluded.hash"
+)
+
+SURROGATE_KEY_SCHEMA = """
+CREATE TABLE feedstock_outputs (
+    feedstock_id INTEGER NOT NULL, package_id INTEGER NOT NULL, path VARCHAR,
+    hash BLOB(20), PRIMARY KEY (feedstock_id, package_id)
+) WITHOUT ROWID
+"""
+SURROGATE_KEY_UPSERT = (
+    "INSERT INTO feedstock_outputs VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (feedstock_id, package_id) DO UPDATE SET hash = excluded.hash"
+)
+
+
+def legacy_id(feedstock, package):
+    return uuid.uuid3(uuid.uuid1(), uuid.uuid4().hex).bytes
+
+
+def natural_id(feedstock, package):
+    return hashlib.blake2b(f"{feedstock}\0{package}".encode(), digest_size=16).digest()
+
+
+def surrogate_ids():
+    # integer IDs handed out in order of first appearance, as ensure_ids does
+    ids = {}
+
+    def _surrogate_id(name):
+        return ids.setdefault(name, len(ids) + 1)
+
+    return _surrogate_id
+
+
+def random_id_rows(id_func):
+    def _rows(keys):
+        return [
+            (id_func(feedstock, package), f"{package}.json", feedstock, package, HASH)
+            for feedstock, package in keys
+        ]
+
+    return _rows
+
+
+def surrogate_key_rows():
+    feedstock_id, package_id = surrogate_ids(), surrogate_ids()
+
+    def _rows(keys):
+        return [
+            (feedstock_id(feedstock), package_id(package), f"{package}.json", HASH)
+            for feedstock, package in keys
+        ]
+
+    return _rows
+
+
+def run(schema, upsert, rows, keys, batch):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, "bench.db")
+        engine = create_engine(f"sqlite:///{db_file}")
+        with engine.begin() as connection:
+            for statement in schema.split(";"):
+                connection.exec_driver_sql(statement)
+
+        start = time.perf_counter()
+        for keys_batch in chunked(keys, batch):
+            with engine.begin() as connection:
+                connection.exec_driver_sql(upsert, rows(keys_batch))
+        elapsed = time.perf_counter() - start
+
+        engine.dispose()
+        return len(keys) / elapsed, os.path.getsize(db_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    keys = [(f"feedstock-{i // 3}", f"package-{i}") for i in range(args.rows)]
+    random.Random(0).shuffle(keys)
+
+    # ID generation alone
+    package_id = surrogate_ids()
+    for name, id_func in (
+        ("uuid3(uuid1, uuid4)", legacy_id),
+        ("natural key digest", natural_id),
+        ("integer surrogate", lambda feedstock, package: package_id(package)),
+    ):
+        start = time.perf_counter()
+        for feedstock, package in keys:
+            id_func(feedstock, package)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>20}: {len(keys) / elapsed:>12,.0f} ids/s")
+
+    for name, schema, upsert, rows in (
+        (
+            "uuid3(uuid1, uuid4)",
+            RANDOM_ID_SCHEMA,
+            RANDOM_ID_UPSERT,
+            random_id_rows(legacy_id),
+        ),
+        (
+            "natural key digest",
+            RANDOM_ID_SCHEMA,
+            RANDOM_ID_UPSERT,
+            random_id_rows(natural_id),
+        ),
+        (
+            "integer surrogate",
+            SURROGATE_KEY_SCHEMA,
+            SURROGATE_KEY_UPSERT,
+            surrogate_key_rows(),
+        ),
+    ):
+        rate, size = run(schema, upsert, rows, keys, args.batch)
+        print(f"{name:>20}: {rate:>12,.0f} rows/s {size / 2**20:>8.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
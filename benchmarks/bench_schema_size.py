@@ -0,0 +1,136 @@
+"""
+Builds a synthetic database with the version 1 layout (string keys, random 16-byte
+IDs, hexadecimal hashes), migrates it in place to the current schema and reports
+the file size and join latency before and after.
+
+Usage:
+    python benchmarks/bench_schema_size.py [--packages 30000] [--imports 300000]
+"""
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import create_engine
+
+from cfdb.models.migrations import upgrade, vacuum
+
+V1_SCHEMA = """
+CREATE TABLE feedstocks (name VARCHAR NOT NULL, PRIMARY KEY (name));
+CREATE INDEX ix_feedstocks_name ON feedstocks (name);
+CREATE TABLE packages (name VARCHAR NOT NULL, PRIMARY KEY (name));
+CREATE INDEX ix_packages_name ON packages (name);
+CREATE TABLE feedstock_outputs (
+    id BLOB(16) NOT NULL, path VARCHAR, feedstock_name INTEGER, package_name INTEGER,
+    hash VARCHAR, PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX feedstock_output_index ON feedstock_outputs (feedstock_name, package_name);
+CREATE TABLE import_to_package_mapping (
+    id BLOB(16) NOT NULL, import_name VARCHAR, parent_package_name VARCHAR,
+    partition VARCHAR, hash VARCHAR, PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX import_to_package_mapping_index ON import_to_package_mapping (import_name, parent_package_name)
+"""
+
+V1_JOIN = (
+    "SELECT o.feedstock_name FROM import_to_package_mapping m "
+    "JOIN feedstock_outputs o ON o.package_name = m.parent_package_name "
+    "WHERE m.import_name = ?"
+)
+V2_JOIN = (
+    "SELECT f.name FROM import_names i "
+    "JOIN import_to_package_mapping m ON m.import_id = i.id "
+    "JOIN feedstock_outputs o ON o.package_id = m.package_id "
+    "JOIN feedstocks f ON f.id = o.feedstock_id "
+    "WHERE i.name = ?"
+)
+
+
+def sha1(value):
+    return hashlib.sha1(value.encode()).hexdigest()
+
+
+def populate_v1(connection, n_packages, n_imports):
+    rng = random.Random(0)
+    packages = [f"python-package-{i:06d}" for i in range(n_packages)]
+    feedstocks = [f"python-package-{i:06d}-feedstock" for i in range(n_packages // 2)]
+
+    for statement in V1_SCHEMA.split(";"):
+        connection.exec_driver_sql(statement)
+
+    connection.exec_driver_sql(
+        "INSERT INTO packages VALUES (?)", [(name,) for name in packages]
+    )
+    connection.exec_driver_sql(
+        "INSERT INTO feedstocks VALUES (?)", [(name,) for name in feedstocks]
+    )
+    connection.exec_driver_sql(
+        "INSERT INTO feedstock_outputs VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                uuid.uuid4().bytes,
+                f"outputs/{package[0]}/{package[1]}/{package}.json",
+                feedstocks[i // 2],
+                package,
+                sha1(package),
+            )
+            for i, package in enumerate(packages)
+        ],
+    )
+    mappings = {
+        (f"module_{i // 2:06d}.submodule_{i % 7}", rng.choice(packages))
+        for i in range(n_imports)
+    }
+    connection.exec_driver_sql(
+        "INSERT INTO import_to_package_mapping VALUES (?, ?, ?, ?, ?)",
+        [
+            (uuid.uuid4().bytes, name, package, name[7:9], sha1(name[7:9]))
+            for name, package in mappings
+        ],
+    )
+
+
+def time_join(engine, query, n=2000):
+    with engine.connect() as connection:
+        start = time.perf_counter()
+        for i in range(n):
+            connection.exec_driver_sql(
+                query, (f"module_{i * 7 % 100000:06d}.submodule_0",)
+            ).all()
+        return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--packages", type=int, default=30_000)
+    parser.add_argument("--imports", type=int, default=300_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, "cf-database.db")
+        engine = create_engine(f"sqlite:///{db_file}")
+
+        with engine.begin() as connection:
+            populate_v1(connection, args.packages, args.imports)
+        vacuum(engine)
+        v1_size, v1_join = os.path.getsize(db_file), time_join(engine, V1_JOIN)
+
+        start = time.perf_counter()
+        with engine.begin() as connection:
+            upgrade(connection)
+        vacuum(engine)
+        elapsed = time.perf_counter() - start
+        v2_size, v2_join = os.path.getsize(db_file), time_join(engine, V2_JOIN)
+
+        engine.dispose()
+
+    print(f"v1 layout: {v1_size / 2**20:8.2f} MiB, import->feedstock join {v1_join:7.1f} us")
+    print(f"v2 layout: {v2_size / 2**20:8.2f} MiB, import->feedstock join {v2_join:7.1f} us")
+    print(f"migration + VACUUM: {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import asyncio
+from pathlib import Path
+
+from sqlalchemy.engine import make_url
+
+from cfdb import bloom
+from cfdb.models import migrations
+from cfdb.populate import artifacts, feedstock_outputs, import_to_package_maps
+from cfdb.populate.cache import ParseCache
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def to_async_url(db_url: str) -> str:
+    """
+    Converts a database URL to its asyncio driver counterpart, e.g.
+    ``sqlite:///cf-database.db`` becomes ``sqlite+aiosqlite:///cf-database.db``.
+    URLs that already name a driver are returned untouched.
+
+    Args:
+        db_url (str): The URL of the database.
+
+    Returns:
+        str: The URL of the database using an asyncio driver.
+    """
+    url = make_url(db_url)
+    if "+" in url.drivername:
+        return url.render_as_string(hide_password=False)
+
+    if url.drivername not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver known for '{url.drivername}' URLs.")
+
+    return url.set(drivername=ASYNC_DRIVERS[url.drivername]).render_as_string(
+        hide_password=False
+    )
+
+
+class AsyncCFDBHandler:
+    """
+    AsyncCFDBHandler is the asyncio counterpart of CFDBHandler, built on top of
+    SQLAlchemy's async engine (aiosqlite for SQLite, asyncpg for PostgreSQL).
+
+    File reads and parsing run as asyncio tasks bounded by a file semaphore, and
+    writes are issued by a pool of concurrent sessions bounded by a database
+    semaphore. Both semaphores are shared by all the updaters of the handler.
+    SQLite only supports a single writer, so its database concurrency is always 1.
+
+    Args:
+        db_url (str): The URL of the database.
+        file_concurrency (int, optional): Maximum number of concurrent file reads. Defaults to 32.
+        db_concurrency (int, optional): Maximum number of concurrent writers. Defaults to 4.
+        parse_cache (str, optional): File persisting the parsed JSON blobs between
+            runs, keyed by their hash. Defaults to None, meaning an in-memory cache.
+
+    Attributes:
+        db_url (str): The URL of the database (using an asyncio driver).
+        engine (AsyncEngine): SQLAlchemy AsyncEngine object.
+        Session (async_sessionmaker): SQLAlchemy async_sessionmaker object.
+        parse_cache (ParseCache): Cache of the parsed JSON blobs, shared by the updaters.
+
+    Methods:
+        update_feedstock_outputs: Update the feedstock outputs in the database.
+        update_import_to_package_maps: Update the import to package maps in the database.
+        update_artifacts: Update the artifacts in the database.
+    """
+
+    def __init__(self, db_url, file_concurrency=32, db_concurrency=4, parse_cache=None):
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        self.db_url = to_async_url(db_url)
+        self.engine = create_async_engine(self.db_url)
+        self.Session = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.parse_cache = ParseCache(path=Path(parse_cache) if parse_cache else None)
+
+        if self.engine.dialect.name == "sqlite":
+            db_concurrency = 1
+
+        self.file_concurrency = file_concurrency
+        self.db_concurrency = db_concurrency
+        self._file_semaphore = None
+        self._db_semaphore = None
+        self._initialized = False
+
+    async def __aenter__(self):
+        await self.initialize()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.dispose()
+
+    @property
+    def file_semaphore(self) -> asyncio.Semaphore:
+        # created lazily so that it binds to the running event loop
+        if self._file_semaphore is None:
+            self._file_semaphore = asyncio.Semaphore(self.file_concurrency)
+        return self._file_semaphore
+
+    @property
+    def db_semaphore(self) -> asyncio.Semaphore:
+        if self._db_semaphore is None:
+            self._db_semaphore = asyncio.Semaphore(self.db_concurrency)
+        return self._db_semaphore
+
+    async def initialize(self):
+        """
+        Create the database tables if they do not exist yet, or migrate them to the
+        current schema version.
+        """
+        if self._initialized:
+            return
+
+        async with self.engine.begin() as connection:
+            await connection.run_sync(migrations.upgrade)
+        self._initialized = True
+
+    async def dispose(self):
+        """
+        Dispose of the connection pool of the engine, and close the parse cache.
+        """
+        await self.engine.dispose()
+        self.parse_cache.close()
+
+    async def update_feedstock_outputs(self, path):
+        """
+        Update the feedstock outputs in the database.
+
+        Args:
+            path (str): Path to the feedstock outputs directory.
+        """
+        await self.initialize()
+        await feedstock_outputs.update_async(
+            self.Session,
+            path=Path(path),
+            file_semaphore=self.file_semaphore,
+            db_semaphore=self.db_semaphore,
+            cache=self.parse_cache,
+            num_workers=self.db_concurrency,
+        )
+
+    async def update_artifacts(self, path):
+        """
+        Update the artifacts and their file listings in the database.
+
+        Args:
+            path (str): Path to the artifacts directory.
+        """
+        await self.initialize()
+        await artifacts.update_async(
+            self.Session, path=Path(path), file_semaphore=self.file_semaphore
+        )
+
+    async def update_import_to_package_maps(
+        self, path, filter_fp_rate=bloom.DEFAULT_FALSE_POSITIVE_RATE
+    ):
+        """
+        Update the import to package maps in the database, then the Bloom filter of
+        the import names.
+
+        Args:
+            path (str): Path to the import to package maps directory.
+            filter_fp_rate (float, optional): Target false positive rate of the
+                import name filter. Defaults to 0.01.
+        """
+        await self.initialize()
+        await import_to_package_maps.update_async(
+            self.Session,
+            path=Path(path),
+            file_semaphore=self.file_semaphore,
+            db_semaphore=self.db_semaphore,
+            cache=self.parse_cache,
+        )
+        async with self.Session() as session:
+            await session.run_sync(bloom.update_import_filter, filter_fp_rate)
+            await session.commit()
@@ -0,0 +1,214 @@
+"""
+Whole-ecosystem aggregates, run on an embedded DuckDB copy of the database.
+
+The database (SQLite or PostgreSQL) stays the system of record and answers the
+point lookups. Aggregates over every feedstock output or import map scan whole
+tables, which DuckDB's columnar, vectorized engine does much faster, so the fact
+and dimension tables are copied to a DuckDB file, streamed in Arrow batches. The
+copy records the data version of the database it was made at, and is refreshed
+when an update bumped it; the results of the analyses are cached in the DuckDB
+file until the next refresh.
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from sqlalchemy.engine import Engine, make_url
+
+from cfdb import export
+from cfdb.log import logger
+from cfdb.models import migrations
+from cfdb.models.schema import (
+    FeedstockOutputs,
+    Feedstocks,
+    ImportNames,
+    ImportToPackageMaps,
+    Packages,
+)
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - optional dependency
+    duckdb = None
+
+# Tables copied to DuckDB
+TABLES = (
+    Packages.__table__,
+    Feedstocks.__table__,
+    ImportNames.__table__,
+    FeedstockOutputs.__table__,
+    ImportToPackageMaps.__table__,
+)
+
+# Number of rows converted to an Arrow batch at once
+COPY_BATCH_SIZE = 100000
+
+# name -> (description, DuckDB query, with $limit bound to the number of rows)
+ANALYSES: Dict[str, Tuple[str, str]] = {
+    "top-feedstocks": (
+        "Feedstocks producing the most packages.",
+        """
+        SELECT f.name AS feedstock, count(*) AS packages
+        FROM feedstock_outputs o
+        JOIN feedstocks f ON f.id = o.feedstock_id
+        GROUP BY f.name
+        ORDER BY packages DESC, feedstock
+        LIMIT $limit
+        """,
+    ),
+    "shared-imports": (
+        "Import names provided by more than one package.",
+        """
+        SELECT i.name AS import_name, count(*) AS packages,
+            string_agg(p.name, ' ' ORDER BY p.name) AS package_names
+        FROM import_to_package_mapping m
+        JOIN import_names i ON i.id = m.import_id
+        JOIN packages p ON p.id = m.package_id
+        GROUP BY i.name
+        HAVING count(*) > 1
+        ORDER BY packages DESC, import_name
+        LIMIT $limit
+        """,
+    ),
+    "partition-sizes": (
+        "Number of import map partitions by number of mappings, in power of two "
+        "buckets.",
+        """
+        SELECT CAST(pow(2, floor(log2(size))) AS BIGINT) AS min_mappings,
+            count(*) AS partitions, sum(size) AS mappings
+        FROM (
+            SELECT partition, count(*) AS size
+            FROM import_to_package_mapping
+            GROUP BY partition
+        )
+        GROUP BY min_mappings
+        ORDER BY min_mappings
+        LIMIT $limit
+        """,
+    ),
+}
+
+
+def _require() -> None:
+    if duckdb is None or export.pyarrow is None:
+        raise RuntimeError(
+            "The analyses require the duckdb and pyarrow packages, install them "
+            "with `pip install duckdb pyarrow`."
+        )
+
+
+def default_path(db_url: str) -> Path:
+    """
+    Returns the DuckDB file next to a SQLite database, e.g. cf-database.duckdb for
+    sqlite:///cf-database.db or its read-only form
+    sqlite:///file:cf-database.db?mode=ro&uri=true, and cf-database.duckdb in the
+    working directory for other databases.
+    """
+    url = make_url(db_url)
+    in_file = url.database not in (None, "", ":memory:")
+    if url.get_backend_name() == "sqlite" and in_file:
+        database = url.database
+        if url.query.get("uri"):
+            database = unquote(urlparse(database).path)
+        return Path(database).with_suffix(".duckdb")
+    return Path("cf-database.duckdb")
+
+
+def _copy_table(source, target, table) -> int:
+    target.execute(f"DROP TABLE IF EXISTS {table.name}")
+    target.register("_cfdb_batch", export.arrow_schema(table).empty_table())
+    target.execute(f"CREATE TABLE {table.name} AS SELECT * FROM _cfdb_batch")
+    target.unregister("_cfdb_batch")
+
+    num_rows = 0
+    for batch in export.iter_arrow_batches(source, table, COPY_BATCH_SIZE):
+        target.register("_cfdb_batch", batch)
+        target.execute(f"INSERT INTO {table.name} SELECT * FROM _cfdb_batch")
+        target.unregister("_cfdb_batch")
+        num_rows += batch.num_rows
+    return num_rows
+
+
+def sync(engine: Engine, path: Path, force: bool = False) -> bool:
+    """
+    Copies the tables of the database to a DuckDB file, unless the file already
+    holds the current data version of the database.
+
+    Args:
+        engine (Engine): SQLAlchemy Engine object of the database.
+        path (Path): The DuckDB file.
+        force (bool, optional): Copy even if the data version did not change.
+            Defaults to False.
+
+    Returns:
+        bool: Whether the tables were copied.
+    """
+    _require()
+    with engine.connect() as source, duckdb.connect(str(path)) as target:
+        target.execute(
+            "CREATE TABLE IF NOT EXISTS cfdb_sync (data_version BIGINT NOT NULL)"
+        )
+        target.execute(
+            "CREATE TABLE IF NOT EXISTS cfdb_results "
+            "(analysis VARCHAR, max_rows BIGINT, result VARCHAR, "
+            "PRIMARY KEY (analysis, max_rows))"
+        )
+        data_version = migrations.get_data_version(source)
+        synced = target.execute("SELECT max(data_version) FROM cfdb_sync").fetchone()
+        if not force and synced[0] == data_version:
+            return False
+
+        target.execute("BEGIN TRANSACTION")
+        for table in TABLES:
+            num_rows = _copy_table(source, target, table)
+            logger.debug(f"Copied {num_rows} rows of {table.name} to {path}")
+        target.execute("DELETE FROM cfdb_results")
+        target.execute("DELETE FROM cfdb_sync")
+        target.execute("INSERT INTO cfdb_sync VALUES (?)", [data_version])
+        target.execute("COMMIT")
+
+    logger.info(f"Copied the database at data version {data_version} to {path}")
+    return True
+
+
+def analyze(
+    engine: Engine, name: str, limit: int = 20, path: Optional[Path] = None
+) -> Tuple[List[str], List[tuple]]:
+    """
+    Runs one of the `ANALYSES` on the DuckDB copy of the database, refreshing the
+    copy first if the database was updated since. Results are cached in the
+    DuckDB file until the next refresh.
+
+    Args:
+        engine (Engine): SQLAlchemy Engine object of the database.
+        name (str): The analysis, one of `ANALYSES`.
+        limit (int, optional): Maximum number of rows. Defaults to 20.
+        path (Path, optional): The DuckDB file. Defaults to `default_path`.
+
+    Returns:
+        Tuple[List[str], List[tuple]]: The column names and the rows.
+    """
+    if name not in ANALYSES:
+        raise ValueError(f"Unknown analysis {name}, expected one of {list(ANALYSES)}.")
+    path = default_path(str(engine.url)) if path is None else path
+    sync(engine, path)
+
+    with duckdb.connect(str(path)) as connection:
+        cached = connection.execute(
+            "SELECT result FROM cfdb_results WHERE analysis = ? AND max_rows = ?",
+            [name, limit],
+        ).fetchone()
+        if cached is not None:
+            result = json.loads(cached[0])
+            return result["columns"], [tuple(row) for row in result["rows"]]
+
+        cursor = connection.execute(ANALYSES[name][1], {"limit": limit})
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+        connection.execute(
+            "INSERT INTO cfdb_results VALUES (?, ?, ?)",
+            [name, limit, json.dumps({"columns": columns, "rows": rows})],
+        )
+    return columns, rows
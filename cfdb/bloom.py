@@ -0,0 +1,243 @@
+"""
+Bloom filter over the known import names, used as a negative cache.
+
+Most of the imports of a scanned project are standard library or first-party
+modules that no package provides. The filter answers "definitely not mapped" for
+them from memory, so that only the names that may be mapped cost a database
+round-trip. It is rebuilt at the end of each update of the import to package maps
+and stored in the ``cfdb_filters`` table, along with the largest import name ID it
+covers: a filter missing names inserted since then is ignored by the readers.
+"""
+
+import hashlib
+import math
+import struct
+from typing import Iterable, Optional, Union
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from cfdb.log import logger
+from cfdb.models.migrations import bump_data_version
+from cfdb.models.schema import Filters, ImportNames
+
+DEFAULT_FALSE_POSITIVE_RATE = 0.01
+
+IMPORT_FILTER = "import_names"
+
+MAGIC = b"CFBF"
+# magic, number of bits, number of hash functions, number of items, target false
+# positive rate
+HEADER = struct.Struct("<4sQIQd")
+
+
+def _hashes(value: str):
+    """
+    Returns the two 64-bit hashes combined into the k bit positions of a value,
+    stable across processes (unlike `hash`).
+    """
+    digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+class BloomFilter:
+    """
+    Bloom filter of strings, with k bit positions derived from two hashes (double
+    hashing). Lookups never return false negatives, and false positives at the
+    rate the filter was sized for.
+
+    Args:
+        num_bits (int): Size of the bit array.
+        num_hashes (int): Number of bit positions per item.
+        fp_rate (float, optional): The false positive rate the filter was sized
+            for. Defaults to DEFAULT_FALSE_POSITIVE_RATE.
+        bits (bytes, optional): The bit array. Defaults to None, meaning empty.
+        num_items (int, optional): Number of items added to `bits`. Defaults to 0.
+
+    Attributes:
+        num_bits (int): Size of the bit array.
+        num_hashes (int): Number of bit positions per item.
+        fp_rate (float): The false positive rate the filter was sized for.
+        num_items (int): Number of items added.
+    """
+
+    def __init__(
+        self,
+        num_bits: int,
+        num_hashes: int,
+        fp_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+        bits: Optional[bytes] = None,
+        num_items: int = 0,
+    ):
+        self.num_bits = max(num_bits, 8)
+        self.num_hashes = max(num_hashes, 1)
+        self.fp_rate = fp_rate
+        self.bits = bytearray((self.num_bits + 7) // 8) if bits is None else bits
+        self.num_items = num_items
+
+    @classmethod
+    def for_capacity(
+        cls, num_items: int, fp_rate: float = DEFAULT_FALSE_POSITIVE_RATE
+    ) -> "BloomFilter":
+        """
+        Returns an empty filter sized for `num_items` items at `fp_rate`.
+
+        Args:
+            num_items (int): The expected number of items.
+            fp_rate (float, optional): The target false positive rate, between 0
+                and 1. Defaults to DEFAULT_FALSE_POSITIVE_RATE.
+
+        Returns:
+            BloomFilter: The filter.
+        """
+        if not 0 < fp_rate < 1:
+            raise ValueError(f"False positive rate must be between 0 and 1: {fp_rate}.")
+
+        num_items = max(num_items, 1)
+        num_bits = math.ceil(-num_items * math.log(fp_rate) / math.log(2) ** 2)
+        num_hashes = round(num_bits / num_items * math.log(2))
+        return cls(num_bits, num_hashes, fp_rate)
+
+    @classmethod
+    def from_items(
+        cls, items: Iterable[str], fp_rate: float = DEFAULT_FALSE_POSITIVE_RATE
+    ) -> "BloomFilter":
+        """
+        Returns a filter of `items`, sized for them at `fp_rate`.
+        """
+        items = list(items)
+        bloom = cls.for_capacity(len(items), fp_rate)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def _positions(self, value: str):
+        h1, h2 = _hashes(value)
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, value: str) -> None:
+        """
+        Adds a string to the filter.
+        """
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.num_items += 1
+
+    def __contains__(self, value: str) -> bool:
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+    @property
+    def false_positive_rate(self) -> float:
+        """
+        The actual false positive rate of the filter, estimated from the fraction
+        of bits set.
+        """
+        num_set = bin(int.from_bytes(self.bits, "little")).count("1")
+        return (num_set / self.num_bits) ** self.num_hashes
+
+    def to_bytes(self) -> bytes:
+        """
+        Serializes the filter, see `from_bytes`.
+        """
+        header = HEADER.pack(
+            MAGIC, self.num_bits, self.num_hashes, self.num_items, self.fp_rate
+        )
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        """
+        Deserializes a filter written by `to_bytes`.
+        """
+        magic, num_bits, num_hashes, num_items, fp_rate = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a serialized Bloom filter.")
+        return cls(num_bits, num_hashes, fp_rate, data[HEADER.size :], num_items)
+
+    def __repr__(self):
+        return (
+            f"<BloomFilter(num_items={self.num_items}, num_bits={self.num_bits}, "
+            f"num_hashes={self.num_hashes}, fp_rate={self.fp_rate})>"
+        )
+
+
+def _max_import_id(bind: Union[Connection, Session]) -> int:
+    return bind.execute(select(func.max(ImportNames.id))).scalar() or 0
+
+
+def load_import_filter(connection: Connection) -> Optional[BloomFilter]:
+    """
+    Returns the stored filter of the import names, or None when there is none, or
+    when names were inserted after it was built.
+
+    Args:
+        connection (Connection): The SQLAlchemy connection object.
+
+    Returns:
+        Optional[BloomFilter]: The filter of the normalized import names.
+    """
+    try:
+        row = connection.execute(
+            select(Filters.max_id, Filters.data).where(Filters.name == IMPORT_FILTER)
+        ).first()
+    except DBAPIError:
+        # databases of an older schema version, opened read-only
+        return None
+
+    if row is None or row.max_id != _max_import_id(connection):
+        return None
+    return BloomFilter.from_bytes(row.data)
+
+
+def update_import_filter(
+    bind: Union[Connection, Session], fp_rate: float = DEFAULT_FALSE_POSITIVE_RATE
+) -> BloomFilter:
+    """
+    Rebuilds the filter of the normalized import names, unless the stored one
+    already covers every name at the same target false positive rate, and logs its
+    size and false positive rate.
+
+    Args:
+        bind (Union[Connection, Session]): The SQLAlchemy session or connection.
+        fp_rate (float, optional): The target false positive rate. Defaults to
+            DEFAULT_FALSE_POSITIVE_RATE.
+
+    Returns:
+        BloomFilter: The filter.
+    """
+    max_id = _max_import_id(bind)
+    row = bind.execute(
+        select(Filters.max_id, Filters.data).where(Filters.name == IMPORT_FILTER)
+    ).first()
+    bloom = None if row is None else BloomFilter.from_bytes(row.data)
+
+    if bloom is None or row.max_id != max_id or bloom.fp_rate != fp_rate:
+        names = bind.execute(
+            select(ImportNames.normalized_name).where(
+                ImportNames.normalized_name.is_not(None)
+            )
+        ).scalars()
+        bloom = BloomFilter.from_items(names, fp_rate)
+        bind.execute(delete(Filters).where(Filters.name == IMPORT_FILTER))
+        bind.execute(
+            insert(Filters).values(
+                name=IMPORT_FILTER, max_id=max_id, data=bloom.to_bytes()
+            )
+        )
+        # readers only pick the new filter up with a new data version
+        bump_data_version(bind)
+
+    logger.info(
+        f"Import name filter: {bloom.num_items} names in "
+        f"{len(bloom.bits) / 1024:.1f} KiB, {bloom.num_hashes} hashes, "
+        f"{bloom.false_positive_rate:.3%} false positive rate "
+        f"(target {bloom.fp_rate:.3%})."
+    )
+    return bloom
@@ -0,0 +1,275 @@
+import os
+import sys
+from array import array
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List
+
+from sqlalchemy import DateTime, Integer, LargeBinary, String, Table, select
+from sqlalchemy.engine import Connection, Engine
+
+from cfdb.index import HEADER, MAGIC, MAPS, string_hash
+from cfdb.log import logger
+from cfdb.models import migrations
+from cfdb.models.schema import (
+    Artifacts,
+    FeedstockOutputs,
+    Feedstocks,
+    ImportNames,
+    ImportToPackageMaps,
+    Packages,
+    normalize_name,
+)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - optional dependency
+    pyarrow = None
+
+EXPORT_QUERIES = {
+    "who_provides": select(ImportNames.name, Packages.name)
+    .join_from(
+        ImportToPackageMaps,
+        ImportNames,
+        ImportNames.id == ImportToPackageMaps.import_id,
+    )
+    .join(Packages, Packages.id == ImportToPackageMaps.package_id),
+    "feedstock_of": select(Packages.name, Feedstocks.name)
+    .join_from(FeedstockOutputs, Packages, Packages.id == FeedstockOutputs.package_id)
+    .join(Feedstocks, Feedstocks.id == FeedstockOutputs.feedstock_id),
+}
+
+
+# Tables exported by `export_tables`
+EXPORT_TABLES = (
+    Feedstocks.__table__,
+    Packages.__table__,
+    FeedstockOutputs.__table__,
+    ImportToPackageMaps.__table__,
+    Artifacts.__table__,
+)
+
+EXPORT_FORMATS = ("parquet",)
+
+# Number of rows fetched, converted to an Arrow batch and written as a Parquet
+# row group at once
+ROW_GROUP_SIZE = 65536
+
+
+def _uint32s(values: Iterable[int]) -> bytes:
+    data = array("I", values)
+    if data.itemsize != 4:  # pragma: no cover - exotic platforms
+        raise RuntimeError("The lookup index requires 4-byte unsigned integers.")
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 8)
+
+
+def export_index(engine: Engine, path: Path) -> int:
+    """
+    Compiles the import -> packages and package -> feedstocks mappings into an
+    immutable lookup index, read with `cfdb.index.LookupIndex`. The file is
+    replaced atomically, so that processes mapping the previous index keep a
+    consistent view.
+
+    Args:
+        engine (Engine): SQLAlchemy Engine object.
+        path (Path): The path of the index file.
+
+    Returns:
+        int: The data version of the exported database.
+    """
+    mappings: Dict[str, Dict[str, List[str]]] = {}
+    normalized_mappings: Dict[str, Dict[str, List[str]]] = {}
+    with engine.connect() as connection:
+        data_version = migrations.get_data_version(connection)
+        for name in MAPS:
+            mapping = defaultdict(list)
+            normalized_mapping = defaultdict(set)
+            for key, value in connection.execute(EXPORT_QUERIES[name]):
+                mapping[key].append(value)
+                normalized_mapping[normalize_name(key)].add(value)
+            mappings[name] = {key: sorted(values) for key, values in mapping.items()}
+            normalized_mappings[name] = {
+                key: sorted(values) for key, values in normalized_mapping.items()
+            }
+
+    all_mappings = [*mappings.values(), *normalized_mappings.values()]
+    strings = sorted(
+        {key for mapping in all_mappings for key in mapping}
+        | {
+            value
+            for mapping in all_mappings
+            for values in mapping.values()
+            for value in values
+        }
+    )
+    string_ids = {value: idx for idx, value in enumerate(strings)}
+
+    encoded = [value.encode() for value in strings]
+    string_offsets = [0]
+    for value in encoded:
+        string_offsets.append(string_offsets[-1] + len(value))
+
+    # power of two, at most half full
+    num_slots = 1 << max(1, (2 * len(strings)).bit_length())
+    slots = [0] * num_slots
+    for string_id, value in enumerate(encoded):
+        slot = string_hash(value) & (num_slots - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (num_slots - 1)
+        slots[slot] = string_id + 1
+
+    sections = [_uint32s(string_offsets), b"".join(encoded), _uint32s(slots)]
+    for name in MAPS:
+        for mapping in (mappings[name], normalized_mappings[name]):
+            offsets = [0]
+            values = []
+            for key in strings:
+                values.extend(string_ids[value] for value in mapping.get(key, ()))
+                offsets.append(len(values))
+            sections.append(_uint32s(offsets))
+            sections.append(_uint32s(values))
+
+    positions = []
+    position = HEADER.size + (-HEADER.size % 8)
+    for section in sections:
+        positions.append(position)
+        position += len(_pad(section))
+
+    header = [MAGIC, data_version, len(strings), num_slots] + positions
+
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_pad(HEADER.pack(*header)))
+        for section in sections:
+            f.write(_pad(section))
+    os.replace(tmp_path, path)
+
+    logger.info(
+        f"Exported {len(mappings['who_provides'])} import names and "
+        f"{len(mappings['feedstock_of'])} packages to {path}."
+    )
+    return data_version
+
+
+def arrow_schema(table: Table) -> "pyarrow.Schema":
+    """
+    Returns the Arrow schema of the rows of a table.
+    """
+    fields = []
+    for column in table.columns:
+        if isinstance(column.type, Integer):
+            arrow_type = pyarrow.int64()
+        elif isinstance(column.type, String):
+            arrow_type = pyarrow.string()
+        elif isinstance(column.type, LargeBinary):
+            arrow_type = pyarrow.binary()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pyarrow.timestamp("us")
+        else:
+            raise TypeError(f"No Arrow type for the column {column}.")
+        fields.append(pyarrow.field(column.name, arrow_type, column.nullable))
+    return pyarrow.schema(fields)
+
+
+def iter_arrow_batches(
+    connection: Connection, table: Table, batch_size: int = ROW_GROUP_SIZE
+) -> Iterator["pyarrow.RecordBatch"]:
+    """
+    Streams the rows of a table as Arrow record batches, fetched `batch_size` at a
+    time through a server-side cursor, so that memory stays bounded whatever the
+    size of the table.
+
+    Args:
+        connection (Connection): The SQLAlchemy connection object.
+        table (Table): The table.
+        batch_size (int, optional): Number of rows per batch. Defaults to 65536.
+
+    Yields:
+        pyarrow.RecordBatch: The batches, in primary key order.
+    """
+    schema = arrow_schema(table)
+    result = connection.execute(
+        select(table)
+        .order_by(*table.primary_key.columns)
+        .execution_options(yield_per=batch_size)
+    )
+    for rows in result.partitions():
+        yield pyarrow.RecordBatch.from_arrays(
+            [
+                pyarrow.array(values, type=field.type)
+                for values, field in zip(zip(*rows), schema)
+            ],
+            schema=schema,
+        )
+
+
+def _write_parquet(connection, table, path: Path, row_group_size: int) -> int:
+    schema = arrow_schema(table).with_metadata(
+        {"cfdb_data_version": str(migrations.get_data_version(connection))}
+    )
+    # names repeat across rows, hashes and ids do not
+    dictionary_columns = [
+        column.name for column in table.columns if isinstance(column.type, String)
+    ]
+
+    num_rows = 0
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with pyarrow.parquet.ParquetWriter(
+        tmp_path, schema, use_dictionary=dictionary_columns
+    ) as writer:
+        for batch in iter_arrow_batches(connection, table, row_group_size):
+            writer.write_batch(batch.replace_schema_metadata(schema.metadata))
+            num_rows += batch.num_rows
+    os.replace(tmp_path, path)
+    return num_rows
+
+
+def export_tables(
+    engine: Engine,
+    output_dir: Path,
+    file_format: str = "parquet",
+    row_group_size: int = ROW_GROUP_SIZE,
+) -> Dict[str, int]:
+    """
+    Exports the `EXPORT_TABLES` to one file per table, named after the table,
+    e.g. packages.parquet. Rows are streamed in row group sized Arrow batches, and
+    the string columns are dictionary encoded. Each file is replaced atomically.
+
+    Args:
+        engine (Engine): SQLAlchemy Engine object.
+        output_dir (Path): The directory of the exported files, created if needed.
+        file_format (str, optional): The file format, one of `EXPORT_FORMATS`.
+            Defaults to "parquet".
+        row_group_size (int, optional): Number of rows per row group. Defaults to
+            65536.
+
+    Returns:
+        Dict[str, int]: The number of rows exported from each table.
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(
+            f"Unknown format {file_format}, expected one of {EXPORT_FORMATS}."
+        )
+    if pyarrow is None:
+        raise RuntimeError(
+            "Exporting tables requires the pyarrow package, install it with "
+            "`pip install pyarrow`."
+        )
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    num_rows = {}
+    with engine.connect() as connection:
+        for table in EXPORT_TABLES:
+            path = output_dir / f"{table.name}.{file_format}"
+            num_rows[table.name] = _write_parquet(
+                connection, table, path, row_group_size
+            )
+            logger.info(f"Exported {num_rows[table.name]} rows to {path}.")
+    return num_rows
@@ -0,0 +1,190 @@
+"""
+Reader of the static lookup index written by ``cfdb export-index``.
+
+This module only depends on the standard library, and must stay that way: it is
+meant for short-lived processes (CLI plugins, pre-commit hooks) that cannot afford
+importing SQLAlchemy or opening the database.
+
+Layout of the file (little-endian, every section aligned on 8 bytes)::
+
+    header   MAGIC, data version, number of strings, number of hash slots, then
+             the position of each section below
+    strings  de-duplicated UTF-8 strings: uint32 offsets (n + 1) and the
+             concatenated bytes
+    slots    open addressing hash table of the strings: uint32 string id + 1 (0
+             for empty slots) at ``crc32(string) & (slots - 1)``, linearly probed
+    maps     for each of import -> packages and package -> feedstocks, keyed by
+             the stored names then by their normalized form: uint32 offsets
+             (n + 1) indexed by the string id of the key, and the uint32 string
+             ids of the values
+
+A lookup hashes the key once, probes a slot or two, and slices the values. Like
+``cfdb.reader.CFDBReader``, names that are not stored as given fall back to their
+normalized form, e.g. "Scikit_Learn".
+"""
+
+import mmap
+import re
+import struct
+import sys
+import zlib
+from typing import Tuple
+
+MAGIC = b"CFDBIDX2"
+MAPS = ("who_provides", "feedstock_of")
+# magic, data version, number of strings, number of hash slots, string offsets,
+# string bytes and hash slots positions, then the offsets and values positions of
+# each map, keyed by the stored names then by the normalized names
+HEADER = struct.Struct("<8sQQQQQQ" + "QQ" * 2 * len(MAPS))
+
+_SEPARATORS = re.compile(r"[-_.]+")
+
+
+def normalize_name(name: str) -> str:
+    """
+    Returns the PEP 503 normalized form of a name, as
+    `cfdb.models.schema.normalize_name` which cannot be imported without
+    SQLAlchemy.
+    """
+    return _SEPARATORS.sub("-", name).lower()
+
+
+def string_hash(value: bytes) -> int:
+    """
+    Hash of the strings in the slots table, stable across processes and platforms.
+    """
+    return zlib.crc32(value)
+
+
+class LookupIndex:
+    """
+    Memory-mapped, read-only view of a static lookup index. Pages are loaded on
+    demand and shared by every process mapping the same file.
+
+    Args:
+        path (str): The path to the index file.
+
+    Attributes:
+        data_version (int): The data version of the database the index was
+            exported from.
+
+    Methods:
+        who_provides: Returns the packages providing an import name.
+        feedstock_of: Returns the feedstocks building a package.
+    """
+
+    def __init__(self, path):
+        if sys.byteorder != "little":  # pragma: no cover - arrays are mapped as is
+            raise NotImplementedError("Lookup indexes require a little-endian host.")
+
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        header = HEADER.unpack_from(self._buffer)
+        if header[0] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a cfdb lookup index.")
+
+        (
+            _,
+            self.data_version,
+            num_strings,
+            num_slots,
+            offsets_pos,
+            data_pos,
+            slots_pos,
+        ) = header[:7]
+        self._string_offsets = self._uint32s(offsets_pos, num_strings + 1)
+        self._string_data = self._buffer[
+            data_pos : data_pos + self._string_offsets[num_strings]
+        ]
+        self._slots = self._uint32s(slots_pos, num_slots)
+        self._mask = num_slots - 1
+
+        self._maps = {}
+        positions = iter(header[7:])
+        for name in MAPS:
+            for normalized in (False, True):
+                offsets = self._uint32s(next(positions), num_strings + 1)
+                self._maps[name, normalized] = (
+                    offsets,
+                    self._uint32s(next(positions), offsets[num_strings]),
+                )
+
+    def _uint32s(self, position: int, count: int) -> memoryview:
+        return self._buffer[position : position + 4 * count].cast("I")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Unmaps the index file.
+        """
+        self._maps = {}
+        self._string_offsets = self._string_data = self._slots = None
+        self._buffer.release()
+        self._mmap.close()
+
+    def _string(self, string_id: int) -> bytes:
+        offsets = self._string_offsets
+        return self._string_data[offsets[string_id] : offsets[string_id + 1]]
+
+    def _string_id(self, value: str) -> int:
+        encoded = value.encode()
+        slots, mask = self._slots, self._mask
+        slot = string_hash(encoded) & mask
+        while slots[slot]:
+            string_id = slots[slot] - 1
+            if self._string(string_id) == encoded:
+                return string_id
+            slot = (slot + 1) & mask
+        return -1
+
+    def _values(self, name: str, normalized: bool, key: str) -> Tuple[str, ...]:
+        string_id = self._string_id(key)
+        if string_id < 0:
+            return ()
+
+        offsets, values = self._maps[name, normalized]
+        return tuple(
+            bytes(self._string(value_id)).decode()
+            for value_id in values[offsets[string_id] : offsets[string_id + 1]]
+        )
+
+    def _lookup(self, name: str, key: str) -> Tuple[str, ...]:
+        """
+        Returns the values of `key` when it is stored as given, and otherwise the
+        values of every name sharing its normalized form.
+        """
+        return self._values(name, False, key) or self._values(
+            name, True, normalize_name(key)
+        )
+
+    def who_provides(self, import_name: str) -> Tuple[str, ...]:
+        """
+        Returns the packages providing an import name.
+
+        Args:
+            import_name (str): The import name, e.g. "numpy.linalg".
+
+        Returns:
+            Tuple[str, ...]: The names of the packages, sorted.
+        """
+        return self._lookup("who_provides", import_name)
+
+    def feedstock_of(self, package_name: str) -> Tuple[str, ...]:
+        """
+        Returns the feedstocks building a package.
+
+        Args:
+            package_name (str): The package name, e.g. "numpy-base".
+
+        Returns:
+            Tuple[str, ...]: The names of the feedstocks, sorted.
+        """
+        return self._lookup("feedstock_of", package_name)
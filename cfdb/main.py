@@ -3,10 +3,24 @@ from typer.core import TyperGroup
 from click import Context
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from cfdb.models.schema import Base
-from cfdb.populate import artifacts, feedstock_outputs, import_to_package_maps
+from cfdb import analyze, bloom, export, server
+from cfdb.models import migrations
+from cfdb.populate import (
+    artifacts,
+    changelog,
+    feedstock_outputs,
+    import_to_package_maps,
+    shards,
+)
+from cfdb.populate.cache import ParseCache
+from cfdb.reader import CFDBReader
+from cfdb.scan import scan_imports
 from cfdb.log import logger
+from datetime import datetime
 from pathlib import Path
+from typing import List
+
+DEFAULT_DB_URL = "sqlite:///cf-database.db"
 
 
 class CFDBHandler:
@@ -14,23 +28,33 @@ class CFDBHandler:
     CFDBHandler class handles the database operations for CFDB.
 
     Args:
-        db_url (str): The URL of the database.
+        db_url (str): The URL of the database. Any SQLAlchemy URL is accepted, PostgreSQL
+            URLs get their rows bulk loaded with ``COPY FROM STDIN``.
+        parse_cache (str, optional): File persisting the parsed JSON blobs between
+            runs, keyed by their hash. Defaults to None, meaning an in-memory cache.
 
     Attributes:
         db_url (str): The URL of the database.
         engine (Engine): SQLAlchemy Engine object.
         Session (sessionmaker): SQLAlchemy sessionmaker object.
+        parse_cache (ParseCache): Cache of the parsed JSON blobs, shared by the updaters.
 
     Methods:
         update_feedstock_outputs: Update the feedstock outputs in the database.
         update_artifacts: Update the artifacts in the database.
+        update_import_to_package_maps: Update the import to package maps in the database.
+
+    The schema of an existing database is migrated in place to the current version
+    when the handler is created.
     """
 
-    def __init__(self, db_url):
+    def __init__(self, db_url=DEFAULT_DB_URL, parse_cache=None):
         self.db_url = db_url
         self.engine = create_engine(db_url)
-        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            migrations.upgrade(connection)
         self.Session = sessionmaker(bind=self.engine)
+        self.parse_cache = ParseCache(path=Path(parse_cache) if parse_cache else None)
 
     def update_feedstock_outputs(self, path):
         """
@@ -40,27 +64,89 @@ class CFDBHandler:
             path (str): Path to the feedstock outputs directory.
         """
         session = self.Session()
-        feedstock_outputs.update(session, path=Path(path))
+        feedstock_outputs.update(session, path=Path(path), cache=self.parse_cache)
         session.commit()
 
-    def update_artifacts(self):
+    def update_artifacts(self, path):
         """
-        Update the artifacts in the database.
+        Update the artifacts and their file listings in the database.
+
+        Args:
+            path (str): Path to the artifacts directory.
         """
         session = self.Session()
-        artifacts.update(session)
+        artifacts.update(session, path=Path(path))
         session.commit()
 
-    def update_import_to_package_maps(self, path):
+    def update_import_to_package_maps(
+        self, path, filter_fp_rate=bloom.DEFAULT_FALSE_POSITIVE_RATE
+    ):
         """
-        Update the import to package maps in the database.
+        Update the import to package maps in the database, then the Bloom filter of
+        the import names.
 
         Args:
             path (str): Path to the import to package maps directory.
+            filter_fp_rate (float, optional): Target false positive rate of the
+                import name filter. Defaults to 0.01.
+        """
+        session = self.Session()
+        import_to_package_maps.update(session, path=Path(path), cache=self.parse_cache)
+        bloom.update_import_filter(session, filter_fp_rate)
+        session.commit()
+
+    def rebuild(
+        self,
+        feedstock_outputs_path=None,
+        import_to_package_maps_path=None,
+        jobs=None,
+        filter_fp_rate=bloom.DEFAULT_FALSE_POSITIVE_RATE,
+    ):
+        """
+        Load whole source trees with one worker process per shard, each writing to
+        its own SQLite file, and merge the shards into the database (SQLite only).
+
+        Args:
+            feedstock_outputs_path (str, optional): Path to the feedstock outputs directory.
+            import_to_package_maps_path (str, optional): Path to the import to package maps directory.
+            jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+            filter_fp_rate (float, optional): Target false positive rate of the
+                import name filter. Defaults to 0.01.
+        """
+        if feedstock_outputs_path:
+            shards.build(
+                self.engine, "feedstock_outputs", Path(feedstock_outputs_path), jobs
+            )
+        if import_to_package_maps_path:
+            shards.build(
+                self.engine,
+                "import_to_package_maps",
+                Path(import_to_package_maps_path),
+                jobs,
+            )
+            with self.engine.begin() as connection:
+                bloom.update_import_filter(connection, filter_fp_rate)
+
+    def apply_changes(
+        self, changeset, filter_fp_rate=bloom.DEFAULT_FALSE_POSITIVE_RATE
+    ):
+        """
+        Replay a changeset exported from another copy of the database, then update
+        the Bloom filter of the import names.
+
+        Args:
+            changeset (dict): The changeset, see cfdb.populate.changelog.
+            filter_fp_rate (float, optional): Target false positive rate of the
+                import name filter. Defaults to 0.01.
+
+        Returns:
+            int: The number of changes applied.
         """
         session = self.Session()
-        import_to_package_maps.update(session, path=Path(path))
+        num_changes = changelog.apply_changes(session, changeset)
+        bloom.update_import_filter(session, filter_fp_rate)
         session.commit()
+        return num_changes
 
 
 class OrderCommands(TyperGroup):
@@ -78,12 +164,49 @@ app = typer.Typer(
     context_settings={"help_option_names": ["-h", "--help"]},
 )
 
+DB_URL_OPTION = typer.Option(
+    DEFAULT_DB_URL,
+    "--db-url",
+    envvar="CFDB_DATABASE_URL",
+    help="SQLAlchemy URL of the database.",
+)
+
+
+def _check_fp_rate(value: float) -> float:
+    if not 0 < value < 1:
+        raise typer.BadParameter("must be between 0 and 1 (exclusive).")
+    return value
+
+
+FILTER_FP_RATE_OPTION = typer.Option(
+    bloom.DEFAULT_FALSE_POSITIVE_RATE,
+    "--filter-fp-rate",
+    callback=_check_fp_rate,
+    help="Target false positive rate of the Bloom filter of the import names.",
+)
+
+AS_OF_OPTION = typer.Option(
+    None,
+    "--as-of",
+    formats=["%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S"],
+    help="Answer as of this UTC date or time, from the history of the database.",
+)
+
+PARSE_CACHE_OPTION = typer.Option(
+    None,
+    "--parse-cache",
+    envvar="CFDB_PARSE_CACHE",
+    help="File persisting the parsed JSON blobs between runs, keyed by their hash.",
+)
+
 
 @app.command()
 def update_feedstock_outputs(
     path: str = typer.Option(
         ..., "--path", "-p", help="Path to the feedstock outputs directory."
-    )
+    ),
+    db_url: str = DB_URL_OPTION,
+    parse_cache: str = PARSE_CACHE_OPTION,
 ):
     """
     Update the feedstock outputs in the database based on the local path to the feedstock outputs cloned from Conda Forge. Path to the feedstock outputs directory. The path should point to the 'outputs' folder inside the 'feedstock-outputs' root directory.
@@ -93,7 +216,7 @@ def update_feedstock_outputs(
         To update the feedstock outputs, use the following command:
         $ cfdb update_feedstock_outputs --path /path/to/feedstock-outputs/outputs
     """
-    db_handler = CFDBHandler("sqlite:///cf-database.db")
+    db_handler = CFDBHandler(db_url, parse_cache=parse_cache)
     db_handler.update_feedstock_outputs(path)
 
 
@@ -101,29 +224,535 @@ def update_feedstock_outputs(
 def update_import_to_package_maps(
     path: str = typer.Option(
         ..., "--path", "-p", help="Path to the import to package maps directory."
-    )
+    ),
+    db_url: str = DB_URL_OPTION,
+    parse_cache: str = PARSE_CACHE_OPTION,
+    filter_fp_rate: float = FILTER_FP_RATE_OPTION,
 ):
     """
     Update the import to package maps in the database based on the local path to the
     import to package maps cloned from conda-forge. Path to the import to package
     maps directory. The path should point to the 'import_to_package_maps' folder
-    inside the 'libcfgraph' root directory or any viable alternative.
+    inside the 'libcfgraph' root directory or any viable alternative. The Bloom
+    filter of the import names, which lets lookups reject unknown imports without
+    querying the database, is rebuilt at the end, and its false positive rate logged.
 
     Example:
         To update the import to package maps, use the following command:
         $ cfdb update_import_to_package_maps --path /path/to/libcfgraph/import_to_package_maps
     """
-    db_handler = CFDBHandler("sqlite:///cf-database.db")
-    db_handler.update_import_to_package_maps(path)
+    db_handler = CFDBHandler(db_url, parse_cache=parse_cache)
+    db_handler.update_import_to_package_maps(path, filter_fp_rate)
+
+
+@app.command()
+def update_artifacts(
+    path: str = typer.Option(
+        ..., "--path", "-p", help="Path to the artifacts directory."
+    ),
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    Update the artifacts and the files they install in the database based on the
+    local path to the artifacts cloned from conda-forge. The path should point to
+    the 'artifacts' folder inside the 'libcfgraph' root directory, holding one JSON
+    blob per artifact. Only the blobs that changed since the last update are read,
+    and the directories shared by the file paths are stored once.
+
+    Example:
+        To update the artifacts, use the following command:
+        $ cfdb update_artifacts --path /path/to/libcfgraph/artifacts
+    """
+    db_handler = CFDBHandler(db_url)
+    db_handler.update_artifacts(path)
+
+
+@app.command()
+def rebuild(
+    feedstock_outputs_path: str = typer.Option(
+        None, "--feedstock-outputs", help="Path to the feedstock outputs directory."
+    ),
+    import_to_package_maps_path: str = typer.Option(
+        None,
+        "--import-to-package-maps",
+        help="Path to the import to package maps directory.",
+    ),
+    jobs: int = typer.Option(
+        None, "--jobs", "-j", help="Number of worker processes [default: CPU count]."
+    ),
+    db_url: str = DB_URL_OPTION,
+    filter_fp_rate: float = FILTER_FP_RATE_OPTION,
+):
+    """
+    Rebuild the database from whole source trees using every core. Each worker
+    process loads a shard of the tree into its own SQLite file, and the shards are
+    then merged into the database. Only SQLite databases are supported.
+
+    Example:
+        $ cfdb rebuild --feedstock-outputs /path/to/feedstock-outputs/outputs --import-to-package-maps /path/to/libcfgraph/import_to_pkg_maps -j 8
+    """
+    db_handler = CFDBHandler(db_url)
+    db_handler.rebuild(
+        feedstock_outputs_path, import_to_package_maps_path, jobs, filter_fp_rate
+    )
+
+
+@app.command()
+def migrate(
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    Migrate the database in place to the current schema version, and reclaim the
+    space freed by the migration (SQLite only).
+    """
+    db_handler = CFDBHandler(db_url)
+    migrations.vacuum(db_handler.engine)
+
+
+@app.command()
+def who_provides(
+    import_name: str = typer.Argument(..., help="Import name, e.g. 'numpy.linalg'."),
+    db_url: str = DB_URL_OPTION,
+    cache_dir: str = typer.Option(
+        None,
+        "--cache-dir",
+        envvar="CFDB_CACHE_DIR",
+        help="Directory caching the import trie between runs.",
+    ),
+    as_of: datetime = AS_OF_OPTION,
+):
+    """
+    List the packages providing an import name. Submodules that are not mapped
+    themselves resolve to their longest mapped parent module.
+
+    Example:
+        $ cfdb who-provides numpy.linalg
+        $ cfdb who-provides numpy.linalg --as-of 2024-01-31
+    """
+    with CFDBReader(db_url, cache_dir=cache_dir) as reader:
+        packages = reader.who_provides(import_name, as_of=as_of)
+        if not packages and "." in import_name and as_of is None:
+            matched, packages = reader.match_import(import_name)
+            if matched:
+                typer.echo(f"Longest match: '{matched}'.", err=True)
+
+    if not packages:
+        typer.echo(f"No package provides '{import_name}'.", err=True)
+        raise typer.Exit(code=1)
+
+    for package in packages:
+        typer.echo(package)
+
+
+@app.command()
+def feedstock_of(
+    package_name: str = typer.Argument(..., help="Package name, e.g. 'numpy-base'."),
+    db_url: str = DB_URL_OPTION,
+    as_of: datetime = AS_OF_OPTION,
+):
+    """
+    List the feedstocks building a package.
+
+    Example:
+        $ cfdb feedstock-of numpy-base
+        $ cfdb feedstock-of numpy-base --as-of 2024-01-31
+    """
+    with CFDBReader(db_url) as reader:
+        feedstocks = reader.feedstock_of(package_name, as_of=as_of)
+
+    if not feedstocks:
+        typer.echo(f"No feedstock builds '{package_name}'.", err=True)
+        raise typer.Exit(code=1)
+
+    for feedstock in feedstocks:
+        typer.echo(feedstock)
+
+
+@app.command()
+def feedstocks_for(
+    import_name: str = typer.Argument(..., help="Import name, e.g. 'numpy.linalg'."),
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    List the feedstocks to depend on for an import name, i.e. the feedstocks
+    building the packages providing it, with their package and import counts.
+
+    Example:
+        $ cfdb feedstocks-for numpy.linalg
+    """
+    with CFDBReader(db_url) as reader:
+        feedstocks = reader.feedstocks_for_import(import_name)
+        stats = [reader.feedstock_stats(feedstock) for feedstock in feedstocks]
+
+    if not feedstocks:
+        typer.echo(f"No feedstock provides '{import_name}'.", err=True)
+        raise typer.Exit(code=1)
+
+    for feedstock, (num_packages, num_imports) in zip(feedstocks, stats):
+        typer.echo(f"{feedstock} ({num_packages} packages, {num_imports} imports)")
+
+
+@app.command()
+def resolve_imports(
+    path: str = typer.Argument(..., help="Root directory of the Python project."),
+    jobs: int = typer.Option(
+        None, "--jobs", "-j", help="Number of worker processes [default: CPU count]."
+    ),
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    Suggest the conda-forge packages and feedstocks providing the third party
+    imports of a whole Python project. Files are parsed in a pool of worker
+    processes, and the de-duplicated imports are resolved with set-based joins.
+
+    Example:
+        $ cfdb resolve-imports /path/to/project -j 8
+    """
+    imports = scan_imports(Path(path), jobs)
+    with CFDBReader(db_url) as reader:
+        resolved = reader.resolve_imports(imports)
+
+    packages, feedstocks = set(), set()
+    for import_name in sorted(resolved):
+        providers = []
+        for package_name, package_feedstocks in resolved[import_name].items():
+            providers.append(f"{package_name} ({', '.join(package_feedstocks)})")
+            packages.add(package_name)
+            feedstocks.update(package_feedstocks)
+        typer.echo(f"{import_name}: {', '.join(providers)}")
+
+    unresolved = sorted(imports - resolved.keys())
+    if unresolved:
+        typer.echo(f"Unresolved imports: {' '.join(unresolved)}")
+    typer.echo(f"Suggested packages: {' '.join(sorted(packages))}")
+    typer.echo(f"Suggested feedstocks: {' '.join(sorted(feedstocks))}")
+
+
+@app.command()
+def who_ships(
+    paths: List[str] = typer.Argument(
+        None,
+        help="File paths relative to the installation prefix, or basenames, e.g. "
+        "'libssl.so.3'.",
+    ),
+    from_file: typer.FileText = typer.Option(
+        None,
+        "--from-file",
+        "-f",
+        help="File listing one path or basename per line, '-' for stdin.",
+    ),
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    List the artifacts shipping files, with their platform, package and feedstocks,
+    one tab-separated line per file and artifact. Paths are matched through the
+    hash of their full path, and basenames through the indexed file names, so a
+    whole environment can be looked up in a few queries.
+
+    Example:
+        $ cfdb who-ships lib/python3.11/site-packages/numpy/__init__.py libssl.so.3
+        $ find $CONDA_PREFIX -type f -printf '%P\\n' | cfdb who-ships -f -
+    """
+    paths = list(paths or [])
+    if from_file is not None:
+        paths.extend(line.strip() for line in from_file if line.strip())
+    if not paths:
+        raise typer.BadParameter("No path given.", param_hint="'PATHS'")
+
+    with CFDBReader(db_url) as reader:
+        shipped = reader.who_ships(paths)
+
+    for path in sorted(shipped):
+        for name, platform, package, feedstocks in shipped[path]:
+            typer.echo(f"{path}\t{name}\t{platform}\t{package}\t{','.join(feedstocks)}")
+
+    missing = sorted({path.strip("/") for path in paths} - shipped.keys())
+    if missing:
+        typer.echo(f"No artifact ships: {' '.join(missing)}", err=True)
+    if not shipped:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def search(
+    query: str = typer.Argument(..., help="Name to look for, e.g. 'scikit_learn'."),
+    kinds: List[str] = typer.Option(
+        None,
+        "--kind",
+        "-k",
+        help="Kind of names to search: package, feedstock or import [default: all].",
+    ),
+    limit: int = typer.Option(10, "--limit", "-n", help="Maximum number of results."),
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    Search the feedstock, package and import names closest to a possibly
+    misspelled query, ranked by trigram similarity.
+
+    Example:
+        $ cfdb search scikit_learn --kind package
+    """
+    with CFDBReader(db_url) as reader:
+        try:
+            results = reader.search(query, kinds=kinds or None, limit=limit)
+        except ValueError as e:
+            raise typer.BadParameter(str(e), param_hint="'--kind'")
+
+    if not results:
+        typer.echo(f"Nothing matches '{query}'.", err=True)
+        raise typer.Exit(code=1)
+
+    for kind, name, score in results:
+        typer.echo(f"{kind}: {name} ({score:.2f})")
+
+
+@app.command()
+def export_index(
+    output: str = typer.Option(
+        "cf-database.idx", "--output", "-o", help="Path of the index file."
+    ),
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    Compile the import to package and package to feedstock mappings into a static,
+    memory-mapped lookup index. The index is read with `cfdb.index.LookupIndex`,
+    which imports neither SQLAlchemy nor the database drivers.
+
+    Example:
+        $ cfdb export-index -o cf-database.idx
+    """
+    with CFDBReader(db_url) as reader:
+        export.export_index(reader.engine, Path(output))
+
+
+@app.command("export")
+def export_data(
+    file_format: str = typer.Option(
+        "parquet", "--format", "-f", help="File format of the exported tables."
+    ),
+    output_dir: Path = typer.Option(
+        Path("cf-export"), "--output-dir", "-o", help="Directory of the exported files."
+    ),
+    row_group_size: int = typer.Option(
+        export.ROW_GROUP_SIZE,
+        "--row-group-size",
+        min=1,
+        help="Number of rows streamed and written at once.",
+    ),
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    Export the feedstocks, packages, feedstock outputs, import to package maps and
+    artifacts tables, one file per table. Rows are streamed from a server-side
+    cursor in row group sized batches, so memory stays bounded whatever the size
+    of the tables.
+
+    Example:
+        $ cfdb export --format parquet -o cf-export
+    """
+    with CFDBReader(db_url) as reader:
+        try:
+            export.export_tables(
+                reader.engine,
+                output_dir,
+                file_format=file_format,
+                row_group_size=row_group_size,
+            )
+        except ValueError as e:
+            raise typer.BadParameter(str(e), param_hint="'--format'")
+        except RuntimeError as e:
+            typer.echo(str(e), err=True)
+            raise typer.Exit(code=1)
+
+
+@app.command()
+def changes(
+    since: int = typer.Option(
+        0, "--since", min=0, help="Sequence number of the last change already synced."
+    ),
+    output: str = typer.Option(
+        "cf-changes.json.gz",
+        "--output",
+        "-o",
+        help="Path of the changeset, gzip compressed if it ends with .gz.",
+    ),
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    Export the feedstock outputs, import to package maps and artifacts written or
+    deleted after change SINCE as a changeset, to sync a copy of the database with
+    `cfdb apply-changes` instead of downloading it again.
+
+    Example:
+        $ cfdb changes --since 1200 -o cf-changes.json.gz
+    """
+    with CFDBReader(db_url) as reader, reader.engine.connect() as connection:
+        try:
+            changeset = changelog.export_changes(connection, since)
+        except ValueError as e:
+            raise typer.BadParameter(str(e), param_hint="'--since'")
+
+    changelog.write_changeset(changeset, Path(output))
+    typer.echo(
+        f"{len(changeset['changes'])} changes from {changeset['since']} "
+        f"to {changeset['until']} written to {output}",
+        err=True,
+    )
+
+
+@app.command()
+def apply_changes(
+    changeset: Path = typer.Argument(
+        ..., exists=True, dir_okay=False, help="Changeset exported by `cfdb changes`."
+    ),
+    filter_fp_rate: float = FILTER_FP_RATE_OPTION,
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    Apply a changeset exported by `cfdb changes` from a newer copy of the database.
+    Changes the database already has are skipped, and a changeset starting after
+    its last change is rejected.
+
+    Example:
+        $ cfdb apply-changes cf-changes.json.gz
+    """
+    db_handler = CFDBHandler(db_url)
+    try:
+        num_changes = db_handler.apply_changes(
+            changelog.read_changeset(changeset), filter_fp_rate
+        )
+    except ValueError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(code=1)
+    typer.echo(f"{num_changes} changes applied", err=True)
 
 
 @app.command()
-def update_artifacts():
+def serve(
+    host: str = typer.Option("127.0.0.1", "--host", help="Host to listen on."),
+    port: int = typer.Option(8000, "--port", "-p", help="Port to listen on."),
+    cache_size: int = typer.Option(
+        4096, "--cache-size", help="Maximum number of cached responses."
+    ),
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    Serve the import to package and package to feedstock lookups over HTTP, from a
+    pool of read-only connections. Responses carry an ETag derived from the data
+    version of the database, so that clients can revalidate them with
+    If-None-Match.
+
+    Example:
+        $ cfdb serve --port 8000
+        $ curl http://127.0.0.1:8000/who-provides/numpy.linalg
+        $ curl -d '["numpy", "scipy"]' http://127.0.0.1:8000/who-provides
+    """
+    server.serve(db_url, host=host, port=port, cache_size=cache_size)
+
+
+analyze_app = typer.Typer(
+    cls=OrderCommands,
+    help="Run whole-ecosystem aggregates on a DuckDB copy of the database.",
+    no_args_is_help=True,
+)
+app.add_typer(analyze_app, name="analyze")
+
+DUCKDB_PATH_OPTION = typer.Option(
+    None,
+    "--duckdb-path",
+    help="DuckDB copy of the database [default: next to a SQLite database, "
+    "or cf-database.duckdb].",
+)
+
+LIMIT_OPTION = typer.Option(20, "--limit", "-n", min=1, help="Maximum number of rows.")
+
+
+def _print_analysis(name: str, limit: int, duckdb_path: Path, db_url: str):
+    with CFDBReader(db_url) as reader:
+        try:
+            columns, rows = analyze.analyze(
+                reader.engine,
+                name,
+                limit=limit,
+                path=duckdb_path or analyze.default_path(db_url),
+            )
+        except RuntimeError as e:
+            typer.echo(str(e), err=True)
+            raise typer.Exit(code=1)
+
+    typer.echo("\t".join(columns))
+    for row in rows:
+        typer.echo("\t".join(str(value) for value in row))
+
+
+@analyze_app.command("sync")
+def analyze_sync(
+    duckdb_path: Path = DUCKDB_PATH_OPTION,
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    Copy the tables of the database to DuckDB now, instead of on the first
+    analysis after an update.
+
+    Example:
+        $ cfdb analyze sync --duckdb-path cf-database.duckdb
+    """
+    with CFDBReader(db_url) as reader:
+        try:
+            analyze.sync(
+                reader.engine,
+                duckdb_path or analyze.default_path(db_url),
+                force=True,
+            )
+        except RuntimeError as e:
+            typer.echo(str(e), err=True)
+            raise typer.Exit(code=1)
+
+
+@analyze_app.command("top-feedstocks")
+def analyze_top_feedstocks(
+    limit: int = LIMIT_OPTION,
+    duckdb_path: Path = DUCKDB_PATH_OPTION,
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    List the feedstocks producing the most packages.
+
+    Example:
+        $ cfdb analyze top-feedstocks -n 10
+    """
+    _print_analysis("top-feedstocks", limit, duckdb_path, db_url)
+
+
+@analyze_app.command("shared-imports")
+def analyze_shared_imports(
+    limit: int = LIMIT_OPTION,
+    duckdb_path: Path = DUCKDB_PATH_OPTION,
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    List the import names provided by more than one package, most shared first.
+
+    Example:
+        $ cfdb analyze shared-imports -n 50
     """
-    Update the artifacts in the database.
+    _print_analysis("shared-imports", limit, duckdb_path, db_url)
+
+
+@analyze_app.command("partition-sizes")
+def analyze_partition_sizes(
+    limit: int = LIMIT_OPTION,
+    duckdb_path: Path = DUCKDB_PATH_OPTION,
+    db_url: str = DB_URL_OPTION,
+):
+    """
+    Show the distribution of the number of mappings per import map partition, in
+    power of two buckets.
+
+    Example:
+        $ cfdb analyze partition-sizes
     """
-    db_handler = CFDBHandler("sqlite:///cf-database.db")
-    db_handler.update_artifacts()
+    _print_analysis("partition-sizes", limit, duckdb_path, db_url)
 
 
 if __name__ == "__main__":
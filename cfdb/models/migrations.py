@@ -0,0 +1,513 @@
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Union
+
+from sqlalchemy import (
+    DateTime,
+    Integer,
+    String,
+    bindparam,
+    cast,
+    delete,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from cfdb.log import logger
+from cfdb.models.schema import (
+    SCHEMA_VERSION,
+    Artifacts,
+    ArtifactsFilePaths,
+    Base,
+    ChangeLog,
+    FeedstockOutputs,
+    Feedstocks,
+    FeedstockStats,
+    FeedstockOutputsHistory,
+    Filters,
+    ImportFeedstocks,
+    ImportNames,
+    ImportToPackageMaps,
+    ImportToPackageMapsHistory,
+    Metadata,
+    Packages,
+    RelationsMapFilePaths,
+    hash_path,
+    normalize_name,
+)
+from cfdb.search import create_search_index
+
+
+def get_metadata(bind: Union[Connection, Session], key: str) -> Optional[str]:
+    """
+    Returns the value stored under `key` in the metadata table, if any.
+    """
+    return bind.execute(select(Metadata.value).where(Metadata.key == key)).scalar()
+
+
+def set_metadata(bind: Union[Connection, Session], key: str, value) -> None:
+    """
+    Stores `value` under `key` in the metadata table, replacing the previous value.
+    """
+    bind.execute(delete(Metadata).where(Metadata.key == key))
+    bind.execute(insert(Metadata).values(key=key, value=str(value)))
+
+
+def get_data_version(bind: Union[Connection, Session]) -> int:
+    """
+    Returns the data version of the database, bumped by every write of the
+    updaters. Readers use it to invalidate their caches.
+    """
+    return int(get_metadata(bind, "data_version") or 0)
+
+
+def bump_data_version(bind: Union[Connection, Session]) -> None:
+    """
+    Increments the data version of the database, as part of the current transaction.
+    """
+    bind.execute(
+        update(Metadata)
+        .where(Metadata.key == "data_version")
+        .values(value=cast(cast(Metadata.value, Integer) + 1, String))
+    )
+
+
+def get_schema_version(connection: Connection) -> Optional[int]:
+    """
+    Detects the schema version of the database.
+
+    Databases created before the metadata table was introduced are recognized by
+    the string foreign keys of their `feedstock_outputs` table (version 1).
+
+    Args:
+        connection (Connection): The SQLAlchemy connection object.
+
+    Returns:
+        Optional[int]: The schema version, or None for an empty database.
+    """
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+
+    if Metadata.__tablename__ in tables:
+        version = get_metadata(connection, "schema_version")
+        if version is not None:
+            return int(version)
+
+    if "feedstock_outputs" in tables:
+        columns = {c["name"] for c in inspector.get_columns("feedstock_outputs")}
+        if "feedstock_name" in columns:
+            return 1
+
+    return None
+
+
+def _copy_facts(
+    connection: Connection,
+    query: str,
+    table,
+    columns,
+    dimensions,
+    batch_size=10000,
+):
+    """
+    Copies the rows returned by `query` into `table`. The leading name columns are
+    replaced by their surrogate keys from `dimensions` (name to ID mappings), and
+    hexadecimal hashes are converted into their binary digest on the way.
+
+    Resolving the keys in Python keeps the copy a single sequential scan of the
+    legacy table, which has no index to join against.
+    """
+    result = connection.execute(text(query))
+    for rows in result.partitions(batch_size):
+        payload = []
+        for row in rows:
+            names, values = row[: len(dimensions)], row[len(dimensions) :]
+            if any(name is None for name in names):
+                continue
+            keys = [ids[name] for ids, name in zip(dimensions, names)]
+            payload.append(dict(zip(columns, keys + list(values))))
+            if payload[-1]["hash"] is not None:
+                payload[-1]["hash"] = bytes.fromhex(payload[-1]["hash"])
+        if payload:
+            connection.execute(insert(table), payload)
+
+
+def _name_ids(connection: Connection, table) -> Dict[str, int]:
+    return dict(connection.execute(select(table.c.name, table.c.id)).all())
+
+
+def _v1_to_v2(connection: Connection) -> None:
+    """
+    Moves the string keyed tables to integer surrogate keys, binary digests and
+    WITHOUT ROWID fact tables.
+
+    The version 1 tables are snapshotted into temporary tables, dropped and
+    recreated with the new layout. The artifacts tables are recreated empty, as
+    no version of cfdb ever populated them.
+
+    Version 1 partition names were derived from the blob file names in a way that
+    does not match any partition of the import maps updater, so the mappings are
+    copied with an empty partition, which no blob has: the next update re-imports
+    every partition, and deletes the copied mappings it does not list again.
+    """
+    legacy_tables = (
+        "feedstocks",
+        "packages",
+        "feedstock_outputs",
+        "import_to_package_mapping",
+    )
+    for table in legacy_tables:
+        connection.execute(
+            text(f"CREATE TEMPORARY TABLE _v1_{table} AS SELECT * FROM {table}")
+        )
+
+    # dependents first, so that PostgreSQL accepts dropping the referenced tables
+    for table in (
+        "artifacts",
+        "relations_map_file_paths",
+        "artifacts_file_paths",
+        "feedstock_outputs",
+        "import_to_package_mapping",
+        "feedstocks",
+        "packages",
+    ):
+        connection.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+    Base.metadata.create_all(
+        connection,
+        tables=[
+            Feedstocks.__table__,
+            Packages.__table__,
+            ImportNames.__table__,
+            FeedstockOutputs.__table__,
+            ImportToPackageMaps.__table__,
+        ],
+    )
+
+    # dimension tables, inserted in name order so that IDs follow the names
+    connection.execute(
+        text(
+            "INSERT INTO feedstocks (name) "
+            "SELECT name FROM _v1_feedstocks WHERE name IS NOT NULL "
+            "UNION SELECT feedstock_name FROM _v1_feedstock_outputs "
+            "WHERE feedstock_name IS NOT NULL ORDER BY 1"
+        )
+    )
+    connection.execute(
+        text(
+            "INSERT INTO packages (name) "
+            "SELECT name FROM _v1_packages WHERE name IS NOT NULL "
+            "UNION SELECT package_name FROM _v1_feedstock_outputs "
+            "WHERE package_name IS NOT NULL "
+            "UNION SELECT parent_package_name FROM _v1_import_to_package_mapping "
+            "WHERE parent_package_name IS NOT NULL ORDER BY 1"
+        )
+    )
+    connection.execute(
+        text(
+            "INSERT INTO import_names (name) "
+            "SELECT DISTINCT import_name FROM _v1_import_to_package_mapping "
+            "WHERE import_name IS NOT NULL ORDER BY 1"
+        )
+    )
+
+    feedstock_ids = _name_ids(connection, Feedstocks.__table__)
+    package_ids = _name_ids(connection, Packages.__table__)
+    import_ids = _name_ids(connection, ImportNames.__table__)
+
+    _copy_facts(
+        connection,
+        "SELECT feedstock_name, package_name, path, hash FROM _v1_feedstock_outputs",
+        FeedstockOutputs.__table__,
+        ("feedstock_id", "package_id", "path", "hash"),
+        dimensions=(feedstock_ids, package_ids),
+    )
+    _copy_facts(
+        connection,
+        "SELECT import_name, parent_package_name, '', hash "
+        "FROM _v1_import_to_package_mapping",
+        ImportToPackageMaps.__table__,
+        ("import_id", "package_id", "partition", "hash"),
+        dimensions=(import_ids, package_ids),
+    )
+
+    for table in legacy_tables:
+        connection.execute(text(f"DROP TABLE _v1_{table}"))
+
+
+def _v2_to_v3(connection: Connection) -> None:
+    """
+    Adds the trigram search indexes over the feedstock, package and import names,
+    see cfdb.search.
+    """
+    create_search_index(connection)
+
+
+def _v3_to_v4(connection: Connection, batch_size=10000) -> None:
+    """
+    Adds the indexed PEP 503 normalized names of the packages and import names,
+    computed in Python for the rows that do not have one yet.
+    """
+    for table in (Packages.__table__, ImportNames.__table__):
+        columns = {c["name"] for c in inspect(connection).get_columns(table.name)}
+        if "normalized_name" not in columns:
+            connection.execute(
+                text(f"ALTER TABLE {table.name} ADD COLUMN normalized_name VARCHAR")
+            )
+
+        rows = connection.execute(
+            select(table.c.id, table.c.name).where(table.c.normalized_name.is_(None))
+        ).all()
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("_id"))
+            .values(normalized_name=bindparam("_normalized_name"))
+        )
+        for start in range(0, len(rows), batch_size):
+            connection.execute(
+                statement,
+                [
+                    {"_id": row_id, "_normalized_name": normalize_name(name)}
+                    for row_id, name in rows[start : start + batch_size]
+                ],
+            )
+
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _v4_to_v5(connection: Connection) -> None:
+    """
+    Indexes the import to package maps by package and partition, and materializes
+    the import to feedstock lookup and the feedstock summary counts of the existing
+    rows. From then on, they are maintained by the updaters, see
+    cfdb.populate.lookup.
+    """
+    for index in ImportToPackageMaps.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    Base.metadata.create_all(
+        connection, tables=[ImportFeedstocks.__table__, FeedstockStats.__table__]
+    )
+
+    connection.execute(
+        text(
+            "INSERT INTO import_feedstocks (import_id, feedstock_id, num_packages) "
+            "SELECT m.import_id, o.feedstock_id, count(*) "
+            "FROM import_to_package_mapping m "
+            "JOIN feedstock_outputs o ON o.package_id = m.package_id "
+            "GROUP BY m.import_id, o.feedstock_id"
+        )
+    )
+    connection.execute(
+        text(
+            "INSERT INTO feedstock_stats (feedstock_id, num_packages, num_imports) "
+            "SELECT f.id, "
+            "(SELECT count(*) FROM feedstock_outputs o WHERE o.feedstock_id = f.id), "
+            "(SELECT count(*) FROM import_feedstocks l WHERE l.feedstock_id = f.id) "
+            "FROM feedstocks f "
+            "WHERE EXISTS (SELECT 1 FROM feedstock_outputs o WHERE o.feedstock_id = f.id)"
+        )
+    )
+
+
+def _v5_to_v6(connection: Connection) -> None:
+    """
+    Adds the table of the filters over the import names. The filter is built by the
+    next update of the import to package maps, see cfdb.bloom.
+    """
+    Base.metadata.create_all(connection, tables=[Filters.__table__])
+
+
+def _v6_to_v7(connection: Connection) -> None:
+    """
+    Replaces the single column normalized name and partition indexes by the
+    covering indexes of the lookups and of the updaters' diff queries.
+    """
+    for index in (
+        "ix_packages_normalized_name",
+        "ix_import_names_normalized_name",
+        "ix_import_to_package_mapping_partition",
+    ):
+        connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+    for table in (
+        Packages.__table__,
+        ImportNames.__table__,
+        FeedstockOutputs.__table__,
+        ImportToPackageMaps.__table__,
+    ):
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def _v7_to_v8(connection: Connection) -> None:
+    """
+    Adds the history tables of the feedstock outputs and import to package maps,
+    see cfdb.populate.history. The existing rows are opened at the time of the
+    migration, which is where the history of an existing database starts.
+    """
+    Base.metadata.create_all(
+        connection,
+        tables=[
+            FeedstockOutputsHistory.__table__,
+            ImportToPackageMapsHistory.__table__,
+        ],
+    )
+
+    at = bindparam("at", datetime.now(timezone.utc).replace(tzinfo=None), DateTime)
+    for history, fact in (
+        (FeedstockOutputsHistory.__table__, FeedstockOutputs.__table__),
+        (ImportToPackageMapsHistory.__table__, ImportToPackageMaps.__table__),
+    ):
+        keys = [column.name for column in fact.primary_key.columns]
+        connection.execute(
+            insert(history).from_select(
+                keys + ["valid_from"], select(*(fact.c[key] for key in keys), at)
+            )
+        )
+
+
+def _v8_to_v9(connection: Connection) -> None:
+    """
+    Adds the change log, see cfdb.populate.changelog. The existing rows are not
+    logged: changesets apply on top of copies of the database made after the
+    migration.
+    """
+    Base.metadata.create_all(connection, tables=[ChangeLog.__table__])
+
+
+def _v9_to_v10(connection: Connection) -> None:
+    """
+    Recreates the artifacts tables with the file path tree and the file listings
+    of the artifacts, see cfdb.populate.artifacts. The tables are recreated empty,
+    as no version of cfdb populated them before.
+    """
+    # dependents first, so that PostgreSQL accepts dropping the referenced tables
+    for table in ("artifacts", "relations_map_file_paths", "artifacts_file_paths"):
+        connection.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+    Base.metadata.create_all(
+        connection,
+        tables=[
+            Artifacts.__table__,
+            ArtifactsFilePaths.__table__,
+            RelationsMapFilePaths.__table__,
+        ],
+    )
+
+
+def _v10_to_v11(connection: Connection, batch_size=10000) -> None:
+    """
+    Adds the hash of the full path of the file path tree nodes, computed in Python
+    for the stored nodes, and indexes the nodes by path hash and basename and the
+    file listings by node, for the reverse lookups of cfdb.reader.
+    """
+    table = ArtifactsFilePaths.__table__
+    columns = {c["name"] for c in inspect(connection).get_columns(table.name)}
+    if "path_hash" not in columns:
+        column_type = table.c.path_hash.type.compile(dialect=connection.dialect)
+        connection.execute(
+            text(f"ALTER TABLE {table.name} ADD COLUMN path_hash {column_type}")
+        )
+
+    nodes = {
+        node_id: (parent_id, name)
+        for node_id, parent_id, name in connection.execute(
+            select(table.c.id, table.c.parent_id, table.c.dir)
+        )
+    }
+    paths = {}
+
+    def _path(node_id):
+        path = paths.get(node_id)
+        if path is None:
+            parent_id, name = nodes[node_id]
+            path = name if parent_id not in nodes else f"{_path(parent_id)}/{name}"
+            paths[node_id] = path
+        return path
+
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("_id"))
+        .values(path_hash=bindparam("_path_hash"))
+    )
+    node_ids = sorted(nodes)
+    for start in range(0, len(node_ids), batch_size):
+        connection.execute(
+            statement,
+            [
+                {"_id": node_id, "_path_hash": hash_path(_path(node_id))}
+                for node_id in node_ids[start : start + batch_size]
+            ],
+        )
+
+    for index in table.indexes | RelationsMapFilePaths.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+# MIGRATIONS[n] upgrades a database from schema version n to n + 1
+MIGRATIONS: Dict[int, Callable[[Connection], None]] = {
+    1: _v1_to_v2,
+    2: _v2_to_v3,
+    3: _v3_to_v4,
+    4: _v4_to_v5,
+    5: _v5_to_v6,
+    6: _v6_to_v7,
+    7: _v7_to_v8,
+    8: _v8_to_v9,
+    9: _v9_to_v10,
+    10: _v10_to_v11,
+}
+
+
+def upgrade(connection: Connection) -> None:
+    """
+    Creates the tables of an empty database, or migrates an existing database in
+    place to the current schema version.
+
+    Args:
+        connection (Connection): The SQLAlchemy connection object.
+    """
+    version = get_schema_version(connection)
+
+    if version is not None and version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than the supported "
+            f"version {SCHEMA_VERSION}. Please upgrade cfdb."
+        )
+
+    if version is not None:
+        for _version in range(version, SCHEMA_VERSION):
+            logger.info(
+                f"Migrating database schema from version {_version} to {_version + 1}..."
+            )
+            MIGRATIONS[_version](connection)
+
+    Base.metadata.create_all(connection)
+    if version is None:
+        create_search_index(connection)
+
+    if version != SCHEMA_VERSION:
+        set_metadata(connection, "schema_version", SCHEMA_VERSION)
+
+    if get_metadata(connection, "data_version") is None:
+        set_metadata(connection, "data_version", 0)
+
+
+def vacuum(engine: Engine) -> None:
+    """
+    Rebuilds a SQLite database file to reclaim the space freed by a migration.
+    Other backends are left untouched.
+
+    Args:
+        engine (Engine): SQLAlchemy Engine object.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("VACUUM")
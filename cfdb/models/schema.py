@@ -1,6 +1,15 @@
-import uuid
-
-from sqlalchemy import Column, ForeignKey, Index, Integer, LargeBinary, String, Table
+import hashlib
+import re
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+)
 from sqlalchemy.ext.declarative import declarative_base
 
 try:
@@ -14,12 +23,70 @@ except ImportError:
 
     Base = declarative_base()
 
-UUID = LargeBinary(length=16)
+SHA1 = LargeBinary(length=20)
+
+# Bumped whenever the layout of the tables changes, see cfdb.models.migrations
+SCHEMA_VERSION = 11
+
+# Secondary indexes are designed around the lookups of cfdb.reader and the diff
+# queries of the updaters, so that each is answered from an index alone (a
+# "covering" index): the index of a rowid table implicitly holds the rowid, and
+# the index of a WITHOUT ROWID table its primary key.
+
+_SEPARATORS = re.compile(r"[-_.]+")
+
+
+def normalize_name(name: str) -> str:
+    """
+    Returns the PEP 503 normalized form of a name: lowercased, with every run of
+    "-", "_" and "." replaced by a single "-", e.g. "scikit-learn" for
+    "Scikit_Learn".
+    """
+    return _SEPARATORS.sub("-", name).lower()
+
+
+def hash_path(path: str) -> bytes:
+    """
+    Returns the SHA-1 digest of a file path relative to the installation prefix,
+    without leading or trailing "/", e.g. of "lib/libssl.so.3" for "/lib/libssl.so.3".
+    """
+    return hashlib.sha1(path.strip("/").encode()).digest()
 
 
-def uniq_id():
-    _uid = uuid.uuid3(uuid.uuid1(), uuid.uuid4().hex)
-    return _uid.bytes
+class Metadata(Base):
+    """
+    Key/value store for database level information, such as the schema version.
+
+    attributes:
+        key: str - primary key
+        value: str
+    """
+
+    __tablename__ = "cfdb_metadata"
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+    def __repr__(self):
+        return f"<Metadata(key={self.key}, value={self.value})>"
+
+
+class Filters(Base):
+    """
+    Serialized probabilistic filters over the names, see cfdb.bloom.
+
+    attributes:
+        name: str - primary key, what the filter is built over
+        max_id: int - largest ID of the names covered by the filter
+        data: bytes - the serialized filter
+    """
+
+    __tablename__ = "cfdb_filters"
+    name = Column(String, primary_key=True)
+    max_id = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return f"<Filters(name={self.name}, max_id={self.max_id})>"
 
 
 class Feedstocks(Base):
@@ -27,13 +94,13 @@ class Feedstocks(Base):
     Feedstocks are the source of the packages.
 
     attributes:
-        name: str(index) - primary key
-        package_name: str - foreign key to packages
+        id: int - primary key
+        name: str(unique)
     """
 
     __tablename__ = "feedstocks"
-    name = Column(String, index=True, primary_key=True)
-    # package_name = Column(Integer, ForeignKey("packages.name"))
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
 
     def __repr__(self):
         return f"<Feedstock(name={self.name})>"
@@ -44,90 +111,317 @@ class Packages(Base):
     Packages are the artifacts that are built from the feedstocks.
 
     attributes:
-        name: str(index) - primary key
+        id: int - primary key
+        name: str(unique)
+        normalized_name: str - PEP 503 normalized name, see normalize_name
     """
 
     __tablename__ = "packages"
-    name = Column(String, index=True, primary_key=True)
-    # artifact_id = Column(Integer, ForeignKey("artifacts.id"))
+    # normalized name lookups returning the stored names (feedstock-of)
+    __table_args__ = (
+        Index("ix_packages_normalized_name_name", "normalized_name", "name"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+    normalized_name = Column(String)
 
     def __repr__(self):
         return f"<Package(name={self.name})>"
 
 
+class ImportNames(Base):
+    """
+    Import names are the modules provided by the packages.
+
+    attributes:
+        id: int - primary key
+        name: str(unique)
+        normalized_name: str - PEP 503 normalized name, see normalize_name
+    """
+
+    __tablename__ = "import_names"
+    # normalized name lookups returning the stored names (who-provides,
+    # feedstocks-for), and the scans of the import name filter
+    __table_args__ = (
+        Index("ix_import_names_normalized_name_name", "normalized_name", "name"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+    normalized_name = Column(String)
+
+    def __repr__(self):
+        return f"<ImportName(name={self.name})>"
+
+
 class FeedstockOutputs(Base):
     """
     Feedstock outputs are the files mappings from the feedstocks to the packages.
 
     attributes:
-        id: UUID(index) - primary key
+        feedstock_id: int - primary key, foreign key to feedstocks
+        package_id: int - primary key, foreign key to packages
         path: str
-        feedstock_name: str - foreign key to feedstocks
-        package_name: str - foreign key to packages
-        hash: str
+        hash: bytes - SHA-1 digest of the output blob
     """
 
     __tablename__ = "feedstock_outputs"
-
-    id = Column(UUID, primary_key=True)
+    # package_id: package to feedstock lookups and the lookup maintenance;
+    # (path, hash): the stored blobs the updater diffs against
+    __table_args__ = (
+        Index("ix_feedstock_outputs_path_hash", "path", "hash"),
+        {"sqlite_with_rowid": False},
+    )
+
+    feedstock_id = Column(Integer, ForeignKey("feedstocks.id"), primary_key=True)
+    package_id = Column(
+        Integer, ForeignKey("packages.id"), primary_key=True, index=True
+    )
     path = Column(String)
-    feedstock_name = Column(Integer, ForeignKey("feedstocks.name"))
-    package_name = Column(Integer, ForeignKey("packages.name"))
-    hash = Column(String)
-
+    hash = Column(SHA1)
 
-Index(
-    "feedstock_output_index",
-    FeedstockOutputs.feedstock_name,
-    FeedstockOutputs.package_name,
-    unique=True,
-)
+    def __repr__(self):
+        return f"<FeedstockOutputs(feedstock_id={self.feedstock_id}, package_id={self.package_id})>"
 
 
 class ImportToPackageMaps(Base):
-    __tablename__ = "import_to_package_mapping"
+    """
+    Import to package maps are the mappings from the import names to the packages
+    providing them.
 
-    id = Column(UUID, primary_key=True)
-    import_name = Column(String)
-    parent_package_name = Column(String, ForeignKey("packages.name"))
+    attributes:
+        import_id: int - primary key, foreign key to import_names
+        package_id: int - primary key, foreign key to packages
+        partition: str - path of the partition blob, without its extension
+        hash: bytes - SHA-1 digest of the partition blob
+    """
+
+    __tablename__ = "import_to_package_mapping"
+    # package_id: package to import lookups and the lookup maintenance;
+    # (partition, hash): the stored blobs the updater diffs against, and the stale
+    # mappings of the rewritten partitions
+    __table_args__ = (
+        Index("ix_import_to_package_mapping_partition_hash", "partition", "hash"),
+        {"sqlite_with_rowid": False},
+    )
+
+    import_id = Column(Integer, ForeignKey("import_names.id"), primary_key=True)
+    package_id = Column(
+        Integer, ForeignKey("packages.id"), primary_key=True, index=True
+    )
     partition = Column(String)
-    hash = Column(String)
+    hash = Column(SHA1)
 
     def __repr__(self):
-        return f"<ImportToPackageMaps(import_name={self.import_name}, parent_package={self.parent_package})>"
+        return f"<ImportToPackageMaps(import_id={self.import_id}, package_id={self.package_id})>"
 
 
-Index(
-    "import_to_package_mapping_index",
-    ImportToPackageMaps.import_name,
-    ImportToPackageMaps.parent_package_name,
-    unique=True,
-)
+class FeedstockOutputsHistory(Base):
+    """
+    Validity intervals of the feedstock outputs, see cfdb.populate.history. A row
+    is open (valid_to is NULL) while the feedstock output exists.
+
+    attributes:
+        feedstock_id: int - primary key, foreign key to feedstocks
+        package_id: int - primary key, foreign key to packages
+        valid_from: datetime - primary key, UTC time the feedstock output appeared
+        valid_to: datetime - UTC time it disappeared, NULL while it exists
+    """
+
+    __tablename__ = "feedstock_outputs_history"
+    # package_id: package to feedstock lookups as of a past time
+    __table_args__ = (
+        Index("ix_feedstock_outputs_history_package_id", "package_id", "valid_from"),
+        {"sqlite_with_rowid": False},
+    )
+
+    feedstock_id = Column(Integer, ForeignKey("feedstocks.id"), primary_key=True)
+    package_id = Column(Integer, ForeignKey("packages.id"), primary_key=True)
+    valid_from = Column(DateTime, primary_key=True)
+    valid_to = Column(DateTime)
+
+    def __repr__(self):
+        return f"<FeedstockOutputsHistory(feedstock_id={self.feedstock_id}, package_id={self.package_id}, valid_from={self.valid_from}, valid_to={self.valid_to})>"
+
+
+class ImportToPackageMapsHistory(Base):
+    """
+    Validity intervals of the import to package maps, see cfdb.populate.history. A
+    row is open (valid_to is NULL) while the mapping exists.
+
+    attributes:
+        import_id: int - primary key, foreign key to import_names
+        package_id: int - primary key, foreign key to packages
+        valid_from: datetime - primary key, UTC time the mapping appeared
+        valid_to: datetime - UTC time it disappeared, NULL while it exists
+    """
+
+    __tablename__ = "import_to_package_mapping_history"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    # import to package lookups as of a past time use the primary key
+    import_id = Column(Integer, ForeignKey("import_names.id"), primary_key=True)
+    package_id = Column(Integer, ForeignKey("packages.id"), primary_key=True)
+    valid_from = Column(DateTime, primary_key=True)
+    valid_to = Column(DateTime)
+
+    def __repr__(self):
+        return f"<ImportToPackageMapsHistory(import_id={self.import_id}, package_id={self.package_id}, valid_from={self.valid_from}, valid_to={self.valid_to})>"
+
+
+class ChangeLog(Base):
+    """
+    Sequence numbered log of the rows written to and deleted from the fact tables,
+    exported as changesets, see cfdb.populate.changelog.
+
+    attributes:
+        seq: int - primary key, increasing with every change
+        table_name: str - the fact table, feedstock_outputs,
+            import_to_package_mapping or artifacts
+        operation: str - "upsert" or "delete"
+        key_id: int - feedstock_id or import_id of the row, relational_id of an
+            artifact
+        package_id: int - package_id of the row
+        path: str - path or partition of an upserted row, blob path of an artifact
+        hash: bytes - SHA-1 digest of an upserted row
+    """
+
+    __tablename__ = "change_log"
+
+    seq = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    operation = Column(String, nullable=False)
+    key_id = Column(Integer, nullable=False)
+    package_id = Column(Integer, nullable=False)
+    path = Column(String)
+    hash = Column(SHA1)
+
+    def __repr__(self):
+        return f"<ChangeLog(seq={self.seq}, table_name={self.table_name}, operation={self.operation})>"
+
+
+class ImportFeedstocks(Base):
+    """
+    Materialized import name to feedstock lookup, the join of the import to package
+    maps with the feedstock outputs. It is maintained by the updaters from the
+    rows they insert and delete, see cfdb.populate.lookup.
+
+    attributes:
+        import_id: int - primary key, foreign key to import_names
+        feedstock_id: int - primary key, foreign key to feedstocks
+        num_packages: int - number of packages of the feedstock providing the import
+    """
+
+    __tablename__ = "import_feedstocks"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    import_id = Column(Integer, ForeignKey("import_names.id"), primary_key=True)
+    feedstock_id = Column(
+        Integer, ForeignKey("feedstocks.id"), primary_key=True, index=True
+    )
+    num_packages = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<ImportFeedstocks(import_id={self.import_id}, feedstock_id={self.feedstock_id})>"
+
+
+class FeedstockStats(Base):
+    """
+    Summary counts of the feedstocks, maintained along with ImportFeedstocks.
+
+    attributes:
+        feedstock_id: int - primary key, foreign key to feedstocks
+        num_packages: int - number of packages built by the feedstock
+        num_imports: int - number of import names provided by those packages
+    """
+
+    __tablename__ = "feedstock_stats"
+
+    feedstock_id = Column(Integer, ForeignKey("feedstocks.id"), primary_key=True)
+    num_packages = Column(Integer, nullable=False, default=0)
+    num_imports = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<FeedstockStats(feedstock_id={self.feedstock_id}, num_packages={self.num_packages}, num_imports={self.num_imports})>"
 
 
 class Artifacts(Base):
+    """
+    Artifacts are the built packages, one per artifact file name and platform, with
+    the listing of the files they install.
+
+    attributes:
+        name: str - primary key, file name of the artifact without its extension
+        platform: str - primary key, conda subdir, e.g. linux-64
+        package_name: str - foreign key to packages
+        version: str
+        relational_id: int - unique ID of the file listing of the artifact, see
+            RelationsMapFilePaths
+        path: str - path of the artifact blob, relative to the artifacts tree
+        hash: bytes - SHA-1 digest of the artifact blob
+    """
+
     __tablename__ = "artifacts"
     name = Column(String, primary_key=True, index=True)
     package_name = Column(String, ForeignKey("packages.name"))
     platform = Column(String, primary_key=True)
     version = Column(String)
-    relational_id = Column(Integer, ForeignKey("relations_map_file_paths.id"))
+    relational_id = Column(Integer, unique=True)
+    path = Column(String)
+    hash = Column(SHA1)
 
     def __repr__(self):
         return f"<Artifact(name={self.name}, platform={self.platform}, version={self.version})>"
 
 
 class ArtifactsFilePaths(Base):
+    """
+    Nodes of the tree of the file paths installed by the artifacts. Each node is a
+    path component below its parent node, so that the directories shared by many
+    files, across all artifacts, are stored once.
+
+    attributes:
+        id: int - primary key
+        parent_id: int - ID of the parent node, 0 for the top-level components
+        dir: str - the path component, a directory or file name
+        path_hash: bytes - SHA-1 digest of the full path of the node, see hash_path
+    """
+
     __tablename__ = "artifacts_file_paths"
+    # (parent_id, dir): a path component is stored once below its parent;
+    # path_hash: full path lookups (who-ships);
+    # dir: basename lookups (who-ships)
+    __table_args__ = (
+        Index("ix_artifacts_file_paths_parent_id_dir", "parent_id", "dir", unique=True),
+        Index("ix_artifacts_file_paths_path_hash", "path_hash", unique=True),
+        Index("ix_artifacts_file_paths_dir", "dir"),
+    )
+
     id = Column(Integer, primary_key=True)
-    parent_id = Column(Integer)
-    dir = Column(String)
+    parent_id = Column(Integer, nullable=False)
+    dir = Column(String, nullable=False)
+    path_hash = Column(SHA1)
 
 
 class RelationsMapFilePaths(Base):
+    """
+    File listings of the artifacts, as the leaf nodes of the file path tree.
+
+    attributes:
+        id: int - primary key, relational_id of the artifact
+        file_path: int - primary key, foreign key to artifacts_file_paths
+    """
+
     __tablename__ = "relations_map_file_paths"
-    id = Column(Integer, primary_key=True)
-    file_path = Column(String, ForeignKey("artifacts_file_paths.id"))
+    # file_path: the artifacts shipping a file (who-ships)
+    __table_args__ = (
+        Index("ix_relations_map_file_paths_file_path", "file_path"),
+        {"sqlite_with_rowid": False},
+    )
+
+    id = Column(Integer, ForeignKey("artifacts.relational_id"), primary_key=True)
+    file_path = Column(Integer, ForeignKey("artifacts_file_paths.id"), primary_key=True)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,586 @@
-from cfdb.log import logger
+"""
+Artifacts and the file listings they install, loaded from a libcfgraph-style tree.
 
+The tree holds one JSON blob per artifact, under
+``<package name>/<channel>/<platform>/<artifact>.json``, with the conda index of the
+artifact and the paths of its files. Millions of file paths share a few thousand
+directory prefixes (``lib/python3.11/site-packages/...``), so the paths are stored
+as a tree of path components in `artifacts_file_paths`, each component once below
+its parent across all artifacts, and every artifact lists the leaf nodes of its
+files in `relations_map_file_paths`.
 
-def update(session):
+The tree is interned in memory: the stored nodes are loaded once per update into a
+(parent ID, component) to ID map, the IDs of new nodes are assigned from it, and the
+new nodes and listings of a batch of artifacts are bulk inserted, so that no path
+costs a query. Each node also stores the hash of its full path, so that the reverse
+lookups of `cfdb.reader.CFDBReader.who_ships` find the artifacts shipping a file
+through indexes, by full path or by basename, without walking the tree.
+"""
+
+import asyncio
+import concurrent.futures
+from functools import partial
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from cfdb.log import logger, progressBar
+from cfdb.models.migrations import bump_data_version
+from cfdb.models.schema import (
+    Artifacts,
+    ArtifactsFilePaths,
+    ChangeLog,
+    Packages,
+    RelationsMapFilePaths,
+    hash_path,
+)
+from cfdb.populate.decoding import decode_artifact
+from cfdb.populate.loaders import chunked, ensure_ids, upsert
+from cfdb.populate.utils import list_json_files, read_changed_blob
+
+# (file_rel_path, file_hash, artifact name, platform, package name, version, files)
+ArtifactRecord = Tuple[Path, str, str, str, str, str, List[str]]
+
+# parent_id of the top-level path components
+ROOT_ID = 0
+
+# Number of stored nodes fetched at once when loading the tree
+LOAD_BATCH_SIZE = 100000
+
+
+class FilePathTree:
+    """
+    In-memory map of the file path tree stored in `artifacts_file_paths`, which
+    interns the paths of the listings into the IDs of their leaf nodes. The IDs of
+    new nodes are assigned past the largest stored ID, so a single tree may write to
+    the database at a time, and the tree must be reloaded when a transaction that
+    flushed it is rolled back.
+
+    Args:
+        session (Session): The SQLAlchemy session object, to load the stored nodes.
+
+    Attributes:
+        nodes (Dict[Tuple[int, str], int]): The ID of every node, by parent ID and
+            path component.
+        directories (Dict[str, int]): The ID of the directories interned so far, by
+            path.
+        new_nodes (List[Dict]): The nodes created since the last flush.
+    """
+
+    def __init__(self, session: Session):
+        self.reload(session)
+
+    def reload(self, session: Session) -> None:
+        """
+        Loads the stored nodes, discarding the nodes created in memory, e.g. after
+        a rollback of the transaction that flushed them.
+
+        Args:
+            session (Session): The SQLAlchemy session object.
+        """
+        rows = session.execute(
+            select(
+                ArtifactsFilePaths.parent_id,
+                ArtifactsFilePaths.dir,
+                ArtifactsFilePaths.id,
+            ).execution_options(yield_per=LOAD_BATCH_SIZE)
+        )
+        self.nodes: Dict[Tuple[int, str], int] = {
+            (parent_id, name): node_id for parent_id, name, node_id in rows
+        }
+        self.next_id = max(self.nodes.values(), default=ROOT_ID) + 1
+        self.directories: Dict[str, int] = {"": ROOT_ID}
+        self.new_nodes: List[Dict] = []
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def _child(self, parent_id: int, name: str, path: str) -> int:
+        key = (parent_id, name)
+        node_id = self.nodes.get(key)
+        if node_id is None:
+            node_id = self.nodes[key] = self.next_id
+            self.next_id += 1
+            self.new_nodes.append(
+                {
+                    "id": node_id,
+                    "parent_id": parent_id,
+                    "dir": name,
+                    "path_hash": hash_path(path),
+                }
+            )
+        return node_id
+
+    def _directory(self, directory: str) -> int:
+        node_id = self.directories.get(directory)
+        if node_id is None:
+            parent, _, name = directory.rpartition("/")
+            node_id = self._child(self._directory(parent), name, directory)
+            self.directories[directory] = node_id
+        return node_id
+
+    def intern(self, path: str) -> int:
+        """
+        Returns the ID of the leaf node of a file path, creating the missing nodes
+        with the hash of their full path. Directories are memoized by path, so the
+        files of a known directory cost a single lookup.
+
+        Args:
+            path (str): The file path, relative to the installation prefix.
+
+        Returns:
+            int: The ID of the node of the file.
+        """
+        path = path.strip("/")
+        directory, _, name = path.rpartition("/")
+        return self._child(self._directory(directory), name, path)
+
+    def flush(self, session: Session) -> int:
+        """
+        Bulk inserts the nodes created since the last flush. A plain insert, so that
+        an ID already taken in the database, by a tree that was not reloaded, raises
+        instead of leaving listings pointing at another path.
+
+        Args:
+            session (Session): The SQLAlchemy session object.
+
+        Returns:
+            int: The number of inserted nodes.
+        """
+        new_nodes, self.new_nodes = self.new_nodes, []
+        if new_nodes:
+            session.execute(insert(ArtifactsFilePaths.__table__), new_nodes)
+        return len(new_nodes)
+
+
+def _database_files(session: Session) -> Set[Tuple[Path, str]]:
+    """
+    Returns the artifact blobs currently stored in the database.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+
+    Returns:
+        Set[Tuple[Path, str]]: A set of (relative file path, hexadecimal SHA-1 hash) tuples.
+    """
+    rows = session.execute(select(Artifacts.path, Artifacts.hash))
+    return {(Path(path), file_hash.hex()) for path, file_hash in rows}
+
+
+def _parse_artifact(file: Path, file_hash: str, data: bytes) -> ArtifactRecord:
+    """
+    Parses an artifact blob into the record consumed by the writer.
+
+    Args:
+        file (Path): The path to the artifact blob (relative to the root directory).
+        file_hash (str): The SHA-1 hash of the file.
+        data (bytes): The content of the file.
+
+    Returns:
+        ArtifactRecord: The relative path, hash, artifact name, platform, package
+            name, version and file paths of the artifact.
+    """
+    package_name, version, platform, files = decode_artifact(data)
+    # the platform directory of the tree, for indexes without a subdir
+    platform = platform or file.parent.name
+    return file, file_hash, file.stem, platform, package_name, version, files
+
+
+def _process_artifact(
+    root_dir: Path, db_files: Set[Tuple[Path, str]], file: str
+) -> Optional[ArtifactRecord]:
+    """
+    Reads an artifact blob once, and parses it if it is not in the database yet.
+
+    Args:
+        root_dir (Path): The root directory of the artifacts.
+        db_files (Set[Tuple[Path, str]]): The artifact blobs stored in the database.
+        file (str): The path to the artifact blob.
+
+    Returns:
+        Optional[ArtifactRecord]: The parsed blob, or None if it is unchanged.
+    """
+    blob = read_changed_blob(root_dir, file, db_files)
+    if blob is None:
+        return None
+    return _parse_artifact(*blob)
+
+
+def _relational_ids(
+    session: Session, keys: List[Tuple[str, str]]
+) -> Dict[Tuple[str, str], int]:
+    """
+    Returns the relational_id of the stored artifacts among the (name, platform) keys.
+    """
+    names = sorted({name for name, _ in keys})
+    keys = set(keys)
+    relational_ids = {}
+    for names_batch in chunked(names, 500):
+        rows = session.execute(
+            select(Artifacts.name, Artifacts.platform, Artifacts.relational_id).where(
+                Artifacts.name.in_(names_batch)
+            )
+        )
+        relational_ids.update(
+            ((name, platform), relational_id)
+            for name, platform, relational_id in rows
+            if (name, platform) in keys
+        )
+    return relational_ids
+
+
+def _record_changes(
+    session: Session, operation: str, artifacts: List[Dict], package_ids: Dict
+) -> None:
+    """
+    Appends upserted or deleted artifacts to the change log, keyed by their
+    relational_id and identified by the path of their blob, see
+    cfdb.populate.changelog.
+    """
+    if artifacts:
+        session.execute(
+            insert(ChangeLog),
+            [
+                {
+                    "table_name": Artifacts.__tablename__,
+                    "operation": operation,
+                    "key_id": artifact["relational_id"],
+                    "package_id": package_ids[artifact["package_name"]],
+                    "path": artifact["path"],
+                    "hash": artifact["hash"] if operation == "upsert" else None,
+                }
+                for artifact in artifacts
+            ],
+        )
+
+
+def _write_artifacts(
+    session: Session,
+    tree: FilePathTree,
+    records: List[ArtifactRecord],
+    record_changes: bool = True,
+) -> None:
+    """
+    Bulk inserts the packages, artifacts, file path nodes and file listings of a
+    batch of parsed artifact blobs. The listings of stored artifacts are replaced,
+    the artifacts are recorded in the change log, and the data version of the
+    database is bumped.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        tree (FilePathTree): The file path tree of the database.
+        records (List[ArtifactRecord]): The parsed artifact blobs.
+        record_changes (bool, optional): Whether to record the artifacts in the
+            change log, which replayed changes already are. Defaults to True.
+    """
+    # the last blob of an artifact wins
+    latest = {(record[2], record[3]): record for record in records}
+    package_ids = ensure_ids(
+        session, Packages.__table__, (record[4] for record in latest.values())
+    )
+
+    relational_ids = _relational_ids(session, list(latest))
+    stale = sorted(relational_ids.values())
+    next_id = (
+        session.execute(select(func.max(Artifacts.relational_id))).scalar() or 0
+    ) + 1
+
+    artifacts = []
+    listings = []
+    for (name, platform), record in latest.items():
+        file_rel_path, file_hash, _, _, package_name, version, files = record
+        relational_id = relational_ids.get((name, platform))
+        if relational_id is None:
+            relational_id, next_id = next_id, next_id + 1
+        artifacts.append(
+            {
+                "name": name,
+                "platform": platform,
+                "package_name": package_name,
+                "version": version,
+                "relational_id": relational_id,
+                "path": file_rel_path.as_posix(),
+                "hash": bytes.fromhex(file_hash),
+            }
+        )
+        listings.extend(
+            {"id": relational_id, "file_path": node_id}
+            for node_id in {tree.intern(file) for file in files}
+        )
+
+    upsert(
+        session,
+        Artifacts.__table__,
+        artifacts,
+        index_elements=["name", "platform"],
+        update_columns=["package_name", "version", "path", "hash"],
+    )
+    for ids_batch in chunked(stale, 500):
+        session.execute(
+            delete(RelationsMapFilePaths).where(RelationsMapFilePaths.id.in_(ids_batch))
+        )
+    tree.flush(session)
+    upsert(session, RelationsMapFilePaths.__table__, listings, ["id", "file_path"])
+    if record_changes:
+        _record_changes(session, "upsert", artifacts, package_ids)
+    bump_data_version(session)
+
+
+def _commit_artifacts(
+    session: Session, tree: FilePathTree, records: List[ArtifactRecord]
+) -> None:
+    """
+    Writes and commits a batch of parsed artifact blobs. When the transaction fails,
+    it is rolled back and the tree reloaded, so that the IDs assigned to the nodes
+    of the batch are not reused by the next batches.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        tree (FilePathTree): The file path tree of the database.
+        records (List[ArtifactRecord]): The parsed artifact blobs.
+    """
+    try:
+        _write_artifacts(session, tree, records)
+        session.commit()
+    except BaseException:
+        session.rollback()
+        tree.reload(session)
+        raise
+
+
+def delete_removed_artifacts(session: Session, paths: Set[str]) -> int:
+    """
+    Deletes the stored artifacts, and their file listings, whose blob is not listed
+    anymore, i.e. was removed from the artifacts tree. The file path nodes are kept,
+    as they may be shared with other artifacts.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        paths (Set[str]): The path of every artifact blob, relative to the root
+            directory.
+
+    Returns:
+        int: The number of removed artifacts.
+    """
+    stored = session.execute(select(Artifacts.path).distinct()).scalars()
+    removed = delete_artifacts(session, set(stored) - paths)
+    return len(removed)
+
+
+def delete_artifacts(
+    session: Session, paths: Iterable[str], record_changes: bool = True
+) -> Dict[str, int]:
+    """
+    Deletes the artifacts of blobs, and their file listings, records them in the
+    change log, and bumps the data version of the database. The file path nodes are
+    kept, as they may be shared with other artifacts.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        paths (Iterable[str]): The paths of the artifact blobs, relative to the root
+            directory.
+        record_changes (bool, optional): Whether to record the deletions in the
+            change log, which replayed changes already are. Defaults to True.
+
+    Returns:
+        Dict[str, int]: The relational_id of the deleted artifacts, by blob path.
+    """
+    deleted = {}
+    for paths_batch in chunked(sorted(paths), 500):
+        rows = session.execute(
+            select(
+                Artifacts.relational_id,
+                Artifacts.package_name,
+                Artifacts.path,
+                Packages.id,
+            )
+            .join(Packages, Packages.name == Artifacts.package_name)
+            .where(Artifacts.path.in_(paths_batch))
+        ).all()
+        ids_batch = [row.relational_id for row in rows]
+        session.execute(
+            delete(RelationsMapFilePaths).where(RelationsMapFilePaths.id.in_(ids_batch))
+        )
+        session.execute(delete(Artifacts).where(Artifacts.relational_id.in_(ids_batch)))
+        if record_changes:
+            _record_changes(
+                session,
+                "delete",
+                [row._asdict() for row in rows],
+                {row.package_name: row.id for row in rows},
+            )
+        deleted.update((row.path, row.relational_id) for row in rows)
+
+    if deleted:
+        bump_data_version(session)
+    return deleted
+
+
+def list_artifacts(root_dir: Path, files: List[str]) -> Set[str]:
+    """
+    Returns the paths of artifact blobs, relative to the root directory.
+    """
+    return {Path(file).relative_to(root_dir).as_posix() for file in files}
+
+
+def update(
+    session: Session,
+    path: Path,
+    batch_size: int = 100,
+    files: Optional[List[str]] = None,
+):
+    """
+    Updates the artifacts and their file listings in the database from the blobs
+    that changed since the last update.
+
+    Args:
+        session (Session): The database session.
+        path (Path): The path to the directory containing the artifact blobs.
+        batch_size (int, optional): Number of files read per transaction. Defaults to 100.
+        files (List[str], optional): Subset of the JSON files under `path` to consider.
+            Defaults to None, meaning every JSON file, in which case the artifacts
+            whose blob was removed are deleted.
+    """
     logger.info("Updating artifacts...")
+
+    logger.info("Querying database for artifacts...")
+    db_files = _database_files(session)
+    tree = FilePathTree(session)
+    logger.info(f"Loaded {len(tree)} file path nodes.")
+
+    listed_all = files is None
+    if listed_all:
+        files = list_json_files(path)
+    logger.info(f"Reading {len(files)} files in {path}...")
+
+    process = partial(_process_artifact, path, db_files)
+    num_changed = 0
+    num_nodes = len(tree)
+    with concurrent.futures.ThreadPoolExecutor() as executor, progressBar:
+        task = progressBar.add_task("Updating artifacts...", total=len(files))
+        for batch in chunked(files, batch_size):
+            records = [record for record in executor.map(process, batch) if record]
+            if records:
+                _commit_artifacts(session, tree, records)
+                num_changed += len(records)
+            progressBar.advance(task, len(batch))
+
+    if listed_all:
+        num_changed += delete_removed_artifacts(session, list_artifacts(path, files))
+        session.commit()
+
+    if num_changed == 0:
+        logger.info("No changes detected.")
+    else:
+        logger.info(
+            f"Updated {num_changed} modified files, "
+            f"adding {len(tree) - num_nodes} file path nodes."
+        )
+
+
+async def update_async(
+    session_maker,
+    path: Path,
+    file_semaphore: asyncio.Semaphore,
+    batch_size: int = 100,
+):
+    """
+    Asynchronous counterpart of `update`. Files are read, hashed and parsed in
+    executor tasks bounded by `file_semaphore`, while the batches are written one at
+    a time, as the IDs of the new file path nodes are assigned in memory. The
+    artifacts whose blob was removed are then deleted.
+
+    Args:
+        session_maker (async_sessionmaker): Factory for the asynchronous sessions.
+        path (Path): The path to the directory containing the artifact blobs.
+        file_semaphore (asyncio.Semaphore): Bounds the number of concurrent file reads.
+        batch_size (int, optional): Number of files read per transaction. Defaults to 100.
+    """
+    logger.info("Updating artifacts...")
+
+    logger.info("Querying database for artifacts...")
+    async with session_maker() as session:
+        db_files = await session.run_sync(_database_files)
+        tree = await session.run_sync(FilePathTree)
+
+    loop = asyncio.get_running_loop()
+    files = await loop.run_in_executor(None, list_json_files, path)
+    logger.info(f"Reading {len(files)} files in {path}...")
+
+    process = partial(_process_artifact, path, db_files)
+    write_lock = asyncio.Lock()
+
+    async def _process(file: str) -> Optional[ArtifactRecord]:
+        async with file_semaphore:
+            return await loop.run_in_executor(None, process, file)
+
+    async def _load(batch: List[str]) -> int:
+        records = [
+            record
+            for record in await asyncio.gather(*(_process(file) for file in batch))
+            if record
+        ]
+        if records:
+            async with write_lock:
+                async with session_maker() as session:
+                    await session.run_sync(_commit_artifacts, tree, records)
+        return len(records)
+
+    num_changed = sum(
+        await asyncio.gather(*(_load(batch) for batch in chunked(files, batch_size)))
+    )
+
+    async with session_maker() as session:
+        num_changed += await session.run_sync(
+            delete_removed_artifacts, list_artifacts(path, files)
+        )
+        await session.commit()
+
+    if num_changed == 0:
+        logger.info("No changes detected.")
+    else:
+        logger.info(f"Updated {num_changed} modified files.")
+
+
+def list_files(bind: Union[Connection, Session], name: str, platform: str) -> List[str]:
+    """
+    Returns the file paths of an artifact, rebuilt from the file path tree.
+
+    Args:
+        bind (Union[Connection, Session]): The SQLAlchemy session or connection.
+        name (str): The artifact name.
+        platform (str): The platform of the artifact.
+
+    Returns:
+        List[str]: The sorted file paths, empty for an unknown artifact.
+    """
+    # walk up from the leaves, prepending the parent components
+    paths = (
+        select(
+            ArtifactsFilePaths.parent_id.label("parent_id"),
+            ArtifactsFilePaths.dir.label("path"),
+        )
+        .join_from(
+            Artifacts,
+            RelationsMapFilePaths,
+            RelationsMapFilePaths.id == Artifacts.relational_id,
+        )
+        .join(
+            ArtifactsFilePaths, ArtifactsFilePaths.id == RelationsMapFilePaths.file_path
+        )
+        .where(Artifacts.name == name, Artifacts.platform == platform)
+        .cte("paths", recursive=True)
+    )
+    paths = paths.union_all(
+        select(
+            ArtifactsFilePaths.parent_id,
+            ArtifactsFilePaths.dir + literal("/") + paths.c.path,
+        ).join_from(
+            paths, ArtifactsFilePaths, ArtifactsFilePaths.id == paths.c.parent_id
+        )
+    )
+    rows = bind.execute(select(paths.c.path).where(paths.c.parent_id == ROOT_ID))
+    return sorted(rows.scalars())
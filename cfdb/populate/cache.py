@@ -0,0 +1,163 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+# Default bound of the total size of the blobs of the in-memory entries
+MAX_BYTES = 256 * 1024 * 1024
+
+
+class ParseCache:
+    """
+    Content-addressed cache of parsed JSON blobs.
+
+    Parsed payloads are keyed by the SHA-1 digest of the blob they were decoded
+    from, so byte-identical blobs are only decoded once per run, whatever their
+    path. Entries live in an in-memory LRU, bounded both in number of entries and
+    in size of the blobs they were decoded from, and optionally in a SQLite file
+    so that unchanged content is only ever decoded once across runs. Payloads are
+    persisted as JSON, so that loading a cache file never runs code from it.
+
+    Cached payloads are shared between callers and must not be mutated.
+
+    Args:
+        maxsize (int, optional): Maximum number of in-memory entries. Defaults to 4096.
+        maxbytes (int, optional): Maximum total size of the blobs of the in-memory
+            entries. Blobs larger than that are never held in memory. Defaults to
+            MAX_BYTES.
+        path (Path, optional): SQLite file persisting the entries. Defaults to None.
+
+    Attributes:
+        hits (int): Lookups served from memory.
+        disk_hits (int): Lookups served from the persisted cache.
+        misses (int): Lookups that required decoding the blob.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 4096,
+        maxbytes: int = MAX_BYTES,
+        path: Optional[Path] = None,
+    ):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+        if path is not None:
+            self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=60)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS parsed_blobs "
+                "(key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID"
+            )
+            self._db.commit()
+
+    def __repr__(self) -> str:
+        return (
+            f"ParseCache(maxsize={self.maxsize}, maxbytes={self.maxbytes}, "
+            f"path={self.path})"
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_parse(
+        self, namespace: str, digest: str, parse: Callable[[], Any], size: int = 0
+    ):
+        """
+        Returns the payload cached for `digest`, calling `parse` on a miss.
+
+        Args:
+            namespace (str): Kind of payload, e.g. "feedstock_outputs".
+            digest (str): The hexadecimal SHA-1 digest of the blob.
+            parse (Callable[[], Any]): Decodes the blob.
+            size (int, optional): The size of the blob in bytes, approximating the
+                memory held by its payload. Defaults to 0.
+
+        Returns:
+            Any: The parsed payload.
+        """
+        key = f"{namespace}:{digest}"
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM parsed_blobs WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    value = json.loads(row[0])
+                    self._remember(key, value, size)
+                    return value
+
+        # decode outside of the lock, so that concurrent readers are not serialized
+        value = parse()
+
+        with self._lock:
+            self.misses += 1
+            self._remember(key, value, size)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO parsed_blobs VALUES (?, ?)",
+                    (key, json.dumps(value, separators=(",", ":"))),
+                )
+        return value
+
+    def _remember(self, key: str, value, size: int):
+        if size > self.maxbytes:
+            return
+
+        self._entries[key] = (value, size)
+        self._size += size
+        while len(self._entries) > self.maxsize or self._size > self.maxbytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.disk_hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return (self.hits + self.disk_hits) / self.lookups if self.lookups else 0.0
+
+    def summary(self) -> str:
+        """
+        Returns a one line summary of the cache statistics, for the run summary.
+        """
+        return (
+            f"Parse cache: {self.lookups} lookups, {self.hits} memory hits, "
+            f"{self.disk_hits} disk hits, {self.misses} misses "
+            f"({self.hit_rate:.1%} hit rate)."
+        )
+
+    def flush(self):
+        """
+        Commits the entries added to the persisted cache, if any.
+        """
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+
+    def close(self):
+        """
+        Flushes and closes the persisted cache, if any.
+        """
+        self.flush()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
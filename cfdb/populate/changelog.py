@@ -0,0 +1,439 @@
+"""
+Change log of the fact tables, exported and replayed as changesets.
+
+Every write of the updaters appends the feedstock outputs, import to package maps
+and artifacts it upserted or deleted to the `change_log` table, under increasing
+sequence numbers, in the same transaction. `export_changes` returns the changes
+after a given sequence number as a changeset keyed by names, and `apply_changes`
+replays a changeset onto an older copy of the database through the same
+maintenance of the derived tables as the updaters. The replayed changes keep their
+sequence numbers, so that the copy can be synced again, or serve changesets itself.
+
+Artifacts are logged by the path of their blob, and their upserts are exported
+with the platform, version and file listing they have at export time. An upsert
+superseded by a later change of the artifact is exported without them, and only
+replayed into the change log.
+"""
+
+import gzip
+import json
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple, Union
+
+from sqlalchemy import func, insert, select, text, tuple_
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from cfdb.models.migrations import bump_data_version
+from cfdb.models.schema import (
+    Artifacts,
+    ChangeLog,
+    FeedstockOutputs,
+    Feedstocks,
+    ImportNames,
+    ImportToPackageMaps,
+    Packages,
+)
+from cfdb.populate import artifacts, history, lookup
+from cfdb.populate.loaders import chunked, ensure_ids, upsert
+
+Bind = Union[Connection, Session]
+
+FORMAT = "cfdb-changeset"
+# version 2 adds the artifacts; version 1 changesets are still applied
+FORMAT_VERSION = 2
+
+# fact table name -> (fact table, key dimension table, key column, path column,
+# propagation to the import to feedstock lookup)
+TABLES = {
+    FeedstockOutputs.__tablename__: (
+        FeedstockOutputs.__table__,
+        Feedstocks.__table__,
+        "feedstock_id",
+        "path",
+        lookup.apply_output_changes,
+    ),
+    ImportToPackageMaps.__tablename__: (
+        ImportToPackageMaps.__table__,
+        ImportNames.__table__,
+        "import_id",
+        "partition",
+        lookup.apply_mapping_changes,
+    ),
+}
+
+# [seq, table name, operation, key name, package name, path, hexadecimal hash],
+# followed for artifacts by the platform, version and files of a current upsert,
+# or None
+Change = List
+
+
+def record_changes(
+    bind: Bind,
+    table,
+    upserted: Iterable[Dict],
+    removed: Iterable[Tuple[int, int]] = (),
+) -> None:
+    """
+    Appends the upserted and deleted rows of a fact table to the change log.
+
+    Args:
+        bind (Union[Connection, Session]): The SQLAlchemy session or connection.
+        table (Table): The fact table, one of `TABLES`.
+        upserted (Iterable[Dict]): The inserted or updated rows, as column name to
+            value mappings.
+        removed (Iterable[Tuple[int, int]], optional): The primary keys of the
+            deleted rows. Defaults to ().
+    """
+    _, _, key, path, _ = TABLES[table.name]
+    rows = [
+        {
+            "table_name": table.name,
+            "operation": "upsert",
+            "key_id": row[key],
+            "package_id": row["package_id"],
+            "path": row[path],
+            "hash": row["hash"],
+        }
+        for row in upserted
+    ]
+    rows.extend(
+        {
+            "table_name": table.name,
+            "operation": "delete",
+            "key_id": key_id,
+            "package_id": package_id,
+            "path": None,
+            "hash": None,
+        }
+        for key_id, package_id in sorted(removed)
+    )
+    if rows:
+        bind.execute(insert(ChangeLog), rows)
+
+
+def last_seq(bind: Bind) -> int:
+    """
+    Returns the sequence number of the last change of the database, 0 if none.
+    """
+    return bind.execute(select(func.max(ChangeLog.seq))).scalar() or 0
+
+
+def export_changes(connection: Connection, since: int = 0) -> Dict:
+    """
+    Returns the changes made after the change `since`, as a changeset.
+
+    Args:
+        connection (Connection): The SQLAlchemy connection object.
+        since (int, optional): Sequence number of the last change the consumer
+            has. Defaults to 0, meaning every logged change.
+
+    Returns:
+        Dict: The changeset: its format, the sequence numbers it goes from and to,
+            and the changes, as lists of sequence number, table, operation, key
+            name (feedstock, import or artifact name), package name, path and
+            hash, and for artifacts their contents.
+    """
+    until = last_seq(connection)
+    if since > until:
+        raise ValueError(f"The database is only at change {until}, not {since}.")
+
+    changes = []
+    for table_name, (_, dimension, _, _, _) in TABLES.items():
+        rows = connection.execute(
+            select(
+                ChangeLog.seq,
+                ChangeLog.operation,
+                dimension.c.name,
+                Packages.name,
+                ChangeLog.path,
+                ChangeLog.hash,
+            )
+            .join(dimension, dimension.c.id == ChangeLog.key_id)
+            .join(Packages, Packages.id == ChangeLog.package_id)
+            .where(ChangeLog.seq > since)
+            .where(ChangeLog.table_name == table_name)
+        )
+        for seq, operation, key_name, package_name, path, file_hash in rows:
+            changes.append(
+                [
+                    seq,
+                    table_name,
+                    operation,
+                    key_name,
+                    package_name,
+                    path,
+                    None if file_hash is None else file_hash.hex(),
+                ]
+            )
+
+    changes.extend(_export_artifact_changes(connection, since))
+    changes.sort(key=lambda change: change[0])
+    return {
+        "format": FORMAT,
+        "version": FORMAT_VERSION,
+        "since": since,
+        "until": until,
+        "changes": changes,
+    }
+
+
+def _export_artifact_changes(connection: Connection, since: int) -> List[Change]:
+    """
+    Returns the changes of the artifacts made after the change `since`, the current
+    upserts with the platform, version and files of the artifact.
+    """
+    rows = connection.execute(
+        select(
+            ChangeLog.seq,
+            ChangeLog.operation,
+            ChangeLog.key_id,
+            Packages.name,
+            ChangeLog.path,
+            ChangeLog.hash,
+        )
+        .join(Packages, Packages.id == ChangeLog.package_id)
+        .where(ChangeLog.seq > since)
+        .where(ChangeLog.table_name == Artifacts.__tablename__)
+    ).all()
+
+    upserted = sorted({row.key_id for row in rows if row.operation == "upsert"})
+    current = {}
+    for ids_batch in chunked(upserted, 500):
+        current.update(
+            (row.relational_id, row)
+            for row in connection.execute(
+                select(
+                    Artifacts.relational_id,
+                    Artifacts.name,
+                    Artifacts.platform,
+                    Artifacts.version,
+                    Artifacts.path,
+                    Artifacts.hash,
+                ).where(Artifacts.relational_id.in_(ids_batch))
+            )
+        )
+
+    changes = []
+    for seq, operation, key_id, package_name, path, file_hash in rows:
+        contents = None
+        artifact = current.get(key_id) if operation == "upsert" else None
+        if artifact is not None and (artifact.path, artifact.hash) == (path, file_hash):
+            contents = {
+                "platform": artifact.platform,
+                "version": artifact.version,
+                "files": artifacts.list_files(
+                    connection, artifact.name, artifact.platform
+                ),
+            }
+        changes.append(
+            [
+                seq,
+                Artifacts.__tablename__,
+                operation,
+                Path(path).stem,
+                package_name,
+                path,
+                None if file_hash is None else file_hash.hex(),
+                contents,
+            ]
+        )
+    return changes
+
+
+def _apply_artifact_run(
+    session: Session,
+    tree: artifacts.FilePathTree,
+    operation: str,
+    changes: List[Change],
+) -> None:
+    """
+    Replays consecutive changes of the artifacts with the same operation.
+    """
+    paths = {change[5] for change in changes}
+    if operation == "upsert":
+        records = [
+            (
+                Path(path),
+                file_hash,
+                name,
+                contents["platform"],
+                package_name,
+                contents["version"],
+                contents["files"],
+            )
+            for _, _, _, name, package_name, path, file_hash, contents in changes
+            if contents is not None
+        ]
+        if records:
+            artifacts._write_artifacts(session, tree, records, record_changes=False)
+        key_ids = {}
+        for paths_batch in chunked(sorted(paths), 500):
+            rows = session.execute(
+                select(Artifacts.path, Artifacts.relational_id).where(
+                    Artifacts.path.in_(paths_batch)
+                )
+            )
+            key_ids.update((path, relational_id) for path, relational_id in rows)
+    elif operation == "delete":
+        key_ids = artifacts.delete_artifacts(session, paths, record_changes=False)
+    else:
+        raise ValueError(f"Unknown operation in the changeset: {operation}.")
+
+    package_ids = ensure_ids(session, Packages.__table__, (c[4] for c in changes))
+    session.execute(
+        insert(ChangeLog),
+        [
+            {
+                "seq": change[0],
+                "table_name": Artifacts.__tablename__,
+                "operation": operation,
+                # superseded upserts of artifacts gone from the copy as well
+                "key_id": key_ids.get(change[5], 0),
+                "package_id": package_ids[change[4]],
+                "path": change[5],
+                "hash": None if change[6] is None else bytes.fromhex(change[6]),
+            }
+            for change in changes
+        ],
+    )
+
+
+def _existing_keys(session: Session, table, key: str, keys) -> set:
+    columns = (table.c[key], table.c.package_id)
+    existing = set()
+    for keys_batch in chunked(sorted(keys), 500):
+        rows = session.execute(select(*columns).where(tuple_(*columns).in_(keys_batch)))
+        existing.update(tuple(row) for row in rows)
+    return existing
+
+
+def _apply_run(
+    session: Session, table_name: str, operation: str, changes: List[Change]
+) -> None:
+    """
+    Replays consecutive changes of the same table and operation.
+    """
+    table, dimension, key, path, apply_changes = TABLES[table_name]
+    key_ids = ensure_ids(session, dimension, (change[3] for change in changes))
+    package_ids = ensure_ids(session, Packages.__table__, (c[4] for c in changes))
+
+    # the last change of a key wins
+    latest = {
+        (key_ids[change[3]], package_ids[change[4]]): change for change in changes
+    }
+    existing = _existing_keys(session, table, key, latest.keys())
+    if operation == "upsert":
+        upsert(
+            session,
+            table,
+            [
+                {
+                    key: key_id,
+                    "package_id": package_id,
+                    path: change[5],
+                    "hash": None if change[6] is None else bytes.fromhex(change[6]),
+                }
+                for (key_id, package_id), change in latest.items()
+            ],
+            index_elements=[key, "package_id"],
+            update_columns=[path, "hash"],
+        )
+        added, removed = latest.keys() - existing, []
+    elif operation == "delete":
+        added, removed = (), sorted(latest.keys() & existing)
+        lookup.delete_rows(session, table, [key, "package_id"], removed)
+    else:
+        raise ValueError(f"Unknown operation in the changeset: {operation}.")
+
+    apply_changes(session, added, removed)
+    history.record_changes(session, table, added, removed)
+
+    session.execute(
+        insert(ChangeLog),
+        [
+            {
+                "seq": change[0],
+                "table_name": table_name,
+                "operation": operation,
+                "key_id": key_ids[change[3]],
+                "package_id": package_ids[change[4]],
+                "path": change[5],
+                "hash": None if change[6] is None else bytes.fromhex(change[6]),
+            }
+            for change in changes
+        ],
+    )
+
+
+def apply_changes(session: Session, changeset: Dict) -> int:
+    """
+    Replays a changeset exported by `export_changes` onto the database, skipping
+    the changes it already has.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        changeset (Dict): The changeset.
+
+    Returns:
+        int: The number of changes applied.
+    """
+    if changeset.get("format") != FORMAT or changeset.get("version") not in (
+        1,
+        FORMAT_VERSION,
+    ):
+        raise ValueError("Not a cfdb changeset, or of an unsupported version.")
+
+    current = last_seq(session)
+    if changeset["since"] > current:
+        raise ValueError(
+            f"The changeset starts after change {changeset['since']}, but the "
+            f"database is at change {current}: export the changes since {current}."
+        )
+
+    changes = [change for change in changeset["changes"] if change[0] > current]
+    tree = None
+    for (table_name, operation), run in groupby(
+        changes, key=lambda change: (change[1], change[2])
+    ):
+        if table_name == Artifacts.__tablename__:
+            if tree is None:
+                tree = artifacts.FilePathTree(session)
+            _apply_artifact_run(session, tree, operation, list(run))
+        else:
+            _apply_run(session, table_name, operation, list(run))
+
+    if changes:
+        if session.get_bind().dialect.name == "postgresql":
+            # the sequence numbers were inserted explicitly
+            session.execute(
+                text(
+                    "SELECT setval(pg_get_serial_sequence('change_log', 'seq'), "
+                    "(SELECT max(seq) FROM change_log))"
+                )
+            )
+        bump_data_version(session)
+    return len(changes)
+
+
+def _open(path: Path, mode: str):
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def write_changeset(changeset: Dict, path: Path) -> None:
+    """
+    Writes a changeset to a JSON file, gzip compressed if its name ends with .gz.
+    """
+    with _open(path, "w") as f:
+        json.dump(changeset, f, separators=(",", ":"))
+
+
+def read_changeset(path: Path) -> Dict:
+    """
+    Reads a changeset written by `write_changeset`.
+    """
+    with _open(path, "r") as f:
+        return json.load(f)
@@ -0,0 +1,169 @@
+import json
+from typing import BinaryIO, Callable, Dict, Iterator, List, Tuple
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - optional dependency
+    ijson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - optional dependency
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# JSON decoders available in this environment, fastest first
+LOADERS: Dict[str, Callable[[bytes], object]] = {}
+
+if msgspec is not None:
+
+    class ImportSet(msgspec.Struct, gc=False):
+        """
+        A set of packages as serialized by libcfgraph, ``{"__set__": true,
+        "elements": [...]}``. Unknown keys are skipped without being decoded.
+        """
+
+        elements: List[str]
+
+    class ArtifactIndex(msgspec.Struct, gc=False):
+        """
+        The index of an artifact, its conda package metadata.
+        """
+
+        name: str
+        version: str
+        subdir: str = ""
+
+    class ArtifactBlob(msgspec.Struct, gc=False):
+        """
+        An artifact as serialized by libcfgraph. Only the index and the file listing
+        are decoded, the recipes and the other metadata are skipped.
+        """
+
+        index: ArtifactIndex
+        files: List[str] = []
+
+    _OUTPUT_BLOB_DECODER = msgspec.json.Decoder(Dict[str, List[str]])
+    _ARTIFACT_DECODER = msgspec.json.Decoder(ArtifactBlob)
+    _IMPORT_MAP_DECODER = msgspec.json.Decoder(Dict[str, ImportSet])
+    LOADERS["msgspec"] = msgspec.json.decode
+
+if orjson is not None:
+    LOADERS["orjson"] = orjson.loads
+
+LOADERS["json"] = json.loads
+
+BACKEND = next(iter(LOADERS))
+
+
+def decode_output_blob(data: bytes, backend: str = None) -> List[str]:
+    """
+    Decodes a feedstock output blob into the list of feedstocks building the package.
+
+    Args:
+        data (bytes): The content of the output blob.
+        backend (str, optional): The decoder to use, one of `LOADERS`. Defaults to the
+            fastest available decoder.
+
+    Returns:
+        List[str]: A list of associated feedstock names.
+    """
+    backend = backend or BACKEND
+    if backend == "msgspec":
+        payload = _OUTPUT_BLOB_DECODER.decode(data)
+    else:
+        payload = LOADERS[backend](data)
+
+    _, associated_feedstocks = payload.popitem()
+    return associated_feedstocks
+
+
+def decode_import_map(data: bytes, backend: str = None) -> Dict[str, List[str]]:
+    """
+    Decodes an import to package map partition, inverting it on the way into the
+    packages to imports mapping consumed by the writer.
+
+    Args:
+        data (bytes): The content of the partition blob.
+        backend (str, optional): The decoder to use, one of `LOADERS`. Defaults to the
+            fastest available decoder.
+
+    Returns:
+        Dict[str, List[str]]: The import names provided by each package.
+    """
+    backend = backend or BACKEND
+    if backend == "msgspec":
+        import_sets = _IMPORT_MAP_DECODER.decode(data).items()
+        entries = ((name, import_set.elements) for name, import_set in import_sets)
+    else:
+        import_sets = LOADERS[backend](data).items()
+        entries = ((name, import_set["elements"]) for name, import_set in import_sets)
+
+    packages_to_imports = {}
+    for import_name, package_names in entries:
+        for package_name in package_names:
+            imports = packages_to_imports.get(package_name)
+            if imports is None:
+                packages_to_imports[package_name] = [import_name]
+            else:
+                imports.append(import_name)
+    return packages_to_imports
+
+
+def decode_artifact(
+    data: bytes, backend: str = None
+) -> Tuple[str, str, str, List[str]]:
+    """
+    Decodes an artifact blob into its package metadata and file listing.
+
+    Args:
+        data (bytes): The content of the artifact blob.
+        backend (str, optional): The decoder to use, one of `LOADERS`. Defaults to the
+            fastest available decoder.
+
+    Returns:
+        Tuple[str, str, str, List[str]]: The package name, version, platform (empty
+            if the index has no subdir) and the paths of the files of the artifact.
+    """
+    backend = backend or BACKEND
+    if backend == "msgspec":
+        artifact = _ARTIFACT_DECODER.decode(data)
+        index = artifact.index
+        return index.name, index.version, index.subdir, artifact.files
+
+    artifact = LOADERS[backend](data)
+    index = artifact["index"]
+    return (
+        index["name"],
+        index["version"],
+        index.get("subdir", ""),
+        artifact.get("files", []),
+    )
+
+
+def iter_import_map(file: BinaryIO) -> Iterator[Tuple[str, str]]:
+    """
+    Streams the (package name, import name) pairs of an import to package map
+    partition. With ijson installed only one import entry is held in memory at a
+    time, whatever the size of the partition; otherwise the whole partition is
+    decoded first.
+
+    Args:
+        file (BinaryIO): The partition blob, opened in binary mode.
+
+    Yields:
+        Tuple[str, str]: The package name and one of the import names it provides.
+    """
+    if ijson is None:
+        for package_name, imports in decode_import_map(file.read()).items():
+            for import_name in imports:
+                yield package_name, import_name
+        return
+
+    for import_name, import_set in ijson.kvitems(file, ""):
+        for package_name in import_set["elements"]:
+            yield package_name, import_name
@@ -1,179 +1,346 @@
+import asyncio
+import concurrent.futures
+from functools import partial
 from pathlib import Path
-from tempfile import TemporaryDirectory
-from typing import List, Set, Tuple
+from typing import List, Optional, Set, Tuple
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from cfdb.log import logger, progressBar
-from cfdb.models.schema import FeedstockOutputs, Feedstocks, Packages, uniq_id
-from cfdb.populate.utils import (
-    retrieve_associated_feedstock_from_output_blob,
-    traverse_files,
-)
+from cfdb.models.migrations import bump_data_version
+from cfdb.models.schema import FeedstockOutputs, Feedstocks, Packages
+from cfdb.populate import changelog, history, lookup
+from cfdb.populate.cache import ParseCache
+from cfdb.populate.decoding import decode_output_blob
+from cfdb.populate.loaders import chunked, ensure_ids, upsert
+from cfdb.populate.utils import list_json_files, read_changed_blob
 
+# (file_rel_path, file_hash, package_name, feedstock_names)
+OutputRecord = Tuple[Path, str, str, List[str]]
 
-def _compare_files(
-    feedstock_outputs: List[Tuple[str, str, int]],
-    stored_files: List[Path],
-    root_dir: Path,
-) -> Set[Path]:
+
+def _database_files(session: Session) -> Set[Tuple[Path, str]]:
     """
-    Compares the feedstock outputs from the database with the stored files, and returns a set of files that were not present in the database or have changed hashes.
+    Returns the output blobs currently stored in the database.
 
     Args:
-        feedstock_outputs (List[Tuple[str, str, int]]): List of tuples containing the path, hash, and id of feedstock outputs from the database.
-        stored_files (List[Path]): List of paths to the stored files.
-        root_dir (Path): The root directory of the stored files.
+        session (Session): The SQLAlchemy session object.
 
     Returns:
-        Set[Path]: A set of file paths (relative to root_dir) that were not present in the database or have changed hashes.
+        Set[Tuple[Path, str]]: A set of (relative file path, hexadecimal SHA-1 hash) tuples.
     """
-    db_files = {(Path(row[0]), row[1]) for row in feedstock_outputs}
-    stored_files_set = set()
+    rows = session.query(FeedstockOutputs.path, FeedstockOutputs.hash).distinct()
+    return {(Path(row[0]), row[1].hex()) for row in rows}
 
-    for stored_file in stored_files:
-        with open(stored_file, "r") as f:
-            for line in f:
-                file_path, file_hash = line.strip().split(",")
-                stored_files_set.add((Path(file_path).relative_to(root_dir), file_hash))
 
-    changed_files = stored_files_set - db_files
+def _parse_output(
+    file: Path, file_hash: str, data: bytes, cache: Optional[ParseCache] = None
+) -> OutputRecord:
+    """
+    Parses a feedstock output blob into the record consumed by the writer.
 
-    if len(changed_files) > 0:
-        logger.info(f"Detected {len(changed_files)} modified files.")
+    Args:
+        file (Path): The path to the output blob (relative to the root directory).
+        file_hash (str): The SHA-1 hash of the file.
+        data (bytes): The content of the file.
+        cache (ParseCache, optional): Cache of the parsed blobs, keyed by their hash.
+            Defaults to None.
 
-    return changed_files
+    Returns:
+        OutputRecord: The relative path, hash, package name and associated feedstocks.
+    """
+    associated_package_name = file.stem
+    parse = partial(decode_output_blob, data)
+    if cache is None:
+        associated_feedstocks = parse()
+    else:
+        associated_feedstocks = cache.get_or_parse(
+            "feedstock_outputs", file_hash, parse, size=len(data)
+        )
+    logger.debug(
+        f"Associated package name: '{associated_package_name}' :: Associated feedstocks: '{associated_feedstocks}'"
+    )
+    return file, file_hash, associated_package_name, associated_feedstocks
 
 
-def _update_feedstock_outputs(
-    session: Session,
-    file_rel_path: Path,
-    file_hash: str,
-    package_name: str,
-    feedstock_name: str,
-) -> Session:
+def _process_output(
+    root_dir: Path,
+    db_files: Set[Tuple[Path, str]],
+    cache: Optional[ParseCache],
+    file: str,
+) -> Optional[OutputRecord]:
     """
-    Update or create the feedstock outputs in the database for a given feedstock.
+    Reads an output blob once, and parses it if it is not in the database yet.
 
     Args:
-        session (Session): The SQLAlchemy session object.
-        file_rel_paht (Path): The path to the feedstock output file (relative to the root directory of the feedstock outputs).
-        file_hash (str): The SHA-1 hash of the file.
-        package_name (str): The name of the associated package.
-        feedstock_name (str): The name of the feedstock.
+        root_dir (Path): The root directory of the feedstock outputs.
+        db_files (Set[Tuple[Path, str]]): The output blobs stored in the database.
+        cache (ParseCache, optional): Cache of the parsed blobs, keyed by their hash.
+        file (str): The path to the output blob.
 
     Returns:
-        Session: The updated SQLAlchemy session object.
+        Optional[OutputRecord]: The parsed blob, or None if it is unchanged.
+    """
+    blob = read_changed_blob(root_dir, file, db_files)
+    if blob is None:
+        return None
+    return _parse_output(*blob, cache)
+
+
+def _current_outputs(session: Session, package_ids: List[int]) -> Set[Tuple[int, int]]:
+    """
+    Returns the (feedstock_id, package_id) of the feedstock outputs of the packages.
     """
-    feedstock = (
-        session.query(Feedstocks)
-        .filter(
-            Feedstocks.name == feedstock_name,
+    outputs = set()
+    for package_ids_batch in chunked(sorted(package_ids), 500):
+        rows = session.execute(
+            select(FeedstockOutputs.feedstock_id, FeedstockOutputs.package_id).where(
+                FeedstockOutputs.package_id.in_(package_ids_batch)
+            )
         )
-        .first()
+        outputs.update(tuple(row) for row in rows)
+    return outputs
+
+
+def _write_feedstock_outputs(session: Session, records: List[OutputRecord]) -> None:
+    """
+    Bulk inserts the packages, feedstocks and feedstock outputs of a batch of parsed
+    output blobs. Existing feedstock outputs get their path and hash updated, the
+    ones no longer listed by their blob are deleted, the changes are propagated to
+    the import to feedstock lookup and recorded in the history and the change log,
+    and the data version of the database is bumped.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        records (List[OutputRecord]): The parsed output blobs.
+    """
+    package_ids = ensure_ids(
+        session, Packages.__table__, (record[2] for record in records)
+    )
+    feedstock_ids = ensure_ids(
+        session,
+        Feedstocks.__table__,
+        (name for record in records for name in record[3]),
     )
 
-    if not feedstock:
-        logger.debug(
-            f"Feedstock [bold blue]{feedstock_name}[/] not found in database. Proceeding to create it and its feedstock output."
-        )
-        feedstock = Feedstocks(
-            name=feedstock_name,
-        )
-        session.add(feedstock)
+    outputs = {}
+    for file_rel_path, file_hash, package_name, feedstock_names in records:
+        package_id = package_ids[package_name]
+        for feedstock_name in feedstock_names:
+            feedstock_id = feedstock_ids[feedstock_name]
+            outputs[(feedstock_id, package_id)] = {
+                "feedstock_id": feedstock_id,
+                "package_id": package_id,
+                "path": file_rel_path.as_posix(),
+                "hash": bytes.fromhex(file_hash),
+            }
 
-    feedstock_output = (
-        session.query(FeedstockOutputs)
-        .filter(
-            FeedstockOutputs.feedstock_name == feedstock.name,
-            FeedstockOutputs.package_name == package_name,
-        )
-        .first()
+    # a package is only ever listed by its own output blob
+    current = _current_outputs(session, list(package_ids.values()))
+    upsert(
+        session,
+        FeedstockOutputs.__table__,
+        list(outputs.values()),
+        index_elements=["feedstock_id", "package_id"],
+        update_columns=["path", "hash"],
     )
+    removed = sorted(current - outputs.keys())
+    lookup.delete_rows(
+        session, FeedstockOutputs.__table__, ["feedstock_id", "package_id"], removed
+    )
+    added = outputs.keys() - current
+    lookup.apply_output_changes(session, added, removed)
+    history.record_changes(session, FeedstockOutputs.__table__, added, removed)
+    changelog.record_changes(
+        session, FeedstockOutputs.__table__, outputs.values(), removed
+    )
+    bump_data_version(session)
 
-    if feedstock_output:
-        logger.debug(
-            f"Feedstock [bold blue]{feedstock_name}[/] found in database. Proceeding to update its feedstock output."
-        )
-        feedstock_output.hash = file_hash
-        session.add(feedstock_output)
-        return session
-
-    new_feedstock_output = FeedstockOutputs(
-        id=uniq_id(),
-        path=file_rel_path.as_posix(),
-        feedstock_name=feedstock.name,
-        package_name=package_name,
-        hash=file_hash,
+
+def _delete_outputs(session: Session, outputs: List[Tuple[int, int]]) -> None:
+    """
+    Deletes (feedstock_id, package_id) feedstock outputs, and propagates the
+    deletions to the import to feedstock lookup, the history and the change log.
+    """
+    lookup.delete_rows(
+        session, FeedstockOutputs.__table__, ["feedstock_id", "package_id"], outputs
     )
-    session.add(new_feedstock_output)
-    return session
+    lookup.apply_output_changes(session, (), outputs)
+    history.record_changes(session, FeedstockOutputs.__table__, (), outputs)
+    changelog.record_changes(session, FeedstockOutputs.__table__, (), outputs)
+
+
+def delete_removed_outputs(session: Session, paths: Set[str]) -> int:
+    """
+    Deletes the feedstock outputs of the stored blobs that are not listed anymore,
+    i.e. whose blob was removed.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        paths (Set[str]): The path of every output blob, relative to the root
+            directory.
+
+    Returns:
+        int: The number of removed blobs.
+    """
+    stored = session.execute(select(FeedstockOutputs.path).distinct())
+    removed = sorted(set(stored.scalars()) - paths)
+
+    for paths_batch in chunked(removed, 500):
+        rows = session.execute(
+            select(FeedstockOutputs.feedstock_id, FeedstockOutputs.package_id).where(
+                FeedstockOutputs.path.in_(paths_batch)
+            )
+        )
+        _delete_outputs(session, [tuple(row) for row in rows])
+    if removed:
+        bump_data_version(session)
+    return len(removed)
+
+
+def list_outputs(root_dir: Path, files: List[str]) -> Set[str]:
+    """
+    Returns the paths of output blobs, relative to the root directory.
+    """
+    return {Path(file).relative_to(root_dir).as_posix() for file in files}
 
 
-def update(session: Session, path: Path):
+def update(
+    session: Session,
+    path: Path,
+    batch_size: int = 100,
+    files: Optional[List[str]] = None,
+    cache: Optional[ParseCache] = None,
+):
     """
     Updates feedstock outputs in the database based on the comparison between the stored data and the current data.
 
+    Each blob is read once: its hash is computed from the buffer and compared with
+    the database, and only changed blobs get the same buffer parsed and written.
+
     Args:
         session (Session): The database session.
         path (Path): The path to the directory containing the JSON files.
+        batch_size (int, optional): Number of files read per transaction. Defaults to 100.
+        files (List[str], optional): Subset of the JSON files under `path` to consider.
+            Defaults to None, meaning every JSON file, in which case the feedstock
+            outputs whose blob was removed are deleted.
+        cache (ParseCache, optional): Cache of the parsed blobs, shared between runs.
+            Defaults to None, meaning a fresh in-memory cache for this run.
     """
+    cache = ParseCache() if cache is None else cache
     logger.info("Updating feedstocks...")
-    logger.debug("Creating temporary directory...")
-    _tmp_dir = TemporaryDirectory()
-    tmp_dir = Path(_tmp_dir.name)
 
     logger.info("Querying database for feedstock outputs...")
-    feedstock_outputs = session.query(
-        FeedstockOutputs.path, FeedstockOutputs.hash, FeedstockOutputs.id
-    ).all()
-
-    logger.info(f"Traversing files in {path}...")
-    stored_files = traverse_files(path, tmp_dir)
-
-    logger.info("Comparing files...")
-    changed_files = _compare_files(feedstock_outputs, stored_files, root_dir=path)
-
-    if len(changed_files) == 0:
-        logger.info("No changes detected. Exiting...")
-        return
-
-    with progressBar:
-        for idx, (file, file_hash) in enumerate(
-            progressBar.track(changed_files, description="Updating feedstocks...")
-        ):
-            associated_package_name = file.stem
-            associated_feedstocks = retrieve_associated_feedstock_from_output_blob(
-                file=path / file  # Need to use the absolute path here
-            )
-            logger.debug(
-                f"Associated package name: '{associated_package_name}' :: Associated feedstocks: '{associated_feedstocks}'"
-            )
-            package = (
-                session.query(Packages)
-                .filter(Packages.name == associated_package_name)
-                .first()
-            )
+    db_files = _database_files(session)
+
+    listed_all = files is None
+    if listed_all:
+        files = list_json_files(path)
+    logger.info(f"Reading {len(files)} files in {path}...")
 
-            if not package:
-                logger.debug(
-                    f"Package '{associated_package_name}' not found in database. Proceeding to create it and its feedstock outputs."
-                )
-                package = Packages(
-                    name=associated_package_name,
-                )
-                session.add(package)
-
-            for feedstock_name in associated_feedstocks:
-                session = _update_feedstock_outputs(
-                    session=session,
-                    file_rel_path=file,
-                    file_hash=file_hash,
-                    package_name=package.name,
-                    feedstock_name=feedstock_name,
-                )
-
-            if idx % 100 == 0:
+    process = partial(_process_output, path, db_files, cache)
+    num_changed = 0
+    with concurrent.futures.ThreadPoolExecutor() as executor, progressBar:
+        task = progressBar.add_task("Updating feedstocks...", total=len(files))
+        for batch in chunked(files, batch_size):
+            records = [record for record in executor.map(process, batch) if record]
+            if records:
+                _write_feedstock_outputs(session, records)
                 session.commit()
+                num_changed += len(records)
+            progressBar.advance(task, len(batch))
 
+    if listed_all:
+        num_changed += delete_removed_outputs(session, list_outputs(path, files))
         session.commit()
+
+    if num_changed == 0:
+        logger.info("No changes detected.")
+    else:
+        logger.info(f"Updated {num_changed} modified files.")
+
+    cache.flush()
+    logger.info(cache.summary())
+
+
+async def update_async(
+    session_maker,
+    path: Path,
+    file_semaphore: asyncio.Semaphore,
+    db_semaphore: asyncio.Semaphore,
+    batch_size: int = 100,
+    cache: Optional[ParseCache] = None,
+    num_workers: int = 4,
+):
+    """
+    Asynchronous counterpart of `update`. A pool of workers takes the batches of
+    files in turn: each worker reads, hashes and parses its batch in executor tasks
+    bounded by `file_semaphore`, then writes it in a session bounded by
+    `db_semaphore` before taking the next one, so that at most `num_workers` parsed
+    batches are held in memory. The feedstock outputs whose blob was removed are
+    then deleted.
+
+    Args:
+        session_maker (async_sessionmaker): Factory for the asynchronous sessions.
+        path (Path): The path to the directory containing the JSON files.
+        file_semaphore (asyncio.Semaphore): Bounds the number of concurrent file reads.
+        db_semaphore (asyncio.Semaphore): Bounds the number of concurrent writers.
+        batch_size (int, optional): Number of files read per transaction. Defaults to 100.
+        cache (ParseCache, optional): Cache of the parsed blobs, shared between runs.
+            Defaults to None, meaning a fresh in-memory cache for this run.
+        num_workers (int, optional): Number of batches processed concurrently.
+            Defaults to 4.
+    """
+    cache = ParseCache() if cache is None else cache
+    logger.info("Updating feedstocks...")
+
+    logger.info("Querying database for feedstock outputs...")
+    async with session_maker() as session:
+        db_files = await session.run_sync(_database_files)
+
+    loop = asyncio.get_running_loop()
+    files = await loop.run_in_executor(None, list_json_files, path)
+    logger.info(f"Reading {len(files)} files in {path}...")
+
+    process = partial(_process_output, path, db_files, cache)
+
+    async def _process(file: str) -> Optional[OutputRecord]:
+        async with file_semaphore:
+            return await loop.run_in_executor(None, process, file)
+
+    batches = iter(chunked(files, batch_size))
+
+    async def _worker() -> int:
+        num_changed = 0
+        for batch in batches:
+            records = [
+                record
+                for record in await asyncio.gather(*(_process(file) for file in batch))
+                if record
+            ]
+            if records:
+                async with db_semaphore:
+                    async with session_maker() as session:
+                        await session.run_sync(_write_feedstock_outputs, records)
+                        await session.commit()
+                num_changed += len(records)
+        return num_changed
+
+    num_changed = sum(await asyncio.gather(*(_worker() for _ in range(num_workers))))
+
+    async with db_semaphore:
+        async with session_maker() as session:
+            num_changed += await session.run_sync(
+                delete_removed_outputs, list_outputs(path, files)
+            )
+            await session.commit()
+
+    if num_changed == 0:
+        logger.info("No changes detected.")
+    else:
+        logger.info(f"Updated {num_changed} modified files.")
+
+    cache.flush()
+    logger.info(cache.summary())
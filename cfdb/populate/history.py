@@ -0,0 +1,96 @@
+"""
+Validity intervals of the fact tables, answering lookups as of a past time.
+
+Every feedstock output and import to package map gets a row in its history table
+when it is inserted, opened at the time of the write (valid_from), and closed
+(valid_to) when it is deleted; a row that comes back opens a new interval. The
+writers record the same inserted and deleted keys they propagate to the import to
+feedstock lookup, in the same transaction, so the history costs one row per change
+instead of one copy of the database per snapshot.
+
+A row was valid at time t when ``valid_from <= t`` and ``valid_to`` is NULL or
+``> t``. The history tables are keyed so that an as-of lookup is a range read of
+the versions of the looked up name.
+"""
+
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Tuple, Union
+
+from sqlalchemy import Table, bindparam, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from cfdb.models.schema import (
+    FeedstockOutputs,
+    FeedstockOutputsHistory,
+    ImportToPackageMaps,
+    ImportToPackageMapsHistory,
+)
+from cfdb.populate.loaders import _dialect_insert
+
+Bind = Union[Connection, Session]
+
+# fact table -> (history table, key columns)
+HISTORY = {
+    FeedstockOutputs.__tablename__: (
+        FeedstockOutputsHistory.__table__,
+        ("feedstock_id", "package_id"),
+    ),
+    ImportToPackageMaps.__tablename__: (
+        ImportToPackageMapsHistory.__table__,
+        ("import_id", "package_id"),
+    ),
+}
+
+
+def utcnow() -> datetime:
+    """
+    Returns the current UTC time, as the naive datetime stored in the history.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def record_changes(
+    bind: Bind,
+    table: Table,
+    added: Iterable[Tuple[int, int]],
+    removed: Iterable[Tuple[int, int]] = (),
+    at: Optional[datetime] = None,
+) -> None:
+    """
+    Opens the validity intervals of the inserted rows of a fact table, and closes
+    those of the deleted rows.
+
+    Args:
+        bind (Union[Connection, Session]): The SQLAlchemy session or connection.
+        table (Table): The fact table, one of `HISTORY`.
+        added (Iterable[Tuple[int, int]]): The primary keys of the inserted rows.
+        removed (Iterable[Tuple[int, int]], optional): The primary keys of the
+            deleted rows. Defaults to ().
+        at (datetime, optional): UTC time of the changes. Defaults to now.
+    """
+    history, (first, second) = HISTORY[table.name]
+    at = utcnow() if at is None else at
+
+    removed = sorted(removed)
+    if removed:
+        bind.execute(
+            update(history)
+            .where(history.c[first] == bindparam("_first"))
+            .where(history.c[second] == bindparam("_second"))
+            .where(history.c.valid_to.is_(None))
+            .values(valid_to=at),
+            [{"_first": a, "_second": b} for a, b in removed],
+        )
+
+    rows = [
+        {first: a, second: b, "valid_from": at, "valid_to": None}
+        for a, b in sorted(added)
+    ]
+    if rows:
+        # a row deleted and inserted again within the same instant stays open
+        stmt = _dialect_insert(bind, history)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[first, second, "valid_from"], set_={"valid_to": None}
+        )
+        bind.execute(stmt, rows)
@@ -1,113 +1,497 @@
+import asyncio
+import concurrent.futures
+import os
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from tempfile import TemporaryDirectory
-from typing import List, Set, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from cfdb.log import logger, progressBar
-from cfdb.models.schema import ImportToPackageMaps, Packages, uniq_id
-from cfdb.populate.utils import traverse_files, retrieve_import_maps_from_output_blob
+from cfdb.models.migrations import bump_data_version
+from cfdb.models.schema import ImportNames, ImportToPackageMaps, Packages
+from cfdb.populate import changelog, history, lookup
+from cfdb.populate.cache import ParseCache
+from cfdb.populate.decoding import decode_import_map, iter_import_map
+from cfdb.populate.loaders import chunked, ensure_ids, upsert
+from cfdb.populate.utils import hash_file, list_json_files, read_changed_blob
 
+# (partition, file_hash, {package_name: [import_name, ...]})
+ImportMapRecord = Tuple[str, str, Dict[str, List[str]]]
 
-def _decompose_filename(filename_handle: str):
-    try:
-        package_name, partition = filename_handle.split(".")
-    except ValueError as e:
-        # We assume that typeerror will only happen when filename
-        # is likely name.. (with the extra dot)
-        package_name = filename_handle
-        partition = ""
-    return package_name, partition
+# Partitions larger than this (in bytes) are streamed instead of read in one go
+STREAM_THRESHOLD = 64 * 2**20
+# Number of (import, package) pairs written per batch of a streamed partition
+STREAM_BATCH_SIZE = 10000
 
 
-def _compare_files(
-    feedstock_outputs: List[Tuple[str, str, int]],
-    stored_files: List[Path],
+def _database_files(session: Session) -> Set[Tuple[Path, str]]:
+    """
+    Returns the partition blobs currently stored in the database.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+
+    Returns:
+        Set[Tuple[Path, str]]: A set of (relative file path, hexadecimal SHA-1 hash) tuples.
+    """
+    rows = session.query(
+        ImportToPackageMaps.partition, ImportToPackageMaps.hash
+    ).distinct()
+    return {(Path(f"{row[0]}.json"), row[1].hex()) for row in rows}
+
+
+def _parse_import_map(
+    file: Path, file_hash: str, data: bytes, cache: Optional[ParseCache] = None
+) -> ImportMapRecord:
+    """
+    Parses an import to package map partition into the record consumed by the writer.
+
+    Args:
+        file (Path): The path to the partition blob (relative to the root directory).
+        file_hash (str): The SHA-1 hash of the file.
+        data (bytes): The content of the file.
+        cache (ParseCache, optional): Cache of the parsed blobs, keyed by their hash.
+            Defaults to None.
+
+    Returns:
+        ImportMapRecord: The partition, hash and package to imports mapping.
+    """
+    partition = file.with_suffix("").as_posix()
+
+    parse = partial(decode_import_map, data)
+    if cache is None:
+        import_map_data_blob = parse()
+    else:
+        import_map_data_blob = cache.get_or_parse(
+            "import_to_package_maps", file_hash, parse, size=len(data)
+        )
+    return partition, file_hash, import_map_data_blob
+
+
+def _process_import_map(
     root_dir: Path,
-) -> Set[Path]:
-    # (package_name.partition, hash)
-    db_files = {(Path(f"{row[0]}.{row[1]}.json"), row[2]) for row in feedstock_outputs}
-    stored_files_set = set()
+    db_files: Set[Tuple[Path, str]],
+    cache: Optional[ParseCache],
+    file: str,
+) -> Optional[ImportMapRecord]:
+    """
+    Reads a partition blob once, and parses it if it is not in the database yet.
+
+    Args:
+        root_dir (Path): The root directory of the import to package maps.
+        db_files (Set[Tuple[Path, str]]): The partition blobs stored in the database.
+        cache (ParseCache, optional): Cache of the parsed blobs, keyed by their hash.
+        file (str): The path to the partition blob.
+
+    Returns:
+        Optional[ImportMapRecord]: The parsed blob, or None if it is unchanged.
+    """
+    blob = read_changed_blob(root_dir, file, db_files)
+    if blob is None:
+        return None
+    return _parse_import_map(*blob, cache)
+
+
+def _current_mappings(session: Session, import_ids: List[int]) -> Set[Tuple[int, int]]:
+    """
+    Returns the (import_id, package_id) of the mappings of the import names.
+    """
+    mappings = set()
+    for import_ids_batch in chunked(sorted(import_ids), 500):
+        rows = session.execute(
+            select(ImportToPackageMaps.import_id, ImportToPackageMaps.package_id).where(
+                ImportToPackageMaps.import_id.in_(import_ids_batch)
+            )
+        )
+        mappings.update(tuple(row) for row in rows)
+    return mappings
 
-    for stored_file in stored_files:
-        with open(stored_file, "r") as f:
-            for line in f:
-                file_path, file_hash = line.strip().split(",")
-                stored_files_set.add((Path(file_path).relative_to(root_dir), file_hash))
 
-    changed_files = stored_files_set - db_files
+def _delete_stale_mappings(session: Session, partitions: Dict[str, str]) -> None:
+    """
+    Deletes the mappings of rewritten partitions which still have their previous
+    hash, i.e. which are no longer listed by the partition, and propagates the
+    deletions to the import to feedstock lookup, the history and the change log.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        partitions (Dict[str, str]): The new hexadecimal hash of each partition.
+    """
+    stale = []
+    for partitions_batch in chunked(sorted(partitions), 500):
+        rows = session.execute(
+            select(
+                ImportToPackageMaps.import_id,
+                ImportToPackageMaps.package_id,
+                ImportToPackageMaps.partition,
+                ImportToPackageMaps.hash,
+            ).where(ImportToPackageMaps.partition.in_(partitions_batch))
+        )
+        stale.extend(
+            (import_id, package_id)
+            for import_id, package_id, partition, file_hash in rows
+            if file_hash.hex() != partitions[partition]
+        )
+    _delete_mappings(session, stale)
+
+
+def _delete_mappings(session: Session, mappings: List[Tuple[int, int]]) -> None:
+    """
+    Deletes (import_id, package_id) mappings, and propagates the deletions to the
+    import to feedstock lookup, the history and the change log.
+    """
+    lookup.delete_rows(
+        session, ImportToPackageMaps.__table__, ["import_id", "package_id"], mappings
+    )
+    lookup.apply_mapping_changes(session, (), mappings)
+    history.record_changes(session, ImportToPackageMaps.__table__, (), mappings)
+    changelog.record_changes(session, ImportToPackageMaps.__table__, (), mappings)
+
+
+def delete_removed_partitions(session: Session, partitions: Set[str]) -> int:
+    """
+    Deletes the mappings of the stored partitions that are not listed anymore,
+    i.e. whose blob was removed, and those migrated from a version 1 database,
+    whose partition names do not match a blob (see cfdb.models.migrations).
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        partitions (Set[str]): Every partition of the import to package maps.
 
-    if len(changed_files) > 0:
-        logger.info(f"Detected {len(changed_files)} modified files.")
+    Returns:
+        int: The number of removed partitions.
+    """
+    stored = session.execute(select(ImportToPackageMaps.partition).distinct())
+    removed = sorted(set(stored.scalars()) - partitions)
 
-    return changed_files
+    for partitions_batch in chunked(removed, 500):
+        rows = session.execute(
+            select(ImportToPackageMaps.import_id, ImportToPackageMaps.package_id).where(
+                ImportToPackageMaps.partition.in_(partitions_batch)
+            )
+        )
+        _delete_mappings(session, [tuple(row) for row in rows])
+    if removed:
+        bump_data_version(session)
+    return len(removed)
 
 
-def update(session: Session, path: Path):
+def list_partitions(root_dir: Path, files: List[str]) -> Set[str]:
+    """
+    Returns the partitions of import to package map blobs, i.e. their path relative
+    to the root directory without the suffix.
+
+    Args:
+        root_dir (Path): The root directory of the import to package maps.
+        files (List[str]): The paths to the partition blobs.
+
+    Returns:
+        Set[str]: The partitions.
+    """
+    return {
+        Path(file).relative_to(root_dir).with_suffix("").as_posix() for file in files
+    }
+
+
+def _write_import_maps(
+    session: Session, records: List[ImportMapRecord], delete_stale: bool = True
+) -> None:
+    """
+    Bulk inserts the packages, import names and import to package mappings of a
+    batch of parsed partitions. Existing mappings get their partition and hash
+    updated, the ones no longer listed by their partition are deleted, the changes
+    are propagated to the import to feedstock lookup and recorded in the history
+    and the change log, and the data version of the database is bumped.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        records (List[ImportMapRecord]): The parsed partitions.
+        delete_stale (bool, optional): Whether the records hold whole partitions,
+            so that the mappings they no longer list can be deleted and the data
+            version bumped. Otherwise, both are left to the caller once the
+            partitions are complete. Defaults to True.
+    """
+    package_ids = ensure_ids(
+        session,
+        Packages.__table__,
+        (package_name for record in records for package_name in record[2]),
+    )
+    import_ids = ensure_ids(
+        session,
+        ImportNames.__table__,
+        (
+            _import
+            for record in records
+            for imports in record[2].values()
+            for _import in imports
+        ),
+    )
+
+    mappings = {}
+    for partition, file_hash, import_map_data_blob in records:
+        # a dictionary containing the package names and their respective imports
+        for package_name, imports in import_map_data_blob.items():
+            package_id = package_ids[package_name]
+            for _import in imports:
+                import_id = import_ids[_import]
+                mappings[(import_id, package_id)] = {
+                    "import_id": import_id,
+                    "package_id": package_id,
+                    "partition": partition,
+                    "hash": bytes.fromhex(file_hash),
+                }
+
+    current = _current_mappings(session, list(import_ids.values()))
+    upsert(
+        session,
+        ImportToPackageMaps.__table__,
+        list(mappings.values()),
+        index_elements=["import_id", "package_id"],
+        update_columns=["partition", "hash"],
+    )
+    added = mappings.keys() - current
+    lookup.apply_mapping_changes(session, added)
+    history.record_changes(session, ImportToPackageMaps.__table__, added)
+    changelog.record_changes(session, ImportToPackageMaps.__table__, mappings.values())
+    if delete_stale:
+        _delete_stale_mappings(
+            session, {partition: file_hash for partition, file_hash, _ in records}
+        )
+        bump_data_version(session)
+
+
+def _stream_import_map(
+    session: Session,
+    root_dir: Path,
+    db_files: Set[Tuple[Path, str]],
+    file: str,
+    batch_size: Optional[int] = None,
+) -> bool:
+    """
+    Writes a partition blob too large to be held in memory. The blob is hashed and
+    decoded incrementally, and its (import, package) pairs are written in batches
+    of at most `batch_size` rows, before the mappings it no longer lists are
+    deleted and the data version bumped once. The batches belong to a single
+    transaction, committed by the caller, so that an interrupted partition is not
+    mistaken for an up-to-date one on the next run.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        root_dir (Path): The root directory of the import to package maps.
+        db_files (Set[Tuple[Path, str]]): The partition blobs stored in the database.
+        file (str): The path to the partition blob.
+        batch_size (int, optional): Maximum number of pairs per batch.
+            Defaults to STREAM_BATCH_SIZE.
+
+    Returns:
+        bool: Whether the partition changed.
+    """
+    file_rel_path = Path(file).relative_to(root_dir)
+    file_hash = hash_file(file)
+    if (file_rel_path, file_hash) in db_files:
+        return False
+
+    batch_size = batch_size or STREAM_BATCH_SIZE
+    partition = file_rel_path.with_suffix("").as_posix()
+    logger.debug(f"Streaming partition '{partition}'...")
+    with open(file, "rb") as f:
+        pairs = iter_import_map(f)
+        while True:
+            batch = list(islice(pairs, batch_size))
+            if not batch:
+                break
+
+            packages_to_imports = {}
+            for package_name, import_name in batch:
+                packages_to_imports.setdefault(package_name, []).append(import_name)
+            _write_import_maps(
+                session,
+                [(partition, file_hash, packages_to_imports)],
+                delete_stale=False,
+            )
+
+    _delete_stale_mappings(session, {partition: file_hash})
+    bump_data_version(session)
+    return True
+
+
+def _split_by_size(
+    files: List[str], stream_threshold: Optional[int]
+) -> Tuple[List[str], List[str]]:
+    """
+    Splits the partition blobs into the ones read in one go and the ones streamed.
+    """
+    if stream_threshold is None:
+        return files, []
+
+    small_files, large_files = [], []
+    for file in files:
+        if os.path.getsize(file) > stream_threshold:
+            large_files.append(file)
+        else:
+            small_files.append(file)
+    return small_files, large_files
+
+
+def update(
+    session: Session,
+    path: Path,
+    batch_size: int = 100,
+    files: Optional[List[str]] = None,
+    cache: Optional[ParseCache] = None,
+    stream_threshold: Optional[int] = STREAM_THRESHOLD,
+):
     """
     Updates Import to Package maps in the database  based on the comparison between the stored data and the current data.
 
+    Each blob is read once: its hash is computed from the buffer and compared with
+    the database, and only changed blobs get the same buffer parsed and written.
+
     Args:
         session (Session): The SQLAlchemy session object.
         path (Path): The path to import to package maps directory containing the JSON blobs
         (relative to the root directory of "libcfgraph" or viable alternative).
+        batch_size (int, optional): Number of files read per transaction. Defaults to 100.
+        files (List[str], optional): Subset of the JSON files under `path` to consider.
+            Defaults to None, meaning every JSON file, in which case the mappings
+            of the partitions whose blob was removed are deleted.
+        cache (ParseCache, optional): Cache of the parsed blobs, shared between runs.
+            Defaults to None, meaning a fresh in-memory cache for this run.
+        stream_threshold (int, optional): Size in bytes above which partitions are
+            streamed in bounded batches. Defaults to STREAM_THRESHOLD, None disables
+            streaming.
     """
-    logger.info("Updating feedstocks...")
-    logger.debug("Creating temporary directory...")
-    _tmp_dir = TemporaryDirectory()
-    tmp_dir = Path(_tmp_dir.name)
+    cache = ParseCache() if cache is None else cache
+    logger.info("Updating import maps...")
 
     logger.info("Querying database for current mappings...")
-    _database_mappings = session.query(
-        ImportToPackageMaps.parent_package_name,
-        ImportToPackageMaps.partition,
-        ImportToPackageMaps.hash,
-    ).all()
-
-    logger.info(f"Traversing files in {path}...")
-    stored_files = traverse_files(path, tmp_dir)
-
-    logger.info("Comparing files...")
-    changed_files = _compare_files(_database_mappings, stored_files, root_dir=path)
-
-    with progressBar:
-        for idx, (file, file_hash) in enumerate(
-            progressBar.track(changed_files, description="Updating import maps")
-        ):
-            _, partition = _decompose_filename(file.stem)
-
-            import_map_data_blob = retrieve_import_maps_from_output_blob(
-                file=path / file  # absolute path
-            )
-            # now we will have a dictionary containing the package names and their respective imports
-
-            for package_name, imports in import_map_data_blob.items():
-                package = (
-                    session.query(Packages)
-                    .filter(Packages.name == package_name)
-                    .first()
-                )
-
-                if not package:
-                    logger.debug(
-                        f"Package '{package_name}' not found in database. Proceeding to create it and its feedstock outputs."
-                    )
-                    package = Packages(
-                        name=package_name,
-                    )
-                    session.add(package)
-
-                for _import in imports:
-                    _mapping = ImportToPackageMaps(
-                        id=uniq_id(),
-                        import_name=_import,
-                        parent_package_name=package.name,
-                        partition=partition,
-                        hash=file_hash,
-                    )
-                    session.add(_mapping)
-
-            if idx % 100 == 0:
+    db_files = _database_files(session)
+
+    listed_all = files is None
+    if listed_all:
+        files = list_json_files(path)
+    logger.info(f"Reading {len(files)} files in {path}...")
+    small_files, large_files = _split_by_size(files, stream_threshold)
+
+    process = partial(_process_import_map, path, db_files, cache)
+    num_changed = 0
+    with concurrent.futures.ThreadPoolExecutor() as executor, progressBar:
+        task = progressBar.add_task("Updating import maps", total=len(files))
+        for batch in chunked(small_files, batch_size):
+            records = [record for record in executor.map(process, batch) if record]
+            if records:
+                _write_import_maps(session, records)
                 session.commit()
+                num_changed += len(records)
+            progressBar.advance(task, len(batch))
 
+        for file in large_files:
+            if _stream_import_map(session, path, db_files, file):
+                session.commit()
+                num_changed += 1
+            progressBar.advance(task, 1)
+
+    if listed_all:
+        num_changed += delete_removed_partitions(session, list_partitions(path, files))
         session.commit()
+
+    if num_changed == 0:
+        logger.info("No changes detected.")
+    else:
+        logger.info(f"Updated {num_changed} modified files.")
+
+    cache.flush()
+    logger.info(cache.summary())
+
+
+async def update_async(
+    session_maker,
+    path: Path,
+    file_semaphore: asyncio.Semaphore,
+    db_semaphore: asyncio.Semaphore,
+    batch_size: int = 100,
+    cache: Optional[ParseCache] = None,
+    stream_threshold: Optional[int] = STREAM_THRESHOLD,
+):
+    """
+    Asynchronous counterpart of `update`. Files are read, hashed and parsed in
+    executor tasks bounded by `file_semaphore`, while batches are written by
+    concurrent sessions bounded by `db_semaphore`.
+
+    Args:
+        session_maker (async_sessionmaker): Factory for the asynchronous sessions.
+        path (Path): The path to import to package maps directory containing the JSON blobs.
+        file_semaphore (asyncio.Semaphore): Bounds the number of concurrent file reads.
+        db_semaphore (asyncio.Semaphore): Bounds the number of concurrent writers.
+        batch_size (int, optional): Number of files read per transaction. Defaults to 100.
+        cache (ParseCache, optional): Cache of the parsed blobs, shared between runs.
+            Defaults to None, meaning a fresh in-memory cache for this run.
+        stream_threshold (int, optional): Size in bytes above which partitions are
+            streamed in bounded batches. Defaults to STREAM_THRESHOLD, None disables
+            streaming.
+    """
+    cache = ParseCache() if cache is None else cache
+    logger.info("Updating import maps...")
+
+    logger.info("Querying database for current mappings...")
+    async with session_maker() as session:
+        db_files = await session.run_sync(_database_files)
+
+    loop = asyncio.get_running_loop()
+    files = await loop.run_in_executor(None, list_json_files, path)
+    logger.info(f"Reading {len(files)} files in {path}...")
+    small_files, large_files = await loop.run_in_executor(
+        None, _split_by_size, files, stream_threshold
+    )
+
+    process = partial(_process_import_map, path, db_files, cache)
+
+    async def _process(file: str) -> Optional[ImportMapRecord]:
+        async with file_semaphore:
+            return await loop.run_in_executor(None, process, file)
+
+    async def _load(batch: List[str]) -> int:
+        records = [
+            record
+            for record in await asyncio.gather(*(_process(file) for file in batch))
+            if record
+        ]
+        if records:
+            async with db_semaphore:
+                async with session_maker() as session:
+                    await session.run_sync(_write_import_maps, records)
+                    await session.commit()
+        return len(records)
+
+    num_changed = sum(
+        await asyncio.gather(
+            *(_load(batch) for batch in chunked(small_files, batch_size))
+        )
+    )
+
+    # one partition at a time, so that memory stays bounded; the blocking reads run
+    # inside the writer's greenlet
+    for file in large_files:
+        async with db_semaphore:
+            async with session_maker() as session:
+                if await session.run_sync(_stream_import_map, path, db_files, file):
+                    await session.commit()
+                    num_changed += 1
+
+    async with db_semaphore:
+        async with session_maker() as session:
+            num_changed += await session.run_sync(
+                delete_removed_partitions, list_partitions(path, files)
+            )
+            await session.commit()
+
+    if num_changed == 0:
+        logger.info("No changes detected.")
+    else:
+        logger.info(f"Updated {num_changed} modified files.")
+
+    cache.flush()
+    logger.info(cache.summary())
@@ -0,0 +1,231 @@
+from typing import Dict, Iterable, Iterator, List, Sequence, Union
+
+from sqlalchemy import Table, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from cfdb.models.schema import normalize_name
+
+# DBAPI drivers whose connections can stream COPY FROM STDIN
+COPY_DRIVERS = ("psycopg2", "psycopg")
+
+
+def _dialect_insert(session: Union[Connection, Session], table: Table):
+    """
+    Returns a dialect specific INSERT construct for the given table, which supports
+    the ``ON CONFLICT`` clauses used by the bulk loaders.
+
+    Args:
+        session (Union[Connection, Session]): The SQLAlchemy session or connection.
+        table (Table): The table to insert into.
+
+    Returns:
+        Insert: The dialect specific insert statement.
+    """
+    bind = session.get_bind() if isinstance(session, Session) else session
+    dialect_name = bind.dialect.name
+
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        raise NotImplementedError(
+            f"Bulk loading is not supported for the '{dialect_name}' dialect."
+        )
+
+    return insert(table)
+
+
+def upsert(
+    session: Session,
+    table: Table,
+    rows: Sequence[Dict],
+    index_elements: Iterable[str],
+    update_columns: Iterable[str] = (),
+) -> None:
+    """
+    Inserts the rows into the table, ignoring rows that conflict on `index_elements`
+    or, when `update_columns` is given, overwriting those columns with the incoming
+    values.
+
+    The loader is picked from the session's dialect: PostgreSQL connections made
+    through psycopg2/psycopg stream the rows with ``COPY FROM STDIN`` into a
+    temporary table and merge them with ``INSERT ... ON CONFLICT``, every other
+    backend sends a single executemany ``INSERT ... ON CONFLICT``.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        table (Table): The table to insert into.
+        rows (Sequence[Dict]): The rows to insert, as column name to value mappings.
+        index_elements (Iterable[str]): Columns of the unique index used to detect conflicts.
+        update_columns (Iterable[str], optional): Columns to update on conflict. Defaults to ().
+    """
+    if not rows:
+        return
+
+    index_elements = list(index_elements)
+    update_columns = list(update_columns)
+    # sorting keeps lock acquisition order stable across concurrent writers
+    rows = sorted(rows, key=lambda row: tuple(row[c] for c in index_elements))
+
+    dialect = session.get_bind().dialect
+    if dialect.name == "postgresql" and dialect.driver in COPY_DRIVERS:
+        _copy_upsert(session, table, rows, index_elements, update_columns)
+    else:
+        _executemany_upsert(session, table, rows, index_elements, update_columns)
+
+
+def _executemany_upsert(
+    session: Session,
+    table: Table,
+    rows: Sequence[Dict],
+    index_elements: List[str],
+    update_columns: List[str],
+) -> None:
+    stmt = _dialect_insert(session, table)
+    if update_columns:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: stmt.excluded[column] for column in update_columns},
+        )
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+
+    session.execute(stmt, rows)
+
+
+def _copy_text_value(value) -> str:
+    """
+    Encodes a value using the text format of PostgreSQL's COPY command.
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\\\x" + bytes(value).hex()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class _CopyStream:
+    """
+    Read-only file-like object producing the COPY text stream of `rows` lazily,
+    so that the whole payload is never materialized in memory.
+    """
+
+    def __init__(self, rows: Iterable[Dict], columns: List[str]):
+        self._lines = self._encode(rows, columns)
+        self._buffer = b""
+
+    @staticmethod
+    def _encode(rows: Iterable[Dict], columns: List[str]) -> Iterator[bytes]:
+        for row in rows:
+            line = "\t".join(_copy_text_value(row[column]) for column in columns)
+            yield (line + "\n").encode()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+    readline = read
+
+
+def _copy_upsert(
+    session: Session,
+    table: Table,
+    rows: Sequence[Dict],
+    index_elements: List[str],
+    update_columns: List[str],
+) -> None:
+    columns = list(rows[0].keys())
+    stage = f"_cfdb_stage_{table.name}"
+    column_list = ", ".join(columns)
+
+    dbapi_connection = session.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {stage} "
+            f"(LIKE {table.name} INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        cursor.execute(f"TRUNCATE {stage}")
+
+        copy_sql = f"COPY {stage} ({column_list}) FROM STDIN"
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            cursor.copy_expert(copy_sql, _CopyStream(rows, columns))
+        else:  # psycopg 3
+            with cursor.copy(copy_sql) as copy:
+                for row in rows:
+                    copy.write_row([row[column] for column in columns])
+
+        if update_columns:
+            assignments = ", ".join(f"{c} = EXCLUDED.{c}" for c in update_columns)
+            conflict_action = f"DO UPDATE SET {assignments}"
+        else:
+            conflict_action = "DO NOTHING"
+
+        # DISTINCT ON guards against duplicated keys within the same batch
+        cursor.execute(
+            f"INSERT INTO {table.name} ({column_list}) "
+            f"SELECT DISTINCT ON ({', '.join(index_elements)}) {column_list} "
+            f"FROM {stage} "
+            f"ON CONFLICT ({', '.join(index_elements)}) {conflict_action}"
+        )
+
+
+def ensure_ids(session: Session, table: Table, names: Iterable[str]) -> Dict[str, int]:
+    """
+    Inserts the missing names into a dimension table (feedstocks, packages or
+    import names) and returns the surrogate key of every requested name. Tables
+    with a `normalized_name` column get it computed on the way.
+
+    Args:
+        session (Session): The SQLAlchemy session object.
+        table (Table): The dimension table, with `id` and unique `name` columns.
+        names (Iterable[str]): The names to look up.
+
+    Returns:
+        Dict[str, int]: Mapping of each name to its integer ID.
+    """
+    names = sorted(set(names))
+    if "normalized_name" in table.c:
+        rows = [
+            {"name": name, "normalized_name": normalize_name(name)} for name in names
+        ]
+    else:
+        rows = [{"name": name} for name in names]
+    upsert(session, table, rows, ["name"])
+
+    ids = {}
+    for names_batch in chunked(names, 500):
+        rows = session.execute(
+            select(table.c.name, table.c.id).where(table.c.name.in_(names_batch))
+        )
+        ids.update(rows.all())
+    return ids
+
+
+def chunked(items: List, size: int) -> List[List]:
+    """
+    Splits a list into consecutive chunks of at most `size` elements.
+
+    Args:
+        items (List): The list to split.
+        size (int): The maximum number of elements per chunk.
+
+    Returns:
+        List[List]: The list of chunks.
+    """
+    return [items[i : i + size] for i in range(0, len(items), size)]
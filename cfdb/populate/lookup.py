@@ -0,0 +1,224 @@
+"""
+Incremental maintenance of the materialized import to feedstock lookup.
+
+`ImportFeedstocks` is the join of `ImportToPackageMaps` and `FeedstockOutputs` on
+the package, with the number of packages behind each (import, feedstock) row
+(the counting algorithm of incremental view maintenance). When rows of one side
+are inserted or deleted, the join of those rows with the other side is added to
+or subtracted from the counts: rows reaching 0 are deleted, and `FeedstockStats`
+is adjusted by the rows appearing and disappearing. Nothing is ever recomputed
+from the whole tables.
+
+The functions below are called by the writers with the rows they changed, in
+the same transaction, before the data version is bumped. Concurrent writers on
+PostgreSQL would each count the joins against the other side as committed before
+their own changes, and miss each other's rows, so the maintenance is serialized by
+a transaction-level advisory lock held until the writer commits.
+"""
+
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Set, Tuple, Union
+
+from sqlalchemy import bindparam, delete, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from cfdb.models.schema import (
+    FeedstockOutputs,
+    FeedstockStats,
+    ImportFeedstocks,
+    ImportToPackageMaps,
+)
+from cfdb.populate.loaders import _dialect_insert, chunked
+
+Bind = Union[Connection, Session]
+# (import_id, feedstock_id) -> change of the number of packages
+Contributions = Dict[Tuple[int, int], int]
+
+# Key of the PostgreSQL advisory lock serializing the maintenance of the lookup
+LOCK_KEY = 0x63666462
+
+
+def lock(bind: Bind) -> None:
+    """
+    Waits until no other transaction maintains the lookup, and keeps them waiting
+    until the current transaction ends. SQLite only has a single writer anyway.
+
+    Args:
+        bind (Union[Connection, Session]): The SQLAlchemy session or connection.
+    """
+    engine = bind.get_bind() if isinstance(bind, Session) else bind
+    if engine.dialect.name == "postgresql":
+        bind.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+
+
+def _related(bind: Bind, column, related_column, package_ids: Set[int]):
+    """
+    Returns the values of `related_column` of the rows of each package.
+    """
+    related = defaultdict(list)
+    for package_ids_batch in chunked(sorted(package_ids), 500):
+        rows = bind.execute(
+            select(column, related_column).where(column.in_(package_ids_batch))
+        )
+        for package_id, value in rows:
+            related[package_id].append(value)
+    return related
+
+
+def apply_mapping_changes(
+    bind: Bind,
+    added: Iterable[Tuple[int, int]],
+    removed: Iterable[Tuple[int, int]] = (),
+) -> None:
+    """
+    Propagates inserted and deleted import to package maps to the lookup.
+
+    Args:
+        bind (Union[Connection, Session]): The SQLAlchemy session or connection.
+        added (Iterable[Tuple[int, int]]): The inserted (import_id, package_id).
+        removed (Iterable[Tuple[int, int]], optional): The deleted
+            (import_id, package_id). Defaults to ().
+    """
+    changes = [(pair, 1) for pair in added] + [(pair, -1) for pair in removed]
+    if not changes:
+        return
+    # the other side is read once the concurrent writers committed
+    lock(bind)
+
+    feedstocks = _related(
+        bind,
+        FeedstockOutputs.package_id,
+        FeedstockOutputs.feedstock_id,
+        {package_id for (_, package_id), _ in changes},
+    )
+    contributions = Counter()
+    for (import_id, package_id), sign in changes:
+        for feedstock_id in feedstocks.get(package_id, ()):
+            contributions[(import_id, feedstock_id)] += sign
+    _apply(bind, contributions, Counter())
+
+
+def apply_output_changes(
+    bind: Bind,
+    added: Iterable[Tuple[int, int]],
+    removed: Iterable[Tuple[int, int]] = (),
+) -> None:
+    """
+    Propagates inserted and deleted feedstock outputs to the lookup and to the
+    package counts of the feedstocks.
+
+    Args:
+        bind (Union[Connection, Session]): The SQLAlchemy session or connection.
+        added (Iterable[Tuple[int, int]]): The inserted (feedstock_id, package_id).
+        removed (Iterable[Tuple[int, int]], optional): The deleted
+            (feedstock_id, package_id). Defaults to ().
+    """
+    changes = [(pair, 1) for pair in added] + [(pair, -1) for pair in removed]
+    if not changes:
+        return
+    # the other side is read once the concurrent writers committed
+    lock(bind)
+
+    imports = _related(
+        bind,
+        ImportToPackageMaps.package_id,
+        ImportToPackageMaps.import_id,
+        {package_id for (_, package_id), _ in changes},
+    )
+    contributions = Counter()
+    num_packages = Counter()
+    for (feedstock_id, package_id), sign in changes:
+        num_packages[feedstock_id] += sign
+        for import_id in imports.get(package_id, ()):
+            contributions[(import_id, feedstock_id)] += sign
+    _apply(bind, contributions, num_packages)
+
+
+def _apply(bind: Bind, contributions: Contributions, num_packages: Counter) -> None:
+    """
+    Adds the contributions to the package counts of the lookup rows, deletes the
+    rows left without packages, and adjusts the feedstock summary counts.
+    """
+    table = ImportFeedstocks.__table__
+    rows = [
+        {"import_id": import_id, "feedstock_id": feedstock_id, "num_packages": count}
+        for (import_id, feedstock_id), count in sorted(contributions.items())
+        if count
+    ]
+
+    num_imports = Counter()
+    if rows:
+        stmt = _dialect_insert(bind, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["import_id", "feedstock_id"],
+            set_={"num_packages": table.c.num_packages + stmt.excluded.num_packages},
+        ).returning(table.c.import_id, table.c.feedstock_id, table.c.num_packages)
+        for import_id, feedstock_id, count in bind.execute(stmt, rows):
+            # only a row inserted by this statement holds exactly the contribution
+            if count > 0 and count == contributions[(import_id, feedstock_id)]:
+                num_imports[feedstock_id] += 1
+
+        import_ids = sorted(
+            {row["import_id"] for row in rows if row["num_packages"] < 0}
+        )
+        for import_ids_batch in chunked(import_ids, 500):
+            deleted = bind.execute(
+                delete(table)
+                .where(table.c.import_id.in_(import_ids_batch))
+                .where(table.c.num_packages <= 0)
+                .returning(table.c.feedstock_id)
+            )
+            for (feedstock_id,) in deleted:
+                num_imports[feedstock_id] -= 1
+
+    _adjust_stats(bind, num_packages, num_imports)
+
+
+def _adjust_stats(bind: Bind, num_packages: Counter, num_imports: Counter) -> None:
+    table = FeedstockStats.__table__
+    rows = [
+        {
+            "feedstock_id": feedstock_id,
+            "num_packages": num_packages[feedstock_id],
+            "num_imports": num_imports[feedstock_id],
+        }
+        for feedstock_id in sorted(set(num_packages) | set(num_imports))
+        if num_packages[feedstock_id] or num_imports[feedstock_id]
+    ]
+    if not rows:
+        return
+
+    stmt = _dialect_insert(bind, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["feedstock_id"],
+        set_={
+            "num_packages": table.c.num_packages + stmt.excluded.num_packages,
+            "num_imports": table.c.num_imports + stmt.excluded.num_imports,
+        },
+    )
+    bind.execute(stmt, rows)
+
+
+def delete_rows(
+    bind: Bind, table, key_columns: List[str], keys: List[Tuple[int, int]]
+) -> None:
+    """
+    Deletes the rows of a fact table by primary key.
+
+    Args:
+        bind (Union[Connection, Session]): The SQLAlchemy session or connection.
+        table (Table): The fact table.
+        key_columns (List[str]): The names of the two primary key columns.
+        keys (List[Tuple[int, int]]): The primary keys of the rows to delete.
+    """
+    if not keys:
+        return
+
+    first, second = key_columns
+    bind.execute(
+        delete(table)
+        .where(table.c[first] == bindparam("_first"))
+        .where(table.c[second] == bindparam("_second")),
+        [{"_first": a, "_second": b} for a, b in sorted(keys)],
+    )
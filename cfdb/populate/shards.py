@@ -0,0 +1,288 @@
+import concurrent.futures
+import heapq
+import os
+from collections import defaultdict
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+from cfdb.log import logger
+from cfdb.models import migrations
+from cfdb.models.schema import FeedstockOutputs, ImportToPackageMaps
+from cfdb.populate import (
+    changelog,
+    feedstock_outputs,
+    history,
+    import_to_package_maps,
+    lookup,
+)
+from cfdb.populate.utils import list_json_files
+
+UPDATERS = {
+    "feedstock_outputs": feedstock_outputs,
+    "import_to_package_maps": import_to_package_maps,
+}
+
+# Dimension tables are merged by name, the shards' IDs are only local to each shard
+MERGE_STATEMENTS = (
+    "INSERT OR IGNORE INTO feedstocks (name) SELECT name FROM shard.feedstocks",
+    "INSERT OR IGNORE INTO packages (name, normalized_name) "
+    "SELECT name, normalized_name FROM shard.packages",
+    "INSERT OR IGNORE INTO import_names (name, normalized_name) "
+    "SELECT name, normalized_name FROM shard.import_names",
+)
+
+# Fact tables are merged through a staging table holding the shard's rows keyed by
+# the target's IDs, and flagged when new to the target. Target rows of the merged
+# packages (feedstock outputs) or of the partitions loaded by the shard (import
+# maps, see `load_shard`, including the partitions left empty) that the shard no
+# longer lists are deleted. Both kinds of changes are then propagated to the
+# import to feedstock lookup and recorded in the history, and the merged and
+# deleted rows in the change log.
+FACT_MERGES = (
+    (
+        FeedstockOutputs.__table__,
+        """
+        CREATE TEMP TABLE _cfdb_merged AS
+        SELECT f.id AS a, p.id AS b, o.path AS path, o.hash AS hash,
+            NOT EXISTS (
+                SELECT 1 FROM feedstock_outputs t
+                WHERE t.feedstock_id = f.id AND t.package_id = p.id
+            ) AS added
+        FROM shard.feedstock_outputs o
+        JOIN shard.feedstocks sf ON sf.id = o.feedstock_id
+        JOIN feedstocks f ON f.name = sf.name
+        JOIN shard.packages sp ON sp.id = o.package_id
+        JOIN packages p ON p.name = sp.name
+        """,
+        """
+        INSERT INTO feedstock_outputs (feedstock_id, package_id, path, hash)
+        SELECT a, b, path, hash FROM _cfdb_merged
+        WHERE true
+        ON CONFLICT (feedstock_id, package_id)
+        DO UPDATE SET path = excluded.path, hash = excluded.hash
+        """,
+        """
+        DELETE FROM feedstock_outputs
+        WHERE package_id IN (SELECT b FROM _cfdb_merged)
+        AND (feedstock_id, package_id) NOT IN (SELECT a, b FROM _cfdb_merged)
+        RETURNING feedstock_id, package_id
+        """,
+        lookup.apply_output_changes,
+    ),
+    (
+        ImportToPackageMaps.__table__,
+        """
+        CREATE TEMP TABLE _cfdb_merged AS
+        SELECT i.id AS a, p.id AS b, m.partition AS partition, m.hash AS hash,
+            NOT EXISTS (
+                SELECT 1 FROM import_to_package_mapping t
+                WHERE t.import_id = i.id AND t.package_id = p.id
+            ) AS added
+        FROM shard.import_to_package_mapping m
+        JOIN shard.import_names si ON si.id = m.import_id
+        JOIN import_names i ON i.name = si.name
+        JOIN shard.packages sp ON sp.id = m.package_id
+        JOIN packages p ON p.name = sp.name
+        """,
+        """
+        INSERT INTO import_to_package_mapping (import_id, package_id, partition, hash)
+        SELECT a, b, partition, hash FROM _cfdb_merged
+        WHERE true
+        ON CONFLICT (import_id, package_id)
+        DO UPDATE SET partition = excluded.partition, hash = excluded.hash
+        """,
+        """
+        DELETE FROM import_to_package_mapping
+        WHERE partition IN (SELECT partition FROM shard.shard_partitions)
+        AND (import_id, package_id) NOT IN (SELECT a, b FROM _cfdb_merged)
+        RETURNING import_id, package_id
+        """,
+        lookup.apply_mapping_changes,
+    ),
+)
+
+# Number of new rows propagated to the lookup at once
+MERGE_BATCH_SIZE = 10000
+
+
+def partition_files(path: Path, files: List[str], num_shards: int) -> List[List[str]]:
+    """
+    Splits the JSON blobs of a source tree into at most `num_shards` balanced shards.
+
+    Files are grouped by their parent directory (the output shard directories of
+    feedstock-outputs, or the flat partition files of the import maps), and the
+    groups are assigned largest first to the least loaded shard.
+
+    Args:
+        path (Path): The root directory of the source tree.
+        files (List[str]): The JSON files under `path`.
+        num_shards (int): The maximum number of shards.
+
+    Returns:
+        List[List[str]]: The non-empty shards.
+    """
+    groups = defaultdict(list)
+    for file in files:
+        parent = Path(file).relative_to(path).parent
+        # flat trees are split per file, nested trees per directory
+        key = file if parent == Path(".") else parent
+        groups[key].append(file)
+
+    heap = [(0, idx) for idx in range(num_shards)]
+    shards = [[] for _ in range(num_shards)]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        load, idx = heapq.heappop(heap)
+        shards[idx].extend(group)
+        heapq.heappush(heap, (load + len(group), idx))
+
+    return [shard for shard in shards if shard]
+
+
+def load_shard(kind: str, path: Path, files: List[str], shard_file: Path) -> Path:
+    """
+    Loads a subset of a source tree into its own SQLite file. Runs in a worker
+    process, so that every shard is written without lock contention. The
+    partitions of the import maps blobs are recorded in the `shard_partitions`
+    table of the shard, so that the merge also covers the empty ones.
+
+    Args:
+        kind (str): The updater to run, one of `UPDATERS`.
+        path (Path): The root directory of the source tree.
+        files (List[str]): The JSON files of the shard.
+        shard_file (Path): The SQLite file to create.
+
+    Returns:
+        Path: The path of the shard database.
+    """
+    engine = create_engine(f"sqlite:///{shard_file}")
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+
+    session = sessionmaker(bind=engine)()
+    try:
+        UPDATERS[kind].update(session, path=path, files=files, batch_size=1000)
+        session.execute(
+            text("CREATE TABLE shard_partitions (partition VARCHAR PRIMARY KEY)")
+        )
+        if kind == "import_to_package_maps":
+            session.execute(
+                text("INSERT INTO shard_partitions VALUES (:partition)"),
+                [
+                    {"partition": partition}
+                    for partition in import_to_package_maps.list_partitions(path, files)
+                ],
+            )
+        session.commit()
+    finally:
+        session.close()
+        engine.dispose()
+
+    return shard_file
+
+
+def _merge_facts(connection, table, stage, merge, delete_stale, apply_changes) -> None:
+    at = history.utcnow()
+    connection.exec_driver_sql(stage)
+    try:
+        connection.exec_driver_sql(merge)
+        removed = [tuple(row) for row in connection.exec_driver_sql(delete_stale)]
+        added = connection.exec_driver_sql("SELECT a, b FROM _cfdb_merged WHERE added")
+        for rows in added.partitions(MERGE_BATCH_SIZE):
+            rows = [tuple(row) for row in rows]
+            apply_changes(connection, rows)
+            history.record_changes(connection, table, rows, at=at)
+        apply_changes(connection, (), removed)
+        history.record_changes(connection, table, (), removed, at=at)
+        # the staged rows are (key, package_id, path or partition, hash, added)
+        merged = connection.exec_driver_sql("SELECT * FROM _cfdb_merged")
+        for rows in merged.partitions(MERGE_BATCH_SIZE):
+            changelog.record_changes(
+                connection, table, (dict(zip(table.c.keys(), row[:4])) for row in rows)
+            )
+        changelog.record_changes(connection, table, (), removed)
+    finally:
+        connection.exec_driver_sql("DROP TABLE temp._cfdb_merged")
+
+
+def merge_shards(engine: Engine, shard_files: List[Path]) -> None:
+    """
+    Merges shard databases into the target SQLite database, one shard per
+    transaction, with ``ATTACH`` and ``INSERT ... SELECT``. The changes are
+    propagated to the import to feedstock lookup of the target.
+
+    Args:
+        engine (Engine): SQLAlchemy Engine object of the target database.
+        shard_files (List[Path]): The shard databases to merge.
+    """
+    # ATTACH and DETACH are not allowed inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for shard_file in shard_files:
+            logger.debug(f"Merging shard {shard_file}...")
+            connection.exec_driver_sql("ATTACH DATABASE ? AS shard", (str(shard_file),))
+            try:
+                connection.exec_driver_sql("BEGIN")
+                for statement in MERGE_STATEMENTS:
+                    connection.exec_driver_sql(statement)
+                for fact_merge in FACT_MERGES:
+                    _merge_facts(connection, *fact_merge)
+                migrations.bump_data_version(connection)
+                connection.exec_driver_sql("COMMIT")
+            except Exception:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+            finally:
+                connection.exec_driver_sql("DETACH DATABASE shard")
+
+
+def build(
+    engine: Engine,
+    kind: str,
+    path: Path,
+    jobs: Optional[int] = None,
+    shard_dir: Optional[Path] = None,
+) -> None:
+    """
+    Loads a whole source tree with one worker process per shard, each writing to
+    its own SQLite file, and merges the shards into the target database. The
+    mappings of the import maps partitions that are no longer in the tree are
+    deleted once every shard is merged.
+
+    Args:
+        engine (Engine): SQLAlchemy Engine object of the target SQLite database.
+        kind (str): The updater to run, one of `UPDATERS`.
+        path (Path): The root directory of the source tree.
+        jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+        shard_dir (Path, optional): Where to create the shard files. Defaults to a
+            temporary directory.
+    """
+    if engine.dialect.name != "sqlite":
+        raise NotImplementedError("Sharded builds are only supported for SQLite.")
+
+    jobs = jobs or os.cpu_count() or 1
+    files = list_json_files(path)
+    shards = partition_files(path, files, jobs)
+    logger.info(f"Loading {len(files)} files from {path} in {len(shards)} shards...")
+
+    with TemporaryDirectory(dir=shard_dir) as tmp_dir:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(
+                    load_shard, kind, path, shard, Path(tmp_dir) / f"shard_{idx}.db"
+                )
+                for idx, shard in enumerate(shards)
+            ]
+            # shards are merged as soon as they are ready, while others still load
+            for future in concurrent.futures.as_completed(futures):
+                merge_shards(engine, [future.result()])
+
+    if kind == "import_to_package_maps":
+        with sessionmaker(bind=engine)() as session:
+            import_to_package_maps.delete_removed_partitions(
+                session, import_to_package_maps.list_partitions(path, files)
+            )
+            session.commit()
@@ -1,11 +1,7 @@
-import concurrent.futures
 import glob
 import hashlib
-import json
 from pathlib import Path
-from typing import List
-
-from cfdb.log import logger
+from typing import List, Optional, Set, Tuple
 
 
 def hash_file(filename: str) -> str:
@@ -29,107 +25,46 @@ def hash_file(filename: str) -> str:
     return h.hexdigest()
 
 
-def process_batch(batch_files: List[Path], tmp_file: Path) -> None:
+def list_json_files(path: Path) -> List[str]:
     """
-    Process a batch of files, calculate their hashes, and write the list of file paths
-    and hashes to the temporary file.
+    Lists the JSON blob files found recursively under `path`.
 
     Args:
-        batch_files (List[Path]): The list of files in the batch.
-        tmp_file (Path): The path to the temporary file.
-    """
-    with open(tmp_file, "w") as f:
-        for file in batch_files:
-            file_hash = hash_file(file)
-            f.write(f"{file},{file_hash}\n")
-
-
-def retrieve_associated_feedstock_from_output_blob(file: Path):
-    """
-    Retrieves the associated feedstocks from the output blob file.
-
-    Args:
-        file (Path): The path to the output blob file.
-
-    Returns:
-        List[str]: A list of associated feedstock names.
-    """
-    with open(file, "r") as f:
-        payload = json.loads(f.read())
-
-    _, associated_feedstocks = payload.popitem()
-    return associated_feedstocks
-
-
-def retrieve_import_maps_from_output_blob(file: Path):
-    """
-
-    Args:
-        file (Path): The path to the output blob file.
+        path (Path): The path to the directory containing the JSON files.
 
     Returns:
-        List[str]: A list of associated feedstock names.
+        List[str]: The paths of the JSON files.
     """
-    with open(file, "r") as f:
-        payload = json.loads(f.read())
-
-    packages_to_imports = {}
-    for import_name, _set in payload.items():
-        elements = _set["elements"]  # should return a list
-        for element in elements:
-            if element not in packages_to_imports:
-                packages_to_imports[element] = [import_name]
-            else:
-                packages_to_imports[element].append(import_name)
+    if not path.is_dir():
+        raise NotADirectoryError(f"{path} is not a directory.")
 
-    return packages_to_imports
+    return list(glob.iglob(f"{path}/**/*.json", recursive=True))
 
 
-def traverse_files(path: Path, output_dir: Path = None) -> List[Path]:
+def read_changed_blob(
+    root_dir: Path, file: str, known_blobs: Set[Tuple[Path, str]]
+) -> Optional[Tuple[Path, str, bytes]]:
     """
-    Traverses a directory of JSON files, generating a list of dictionaries
-    with file paths and hashes. These dictionaries are written to an output directory.
-
-    The hashes allow comparison between the directory and a database for necessary updates.
-    Files are processed in batches of 1000 to optimize memory usage.
+    Reads a JSON blob once, and hashes the buffer to detect whether it changed.
+    The same buffer is then parsed by the caller, so that changed blobs are never
+    read twice from disk.
 
     Args:
-        path (Path): The path to the directory containing the JSON files.
-        output_dir (Path, optional): The output directory to store the list of dictionaries.
-            If not provided, the current directory will be used. Defaults to None.
+        root_dir (Path): The root directory of the JSON blobs.
+        file (str): The path to the blob.
+        known_blobs (Set[Tuple[Path, str]]): The (relative file path, hexadecimal
+            SHA-1 hash) tuples stored in the database.
 
     Returns:
-        List[Path]: A list of paths to the stored files.
+        Optional[Tuple[Path, str, bytes]]: The relative path, hash and content of the
+            blob, or None if the blob is unchanged.
     """
-    if not path.is_dir():
-        raise NotADirectoryError(f"{path} is not a directory.")
-
-    files = list(glob.iglob(f"{path}/**/*.json", recursive=True))
-
-    num_of_files = len(files)
-    num_of_batches = num_of_files // 1000
-
-    if num_of_files % 1000 != 0:
-        num_of_batches += 1
-
-    logger.debug(f"JSON blob files: {num_of_files} (in {num_of_batches} batches)")
-
-    if output_dir is None:
-        output_dir = Path(".")
-
-    stored_files = []
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        for i in range(num_of_batches):
-            tmp_file = output_dir / f"batch_{i}.json"
-            logger.debug(f"Creating temporary file {tmp_file}...")
-            batch_files = files[i * 1000 : (i + 1) * 1000]
-            batch_files.reverse()
-
-            executor.submit(process_batch, batch_files, tmp_file)
-
-            stored_files.append(tmp_file)
+    with open(file, "rb") as f:
+        data = f.read()
 
-    del files
+    file_rel_path = Path(file).relative_to(root_dir)
+    file_hash = hashlib.sha1(data).hexdigest()
+    if (file_rel_path, file_hash) in known_blobs:
+        return None
 
-    return stored_files
+    return file_rel_path, file_hash, data
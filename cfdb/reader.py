@@ -0,0 +1,644 @@
+import hashlib
+import os
+import time
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, create_engine, or_, select
+from sqlalchemy.engine import URL, make_url
+
+from cfdb import bloom, search
+from cfdb.models import migrations
+from cfdb.populate.loaders import chunked
+from cfdb.trie import ImportTrie, Match
+from cfdb.models.schema import (
+    Artifacts,
+    ArtifactsFilePaths,
+    FeedstockOutputs,
+    FeedstockOutputsHistory,
+    Feedstocks,
+    FeedstockStats,
+    ImportFeedstocks,
+    ImportNames,
+    ImportToPackageMaps,
+    ImportToPackageMapsHistory,
+    Packages,
+    RelationsMapFilePaths,
+    hash_path,
+    normalize_name,
+)
+
+DEFAULT_DB_URL = "sqlite:///cf-database.db"
+
+# Compiled once per reader, and executed on raw DBAPI connections so that the
+# drivers reuse their prepared statements (sqlite3 statement cache, psycopg's
+# automatic server-side prepare). Names are matched through their indexed normalized
+# form, see `_fetch`.
+WHO_PROVIDES = (
+    select(ImportNames.name, Packages.name)
+    .join(ImportToPackageMaps, ImportToPackageMaps.package_id == Packages.id)
+    .join(ImportNames, ImportNames.id == ImportToPackageMaps.import_id)
+    .where(ImportNames.normalized_name == bindparam("name"))
+    .order_by(Packages.name)
+)
+FEEDSTOCKS_FOR_IMPORT = (
+    select(ImportNames.name, Feedstocks.name)
+    .join(ImportFeedstocks, ImportFeedstocks.feedstock_id == Feedstocks.id)
+    .join(ImportNames, ImportNames.id == ImportFeedstocks.import_id)
+    .where(ImportNames.normalized_name == bindparam("name"))
+    .order_by(Feedstocks.name)
+)
+FEEDSTOCK_STATS = (
+    select(FeedstockStats.num_packages, FeedstockStats.num_imports)
+    .join(Feedstocks, Feedstocks.id == FeedstockStats.feedstock_id)
+    .where(Feedstocks.name == bindparam("name"))
+)
+# The same lookups as of a past time, against the validity intervals of the history
+# tables, see cfdb.populate.history
+WHO_PROVIDES_AS_OF = (
+    select(ImportNames.name, Packages.name)
+    .join(
+        ImportToPackageMapsHistory,
+        ImportToPackageMapsHistory.package_id == Packages.id,
+    )
+    .join(ImportNames, ImportNames.id == ImportToPackageMapsHistory.import_id)
+    .where(ImportNames.normalized_name == bindparam("name"))
+    .where(ImportToPackageMapsHistory.valid_from <= bindparam("as_of"))
+    .where(
+        or_(
+            ImportToPackageMapsHistory.valid_to.is_(None),
+            ImportToPackageMapsHistory.valid_to > bindparam("as_of"),
+        )
+    )
+    .order_by(Packages.name)
+)
+FEEDSTOCK_OF_AS_OF = (
+    select(Packages.name, Feedstocks.name)
+    .join(
+        FeedstockOutputsHistory,
+        FeedstockOutputsHistory.feedstock_id == Feedstocks.id,
+    )
+    .join(Packages, Packages.id == FeedstockOutputsHistory.package_id)
+    .where(Packages.normalized_name == bindparam("name"))
+    .where(FeedstockOutputsHistory.valid_from <= bindparam("as_of"))
+    .where(
+        or_(
+            FeedstockOutputsHistory.valid_to.is_(None),
+            FeedstockOutputsHistory.valid_to > bindparam("as_of"),
+        )
+    )
+    .order_by(Feedstocks.name)
+)
+RESOLVE_IMPORTS = (
+    select(
+        ImportNames.normalized_name, ImportNames.name, Packages.name, Feedstocks.name
+    )
+    .join(ImportToPackageMaps, ImportToPackageMaps.import_id == ImportNames.id)
+    .join(Packages, Packages.id == ImportToPackageMaps.package_id)
+    .outerjoin(FeedstockOutputs, FeedstockOutputs.package_id == Packages.id)
+    .outerjoin(Feedstocks, Feedstocks.id == FeedstockOutputs.feedstock_id)
+    .where(ImportNames.normalized_name.in_(bindparam("names", expanding=True)))
+)
+IMPORT_MAPPINGS = (
+    select(ImportNames.name, Packages.name)
+    .join_from(
+        ImportToPackageMaps,
+        ImportNames,
+        ImportNames.id == ImportToPackageMaps.import_id,
+    )
+    .join(Packages, Packages.id == ImportToPackageMaps.package_id)
+)
+# The artifacts shipping the files of a chunk of paths (full path hashes) or
+# basenames, from the indexes of the file path tree, see cfdb.populate.artifacts
+_SHIPPED = (
+    select(
+        Artifacts.name,
+        Artifacts.platform,
+        Artifacts.package_name,
+        Feedstocks.name,
+    )
+    .join_from(
+        ArtifactsFilePaths,
+        RelationsMapFilePaths,
+        RelationsMapFilePaths.file_path == ArtifactsFilePaths.id,
+    )
+    .join(Artifacts, Artifacts.relational_id == RelationsMapFilePaths.id)
+    .outerjoin(Packages, Packages.name == Artifacts.package_name)
+    .outerjoin(FeedstockOutputs, FeedstockOutputs.package_id == Packages.id)
+    .outerjoin(Feedstocks, Feedstocks.id == FeedstockOutputs.feedstock_id)
+)
+WHO_SHIPS_PATHS = _SHIPPED.add_columns(ArtifactsFilePaths.path_hash).where(
+    ArtifactsFilePaths.path_hash.in_(bindparam("keys", expanding=True))
+)
+# a basename may be shipped under many directories by the same artifact
+WHO_SHIPS_NAMES = (
+    _SHIPPED.add_columns(ArtifactsFilePaths.dir)
+    .where(ArtifactsFilePaths.dir.in_(bindparam("keys", expanding=True)))
+    .distinct()
+)
+FEEDSTOCK_OF = (
+    select(Packages.name, Feedstocks.name)
+    .join(FeedstockOutputs, FeedstockOutputs.feedstock_id == Feedstocks.id)
+    .join(Packages, Packages.id == FeedstockOutputs.package_id)
+    .where(Packages.normalized_name == bindparam("name"))
+    .order_by(Feedstocks.name)
+)
+
+
+def _read_only_connect_args(url: URL) -> dict:
+    if url.get_backend_name() == "postgresql":
+        return {"options": "-c default_transaction_read_only=on"}
+    return {}
+
+
+def to_read_only_url(db_url: str) -> URL:
+    """
+    Opens SQLite database files in read-only mode, e.g. ``sqlite:///cf-database.db``
+    becomes ``sqlite:///file:cf-database.db?mode=ro&uri=true``. Other URLs are
+    returned untouched.
+
+    Args:
+        db_url (str): The URL of the database.
+
+    Returns:
+        URL: The URL of the database, opened read-only when supported.
+    """
+    url = make_url(db_url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return url
+    if url.query.get("uri"):
+        return url
+
+    return url.set(database=f"file:{url.database}", query={"mode": "ro", "uri": "true"})
+
+
+def database_key(db_url: str) -> str:
+    """
+    Returns a short digest identifying a database, for naming its cache files.
+    Relative SQLite paths are made absolute first.
+    """
+    url = make_url(db_url)
+    if url.get_backend_name() == "sqlite" and url.database not in (None, ""):
+        url = url.set(database=os.path.abspath(url.database))
+    return hashlib.sha1(url.render_as_string().encode()).hexdigest()[:16]
+
+
+class CFDBReader:
+    """
+    CFDBReader answers lookups against a cfdb database, through a pool of read-only
+    connections.
+
+    Results are kept in LRU caches, which are cleared whenever the data version of
+    the database (bumped by every write of the updaters) changes. The version is
+    checked at most once every `check_interval` seconds, so that hot lookups never
+    leave the process.
+
+    Import names are first checked against the Bloom filter of the known import
+    names stored in the database, if it is up to date, so that the names that are
+    certainly not mapped (standard library or first-party modules) are answered
+    without a query.
+
+    Package and import name lookups can also be answered as of a past time, from
+    the history tables maintained by the updaters.
+
+    Dotted import names are also resolved by longest prefix, through an import
+    trie built from the database on first use. With a `cache_dir`, the trie is
+    saved there as JSON under the data version, so that other processes can load it
+    instead of rebuilding it.
+
+    Args:
+        db_url (str): The URL of the database.
+        cache_size (int, optional): Maximum number of cached results per lookup.
+            Defaults to 65536.
+        check_interval (float, optional): Minimum number of seconds between two
+            checks of the data version. Defaults to 1.0, 0 checks on every lookup.
+        cache_dir (str, optional): Directory of the on-disk trie cache. Defaults to
+            None, meaning the trie is only kept in memory.
+
+    Attributes:
+        db_url (str): The URL of the database.
+        engine (Engine): SQLAlchemy Engine object.
+        data_version (int): The data version the cached results belong to.
+
+    Methods:
+        may_provide: Returns whether an import name may be mapped.
+        who_provides: Returns the packages providing an import name.
+        feedstock_of: Returns the feedstocks building a package.
+        feedstocks_for_import: Returns the feedstocks providing an import name.
+        feedstock_stats: Returns the package and import counts of a feedstock.
+        resolve_imports: Returns the packages and feedstocks of many import names.
+        who_ships: Returns the artifacts shipping many file paths or basenames.
+        match_import: Returns the longest mapped prefix of a dotted import name.
+        match_imports: Returns the longest mapped prefixes of many import names.
+        search: Returns the names closest to a possibly misspelled query.
+    """
+
+    def __init__(
+        self,
+        db_url=DEFAULT_DB_URL,
+        cache_size=65536,
+        check_interval=1.0,
+        cache_dir=None,
+    ):
+        self.db_url = db_url
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        url = to_read_only_url(db_url)
+        self.engine = create_engine(url, connect_args=_read_only_connect_args(url))
+        self.check_interval = check_interval
+        self.data_version = None
+        self._checked_at = float("-inf")
+        self._trie = None
+        self._import_filter = None
+        self._import_filter_loaded = False
+
+        who_provides = self._prepare(WHO_PROVIDES)
+        feedstock_of = self._prepare(FEEDSTOCK_OF)
+        feedstocks_for_import = self._prepare(FEEDSTOCKS_FOR_IMPORT)
+        self._who_provides = lru_cache(maxsize=cache_size)(
+            lambda name: self._fetch(who_provides, name)
+        )
+        self._feedstock_of = lru_cache(maxsize=cache_size)(
+            lambda name: self._fetch(feedstock_of, name)
+        )
+        self._feedstocks_for_import = lru_cache(maxsize=cache_size)(
+            lambda name: self._fetch(feedstocks_for_import, name)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Dispose of the connection pool of the engine.
+        """
+        self.engine.dispose()
+
+    def _prepare(self, statement) -> Tuple[str, Callable[[str], Any]]:
+        """
+        Compiles a single parameter lookup for the dialect of the engine, returning
+        its SQL and a function building the driver parameters.
+        """
+        compiled = statement.compile(dialect=self.engine.dialect)
+        if compiled.positional:
+            return str(compiled), lambda name: (name,)
+        return str(compiled), lambda name: {"name": name}
+
+    def _fetch(self, prepared, name: str) -> Tuple[str, ...]:
+        """
+        Runs a lookup on the normalized form of `name`, see `_pick`.
+        """
+        sql, parameters = prepared
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql, parameters(normalize_name(name)))
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            connection.close()
+        return self._pick(rows, name)
+
+    def _fetch_as_of(self, statement, name: str, as_of: datetime) -> Tuple[str, ...]:
+        """
+        Runs a lookup on the normalized form of `name` against the history, see
+        `_pick`.
+        """
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                statement, {"name": normalize_name(name), "as_of": as_of}
+            ).all()
+        return self._pick(rows, name)
+
+    @staticmethod
+    def _pick(rows, name: str) -> Tuple[str, ...]:
+        """
+        Returns the values of the (stored name, value) rows of a lookup. When some
+        rows match `name` exactly, only their values are returned, so that
+        normalization only kicks in for names that are not stored as given, e.g.
+        "Scikit_Learn".
+        """
+        exact = tuple(value for key, value in rows if key == name)
+        if exact:
+            return exact
+        return tuple(sorted({value for _, value in rows}))
+
+    def refresh(self) -> None:
+        """
+        Checks the data version of the database, and clears the caches if it changed.
+        """
+        with self.engine.connect() as connection:
+            data_version = migrations.get_data_version(connection)
+
+        if data_version != self.data_version:
+            self.clear()
+            self.data_version = data_version
+        self._checked_at = time.monotonic()
+
+    def clear(self) -> None:
+        """
+        Clears the cached results.
+        """
+        self._who_provides.cache_clear()
+        self._feedstock_of.cache_clear()
+        self._feedstocks_for_import.cache_clear()
+        self._trie = None
+        self._import_filter = None
+        self._import_filter_loaded = False
+
+    def _check_version(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+
+    def current_version(self) -> int:
+        """
+        Returns the data version of the database, checked at most once every
+        `check_interval` seconds.
+        """
+        self._check_version()
+        return self.data_version
+
+    @property
+    def import_filter(self) -> Optional[bloom.BloomFilter]:
+        """
+        The Bloom filter of the normalized import names of the current data
+        version, or None when the database has no up-to-date filter.
+        """
+        self._check_version()
+        if not self._import_filter_loaded:
+            with self.engine.connect() as connection:
+                self._import_filter = bloom.load_import_filter(connection)
+            self._import_filter_loaded = True
+        return self._import_filter
+
+    def may_provide(self, import_name: str) -> bool:
+        """
+        Returns whether an import name may be mapped, False meaning that it is
+        certainly not, without querying the database.
+
+        Args:
+            import_name (str): The import name, e.g. "numpy.linalg".
+
+        Returns:
+            bool: False when the import filter rules the name out.
+        """
+        import_filter = self.import_filter
+        return import_filter is None or normalize_name(import_name) in import_filter
+
+    def who_provides(
+        self, import_name: str, as_of: Optional[datetime] = None
+    ) -> Tuple[str, ...]:
+        """
+        Returns the packages providing an import name, matched case, "-", "_" and
+        "." insensitively when it is not stored as given.
+
+        Args:
+            import_name (str): The import name, e.g. "numpy.linalg".
+            as_of (datetime, optional): Naive UTC time to answer as of, from the
+                history. Defaults to None, meaning now.
+
+        Returns:
+            Tuple[str, ...]: The names of the packages, sorted.
+        """
+        if not self.may_provide(import_name):
+            return ()
+        if as_of is not None:
+            return self._fetch_as_of(WHO_PROVIDES_AS_OF, import_name, as_of)
+        return self._who_provides(import_name)
+
+    def feedstock_of(
+        self, package_name: str, as_of: Optional[datetime] = None
+    ) -> Tuple[str, ...]:
+        """
+        Returns the feedstocks building a package, matched case, "-", "_" and "."
+        insensitively when it is not stored as given.
+
+        Args:
+            package_name (str): The package name, e.g. "numpy-base".
+            as_of (datetime, optional): Naive UTC time to answer as of, from the
+                history. Defaults to None, meaning now.
+
+        Returns:
+            Tuple[str, ...]: The names of the feedstocks, sorted.
+        """
+        if as_of is not None:
+            return self._fetch_as_of(FEEDSTOCK_OF_AS_OF, package_name, as_of)
+        self._check_version()
+        return self._feedstock_of(package_name)
+
+    def feedstocks_for_import(self, import_name: str) -> Tuple[str, ...]:
+        """
+        Returns the feedstocks building the packages providing an import name, with
+        a single read of the materialized import to feedstock lookup.
+
+        Args:
+            import_name (str): The import name, e.g. "numpy.linalg".
+
+        Returns:
+            Tuple[str, ...]: The names of the feedstocks, sorted.
+        """
+        if not self.may_provide(import_name):
+            return ()
+        return self._feedstocks_for_import(import_name)
+
+    def feedstock_stats(self, feedstock_name: str) -> Optional[Tuple[int, int]]:
+        """
+        Returns the summary counts of a feedstock.
+
+        Args:
+            feedstock_name (str): The feedstock name, e.g. "numpy".
+
+        Returns:
+            Optional[Tuple[int, int]]: The number of packages built by the
+                feedstock and of import names they provide, or None for an unknown
+                feedstock.
+        """
+        with self.engine.connect() as connection:
+            row = connection.execute(FEEDSTOCK_STATS, {"name": feedstock_name}).first()
+        return None if row is None else tuple(row)
+
+    def resolve_imports(
+        self, import_names: Iterable[str], chunk_size: int = 500
+    ) -> Dict[str, Dict[str, Tuple[str, ...]]]:
+        """
+        Resolves a whole set of import names to the packages providing them, and the
+        feedstocks building those packages, with one set-based join per chunk of
+        names instead of one lookup per name. Names are matched like `who_provides`,
+        see `_pick`.
+
+        Args:
+            import_names (Iterable[str]): The import names.
+            chunk_size (int, optional): Number of names per query. Defaults to 500.
+
+        Returns:
+            Dict[str, Dict[str, Tuple[str, ...]]]: The feedstocks of each package
+                providing each import name. Unknown import names are left out.
+        """
+        requested = {}
+        for name in set(import_names):
+            if self.may_provide(name):
+                requested.setdefault(normalize_name(name), []).append(name)
+
+        rows = {}
+        with self.engine.connect() as connection:
+            for names in chunked(sorted(requested), chunk_size):
+                for normalized_name, *row in connection.execute(
+                    RESOLVE_IMPORTS, {"names": names}
+                ):
+                    rows.setdefault(normalized_name, []).append(row)
+
+        resolved = {}
+        for normalized_name, names in requested.items():
+            for import_name in names:
+                matches = rows.get(normalized_name, [])
+                # exact matches win over their normalized variants
+                matches = [row for row in matches if row[0] == import_name] or matches
+                packages = {}
+                for _, package_name, feedstock_name in matches:
+                    feedstocks = packages.setdefault(package_name, set())
+                    if feedstock_name is not None:
+                        feedstocks.add(feedstock_name)
+                if packages:
+                    resolved[import_name] = {
+                        package_name: tuple(sorted(feedstocks))
+                        for package_name, feedstocks in sorted(packages.items())
+                    }
+
+        return dict(sorted(resolved.items()))
+
+    def who_ships(
+        self, paths: Iterable[str], chunk_size: int = 500
+    ) -> Dict[str, Tuple[Tuple[str, str, str, Tuple[str, ...]], ...]]:
+        """
+        Finds the artifacts shipping a whole set of files, and the packages and
+        feedstocks they belong to. Paths relative to the installation prefix
+        ("lib/python3.11/site-packages/foo/__init__.py") are matched through the
+        hash of the full path, and basenames ("libssl.so.3") through the indexed
+        file names, with one set-based join per chunk of each.
+
+        Args:
+            paths (Iterable[str]): The file paths or basenames.
+            chunk_size (int, optional): Number of paths per query. Defaults to 500.
+
+        Returns:
+            Dict[str, Tuple[Tuple[str, str, str, Tuple[str, ...]], ...]]: The
+                (artifact name, platform, package name, feedstocks) of the artifacts
+                shipping each file, by path without leading "/". Files that no
+                artifact ships are left out.
+        """
+        paths = {path.strip("/") for path in paths}
+        hashes = {hash_path(path): path for path in paths if "/" in path}
+        names = sorted(path for path in paths if "/" not in path)
+
+        shipped = {}
+        with self.engine.connect() as connection:
+            for statement, keys, to_path in (
+                (WHO_SHIPS_PATHS, sorted(hashes), hashes.__getitem__),
+                (WHO_SHIPS_NAMES, names, str),
+            ):
+                for keys_batch in chunked(keys, chunk_size):
+                    rows = connection.execute(statement, {"keys": keys_batch})
+                    for name, platform, package, feedstock, key in rows:
+                        feedstocks = shipped.setdefault(to_path(key), {}).setdefault(
+                            (name, platform, package), set()
+                        )
+                        if feedstock is not None:
+                            feedstocks.add(feedstock)
+
+        return {
+            path: tuple(
+                (name, platform, package, tuple(sorted(feedstocks)))
+                for (name, platform, package), feedstocks in sorted(artifacts.items())
+            )
+            for path, artifacts in shipped.items()
+        }
+
+    def _trie_file(self) -> Path:
+        return self.cache_dir / (
+            f"import-trie-{database_key(self.db_url)}-{self.data_version}.json"
+        )
+
+    def _build_trie(self) -> ImportTrie:
+        if self.cache_dir is not None:
+            trie_file = self._trie_file()
+            if trie_file.exists():
+                return ImportTrie.load(trie_file)
+
+        with self.engine.connect() as connection:
+            trie = ImportTrie.from_mappings(connection.execute(IMPORT_MAPPINGS))
+
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # tries of the previous data versions are stale
+            for stale_file in self.cache_dir.glob(
+                f"import-trie-{database_key(self.db_url)}-*.json"
+            ):
+                stale_file.unlink(missing_ok=True)
+            trie.save(trie_file)
+
+        return trie
+
+    @property
+    def trie(self) -> ImportTrie:
+        """
+        The import trie of the current data version, built on first use.
+        """
+        self._check_version()
+        if self._trie is None:
+            self._trie = self._build_trie()
+        return self._trie
+
+    def match_import(self, import_name: str) -> Match:
+        """
+        Returns the longest mapped prefix of a dotted import name, e.g. the packages
+        providing "google.cloud.storage" for "google.cloud.storage.blob".
+
+        Args:
+            import_name (str): The import name.
+
+        Returns:
+            Match: The matched import name and the packages providing it, or
+                (None, ()) when no prefix is mapped.
+        """
+        return self.trie.match(import_name)
+
+    def match_imports(self, import_names: Iterable[str]) -> Dict[str, Match]:
+        """
+        Returns the longest mapped prefix of each of the dotted import names.
+
+        Args:
+            import_names (Iterable[str]): The import names.
+
+        Returns:
+            Dict[str, Match]: The matched import name and the packages providing it,
+                for each import name.
+        """
+        return self.trie.match_many(import_names)
+
+    def search(
+        self,
+        query: str,
+        kinds: Optional[Iterable[str]] = None,
+        limit: int = 10,
+    ) -> List[search.SearchResult]:
+        """
+        Returns the feedstock, package and import names closest to a possibly
+        misspelled query, through the trigram search indexes.
+
+        Args:
+            query (str): The name to look for, e.g. "scikit_learn".
+            kinds (Iterable[str], optional): The kinds of names to search, among
+                "package", "feedstock" and "import". Defaults to None, meaning all
+                of them.
+            limit (int, optional): Maximum number of results. Defaults to 10.
+
+        Returns:
+            List[SearchResult]: The kind, name and similarity of the results, most
+                similar first.
+        """
+        with self.engine.connect() as connection:
+            return search.search(connection, query, kinds=kinds, limit=limit)
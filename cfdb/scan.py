@@ -0,0 +1,113 @@
+import ast
+import concurrent.futures
+import glob
+import os
+import pkgutil
+import sys
+import sysconfig
+from pathlib import Path
+from typing import FrozenSet, List, Optional, Set
+
+from cfdb.log import logger
+
+
+def stdlib_modules() -> FrozenSet[str]:
+    """
+    Returns the top-level module names of the standard library. Before Python 3.10,
+    which lacks `sys.stdlib_module_names`, they are listed from the standard
+    library directories of the running interpreter.
+    """
+    names = set(sys.builtin_module_names)
+    if hasattr(sys, "stdlib_module_names"):
+        return frozenset(names | set(sys.stdlib_module_names))
+
+    stdlib = sysconfig.get_paths()["stdlib"]
+    for path in (stdlib, os.path.join(stdlib, "lib-dynload")):
+        names.update(module.name for module in pkgutil.iter_modules([path]))
+    return frozenset(names)
+
+
+STDLIB_MODULES = stdlib_modules()
+
+
+def extract_imports(file: str) -> Set[str]:
+    """
+    Returns the top-level names of the absolute imports of a Python file, e.g.
+    "numpy" for ``import numpy.linalg`` or ``from numpy import linalg``. Relative
+    imports are skipped, and so are files that cannot be parsed.
+
+    Args:
+        file (str): The path to the Python file.
+
+    Returns:
+        Set[str]: The top-level imported module names.
+    """
+    try:
+        with open(file, "rb") as f:
+            tree = ast.parse(f.read(), filename=file)
+    except (SyntaxError, ValueError, OSError) as e:
+        logger.debug(f"Skipping {file}: {e}")
+        return set()
+
+    imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name.partition(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            imports.add(node.module.partition(".")[0])
+    return imports
+
+
+def list_python_files(path: Path) -> List[str]:
+    """
+    Lists the Python files found recursively under `path`.
+
+    Args:
+        path (Path): The root directory of the project.
+
+    Returns:
+        List[str]: The paths of the Python files.
+    """
+    if not path.is_dir():
+        raise NotADirectoryError(f"{path} is not a directory.")
+
+    return list(glob.iglob(f"{path}/**/*.py", recursive=True))
+
+
+def local_modules(path: Path) -> Set[str]:
+    """
+    Returns the names of the modules and packages found at the root of a project,
+    which are importable without installing anything.
+    """
+    names = set()
+    for entry in os.scandir(path):
+        if entry.is_file() and entry.name.endswith(".py"):
+            names.add(entry.name[:-3])
+        elif entry.is_dir() and os.path.exists(os.path.join(entry.path, "__init__.py")):
+            names.add(entry.name)
+    return names
+
+
+def scan_imports(path: Path, jobs: Optional[int] = None) -> Set[str]:
+    """
+    Extracts the de-duplicated third party imports of a whole Python project, parsing
+    the files in a pool of worker processes. Standard library modules and the
+    project's own top-level modules are left out.
+
+    Args:
+        path (Path): The root directory of the project.
+        jobs (int, optional): Number of worker processes. Defaults to the CPU count.
+
+    Returns:
+        Set[str]: The top-level imported module names.
+    """
+    files = list_python_files(path)
+    logger.info(f"Parsing {len(files)} Python files in {path}...")
+
+    imports = set()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        chunksize = max(1, len(files) // ((jobs or os.cpu_count() or 1) * 4))
+        for file_imports in executor.map(extract_imports, files, chunksize=chunksize):
+            imports |= file_imports
+
+    return imports - STDLIB_MODULES - local_modules(path)
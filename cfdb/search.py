@@ -0,0 +1,212 @@
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+
+from cfdb.log import logger
+from cfdb.models.schema import Feedstocks, ImportNames, Packages
+
+# Searchable kinds of names and their dimension tables
+KINDS = {
+    "package": Packages.__table__,
+    "feedstock": Feedstocks.__table__,
+    "import": ImportNames.__table__,
+}
+
+# Names scoring below this trigram similarity are not returned
+THRESHOLD = 0.3
+
+# (kind, name, similarity)
+SearchResult = Tuple[str, str, float]
+
+# External content FTS5 tables: the trigrams are indexed, the names themselves are
+# read from the dimension tables. The triggers keep the index in sync with every
+# insert of the updaters, shard merges included, within the same transaction.
+SQLITE_SEARCH_INDEX = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+        name, content='{table}', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+        INSERT INTO {table}_fts (rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+        INSERT INTO {table}_fts ({table}_fts, rowid, name)
+        VALUES ('delete', old.id, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF name ON {table}
+    BEGIN
+        INSERT INTO {table}_fts ({table}_fts, rowid, name)
+        VALUES ('delete', old.id, old.name);
+        INSERT INTO {table}_fts (rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    "INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')",
+)
+
+# GIN trigram indexes, maintained by PostgreSQL itself
+POSTGRESQL_SEARCH_INDEX = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS {table}_name_trgm ON {table} "
+    "USING gin (name gin_trgm_ops)",
+)
+
+
+def create_search_index(connection: Connection) -> bool:
+    """
+    Creates the trigram search indexes over the feedstock, package and import names,
+    and indexes the existing names. SQLite needs FTS5 with the trigram tokenizer
+    (SQLite 3.34), PostgreSQL the pg_trgm extension; without them, a warning is
+    logged and `search` falls back to substring scans.
+
+    Args:
+        connection (Connection): The SQLAlchemy connection object.
+
+    Returns:
+        bool: Whether the search indexes were created.
+    """
+    dialect_name = connection.dialect.name
+    if dialect_name == "sqlite":
+        statements = SQLITE_SEARCH_INDEX
+    elif dialect_name == "postgresql":
+        statements = POSTGRESQL_SEARCH_INDEX
+    else:
+        return False
+
+    try:
+        with connection.begin_nested():
+            for table in KINDS.values():
+                for statement in statements:
+                    connection.exec_driver_sql(statement.format(table=table.name))
+    except DBAPIError as e:
+        logger.warning(f"Search indexes are not supported by this database: {e.orig}")
+        return False
+    return True
+
+
+def has_search_index(connection: Connection) -> bool:
+    """
+    Returns whether the trigram search indexes exist.
+    """
+    dialect_name = connection.dialect.name
+    if dialect_name == "sqlite":
+        query = "SELECT count(*) FROM sqlite_master WHERE name = 'packages_fts'"
+    elif dialect_name == "postgresql":
+        query = "SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'"
+    else:
+        return False
+    return bool(connection.exec_driver_sql(query).scalar())
+
+
+def trigrams(value: str) -> Set[str]:
+    """
+    Returns the case-insensitive trigrams of a name, padded like pg_trgm's so that
+    the first and last characters weigh as much as the middle ones.
+    """
+    padded = f"  {value.lower()} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Returns the trigram similarity of two names, between 0 and 1.
+    """
+    a_trigrams, b_trigrams = trigrams(a), trigrams(b)
+    return len(a_trigrams & b_trigrams) / len(a_trigrams | b_trigrams)
+
+
+def _fts_query(query: str) -> str:
+    """
+    Returns the FTS5 query matching any trigram of `query`, each as a quoted string.
+    """
+    value = query.lower()
+    terms = {value[i : i + 3] for i in range(len(value) - 2)}
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in sorted(terms))
+
+
+def _candidates(
+    connection: Connection, table, query: str, limit: int, indexed: bool
+) -> List[str]:
+    if indexed and connection.dialect.name == "sqlite" and len(query) >= 3:
+        rows = connection.execute(
+            text(
+                f"SELECT name FROM {table.name}_fts WHERE {table.name}_fts MATCH :query "
+                "ORDER BY rank LIMIT :limit"
+            ),
+            {"query": _fts_query(query), "limit": limit},
+        )
+    elif indexed and connection.dialect.name == "postgresql":
+        rows = connection.execute(
+            text(
+                f"SELECT name FROM {table.name} WHERE name % :query "
+                "ORDER BY similarity(name, :query) DESC LIMIT :limit"
+            ),
+            {"query": query, "limit": limit},
+        )
+    else:
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace(
+            "_", "\\_"
+        )
+        rows = connection.execute(
+            select(table.c.name)
+            .where(table.c.name.ilike(pattern + "%", escape="\\"))
+            .limit(limit)
+        )
+    return [row[0] for row in rows]
+
+
+def search(
+    connection: Connection,
+    query: str,
+    kinds: Optional[Iterable[str]] = None,
+    limit: int = 10,
+    threshold: float = THRESHOLD,
+) -> List[SearchResult]:
+    """
+    Returns the names closest to a possibly misspelled query, e.g. "scikit-learn"
+    for "scikit_learn" or "pillow" for "PIL".
+
+    Candidates sharing trigrams with the query are retrieved through the search
+    indexes, then ranked by trigram similarity, identically on every backend.
+
+    Args:
+        connection (Connection): The SQLAlchemy connection object.
+        query (str): The name to look for.
+        kinds (Iterable[str], optional): The kinds of names to search, among
+            `KINDS`. Defaults to None, meaning all of them.
+        limit (int, optional): Maximum number of results. Defaults to 10.
+        threshold (float, optional): Minimum similarity of the results. Defaults to
+            THRESHOLD.
+
+    Returns:
+        List[SearchResult]: The kind, name and similarity of the results, most
+            similar first.
+    """
+    kinds = list(KINDS) if kinds is None else list(kinds)
+    unknown = set(kinds) - KINDS.keys()
+    if unknown:
+        raise ValueError(f"Unknown kinds of names: {', '.join(sorted(unknown))}.")
+
+    query = query.strip()
+    if not query:
+        return []
+
+    indexed = has_search_index(connection)
+    results = []
+    for kind in kinds:
+        for name in _candidates(
+            connection, KINDS[kind], query, max(20 * limit, 200), indexed
+        ):
+            score = similarity(query, name)
+            if score >= threshold or query.lower() in name.lower():
+                results.append((kind, name, score))
+
+    results.sort(key=lambda result: (-result[2], result[1], result[0]))
+    return results[:limit]
@@ -0,0 +1,206 @@
+import json
+import threading
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from cfdb.log import logger
+from cfdb.reader import CFDBReader
+
+# Maximum number of names of a batched lookup, and size of its body
+MAX_BATCH_SIZE = 10000
+MAX_BODY_SIZE = 4 * 1024 * 1024
+
+LOOKUPS = {
+    "who-provides": CFDBReader.who_provides,
+    "feedstock-of": CFDBReader.feedstock_of,
+    "feedstocks-for": CFDBReader.feedstocks_for_import,
+}
+
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def etag(data_version: int) -> str:
+    """
+    Returns the entity tag of every response rendered from a data version of the
+    database. Lookups are deterministic, so the tag changes only when the data does.
+    """
+    return f'"cfdb-{data_version}"'
+
+
+class CFDBServer(ThreadingHTTPServer):
+    """
+    CFDBServer serves the lookups of a CFDBReader over HTTP, so that many local
+    services share a single warm, pooled, read-only view of the database.
+
+    Routes:
+        GET /who-provides/<import name>: {"<import name>": [packages]}
+        GET /feedstock-of/<package name>: {"<package name>": [feedstocks]}
+        GET /feedstocks-for/<import name>: {"<import name>": [feedstocks]}
+        POST /who-provides, /feedstock-of, /feedstocks-for: a JSON array of names
+            in the body, answered with the same mapping for every name.
+        GET /version: {"data_version": <data version>}
+
+    Every response carries an ETag derived from the data version of the database,
+    and GET requests whose If-None-Match matches it are answered with an empty
+    304. Rendered responses are kept in an LRU cache, cleared whenever the data
+    version changes.
+
+    Args:
+        address (Tuple[str, int]): The host and port to listen on.
+        reader (CFDBReader): The reader answering the lookups.
+        cache_size (int, optional): Maximum number of cached responses. Defaults to
+            4096.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, address: Tuple[str, int], reader: CFDBReader, cache_size: int = 4096
+    ):
+        super().__init__(address, CFDBRequestHandler)
+        self.reader = reader
+        self.cache_size = cache_size
+        self._responses: Dict[tuple, bytes] = OrderedDict()
+        self._responses_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def response(self, data_version: int, lookup: str, names: Tuple[str, ...]):
+        """
+        Returns the cached body of a response, rendering it on a miss.
+
+        Args:
+            data_version (int): The data version the response is rendered from.
+            lookup (str): The route of the lookup, e.g. "who-provides".
+            names (Tuple[str, ...]): The names looked up.
+
+        Returns:
+            bytes: The body of the response.
+        """
+        key = (lookup, names)
+        with self._lock:
+            if data_version != self._responses_version:
+                self._responses.clear()
+                self._responses_version = data_version
+            body = self._responses.get(key)
+            if body is not None:
+                self._responses.move_to_end(key)
+                return body
+
+        if lookup == "version":
+            body = _dumps({"data_version": data_version})
+        else:
+            lookup_names = LOOKUPS[lookup]
+            body = _dumps(
+                {name: list(lookup_names(self.reader, name)) for name in names}
+            )
+
+        with self._lock:
+            if data_version == self._responses_version:
+                self._responses[key] = body
+                if len(self._responses) > self.cache_size:
+                    self._responses.popitem(last=False)
+        return body
+
+
+class CFDBRequestHandler(BaseHTTPRequestHandler):
+    server: CFDBServer
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are written separately, which delayed ACKs would
+    # otherwise stall on kept-alive connections
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send(self, status: HTTPStatus, body: bytes = b"", tag: Optional[str] = None):
+        self.send_response(status)
+        if tag is not None:
+            self.send_header("ETag", tag)
+            self.send_header("Cache-Control", "no-cache")
+        if status != HTTPStatus.NOT_MODIFIED:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != HTTPStatus.NOT_MODIFIED:
+            self.wfile.write(body)
+
+    def _error(self, status: HTTPStatus, message: str):
+        self._send(status, _dumps({"error": message}))
+
+    def _route(self) -> Tuple[str, str]:
+        lookup, _, name = urlsplit(self.path).path.lstrip("/").partition("/")
+        return lookup, unquote(name)
+
+    def do_GET(self):
+        lookup, name = self._route()
+        if lookup == "version" and not name:
+            names = ()
+        elif lookup in LOOKUPS and name:
+            names = (name,)
+        else:
+            return self._error(HTTPStatus.NOT_FOUND, f"Unknown route {self.path}.")
+
+        data_version = self.server.reader.current_version()
+        tag = etag(data_version)
+        if_none_match = self.headers.get("If-None-Match", "")
+        if tag in [t.strip() for t in if_none_match.split(",")] or if_none_match == "*":
+            return self._send(HTTPStatus.NOT_MODIFIED, tag=tag)
+
+        body = self.server.response(data_version, lookup, names)
+        self._send(HTTPStatus.OK, body, tag=tag)
+
+    def do_POST(self):
+        lookup, name = self._route()
+        if lookup not in LOOKUPS or name:
+            return self._error(HTTPStatus.NOT_FOUND, f"Unknown route {self.path}.")
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True
+            return self._error(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "The body is too large."
+            )
+        try:
+            names = json.loads(self.rfile.read(length))
+        except ValueError:
+            return self._error(HTTPStatus.BAD_REQUEST, "The body is not valid JSON.")
+        if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+            return self._error(
+                HTTPStatus.BAD_REQUEST, "The body must be a JSON array of names."
+            )
+        if len(names) > MAX_BATCH_SIZE:
+            return self._error(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                f"At most {MAX_BATCH_SIZE} names can be looked up at once.",
+            )
+
+        data_version = self.server.reader.current_version()
+        body = self.server.response(data_version, lookup, tuple(sorted(set(names))))
+        self._send(HTTPStatus.OK, body, tag=etag(data_version))
+
+
+def serve(
+    db_url: str, host: str = "127.0.0.1", port: int = 8000, cache_size: int = 4096
+) -> None:
+    """
+    Serves the lookups of a database over HTTP until interrupted.
+
+    Args:
+        db_url (str): The URL of the database.
+        host (str, optional): The host to listen on. Defaults to "127.0.0.1".
+        port (int, optional): The port to listen on. Defaults to 8000.
+        cache_size (int, optional): Maximum number of cached responses. Defaults to
+            4096.
+    """
+    with CFDBReader(db_url) as reader:
+        with CFDBServer((host, port), reader, cache_size=cache_size) as server:
+            logger.info(f"Serving {db_url} on http://{host}:{server.server_port}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                logger.info("Shutting down.")
@@ -0,0 +1,122 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+# Key of the packages providing the import name ending at a node. Segments are
+# always strings, so it cannot collide with a child.
+_PACKAGES = None
+
+# (matched import name, packages providing it)
+Match = Tuple[Optional[str], Tuple[str, ...]]
+
+
+class ImportTrie:
+    """
+    Trie over the segments of dotted import names, answering longest-prefix matches
+    in O(depth): ``google.cloud.storage.blob`` resolves to the packages providing
+    ``google.cloud.storage`` when the submodule itself is not mapped.
+
+    Nodes are plain dictionaries, saved as JSON so that loading a cached trie never
+    runs code from the cache file.
+    """
+
+    def __init__(self, root: Optional[dict] = None):
+        self.root = {} if root is None else root
+
+    @classmethod
+    def from_mappings(cls, mappings: Iterable[Tuple[str, str]]) -> "ImportTrie":
+        """
+        Builds a trie from (import name, package name) pairs.
+
+        Args:
+            mappings (Iterable[Tuple[str, str]]): The import to package mappings.
+
+        Returns:
+            ImportTrie: The trie.
+        """
+        trie = cls()
+        terminals = []
+        for import_name, package_name in mappings:
+            node = trie.root
+            for segment in import_name.split("."):
+                node = node.setdefault(segment, {})
+            if _PACKAGES not in node:
+                node[_PACKAGES] = set()
+                terminals.append(node)
+            node[_PACKAGES].add(package_name)
+
+        for node in terminals:
+            node[_PACKAGES] = tuple(sorted(node[_PACKAGES]))
+        return trie
+
+    def match(self, name: str) -> Match:
+        """
+        Returns the longest mapped prefix of a dotted import name.
+
+        Args:
+            name (str): The import name, e.g. "google.cloud.storage.blob".
+
+        Returns:
+            Match: The matched import name and the packages providing it, or
+                (None, ()) when no prefix is mapped.
+        """
+        segments = name.split(".")
+        node, matched, packages = self.root, 0, ()
+        for depth, segment in enumerate(segments, start=1):
+            node = node.get(segment)
+            if node is None:
+                break
+            if _PACKAGES in node:
+                matched, packages = depth, node[_PACKAGES]
+
+        if not matched:
+            return None, ()
+        return ".".join(segments[:matched]), packages
+
+    def match_many(self, names: Iterable[str]) -> Dict[str, Match]:
+        """
+        Returns the longest mapped prefix of each of the dotted import names.
+        """
+        return {name: self.match(name) for name in names}
+
+    def save(self, path: Path) -> None:
+        """
+        Writes the trie to `path` as JSON, atomically replacing any previous file.
+        """
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(_dump_node(self.root), f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "ImportTrie":
+        """
+        Reads a trie written by `save`.
+        """
+        with open(path) as f:
+            return cls(_load_node(json.load(f)))
+
+
+def _dump_node(node: dict) -> list:
+    """
+    Returns a node as a JSON-serializable [packages or None, children] pair, as JSON
+    object keys cannot hold the `_PACKAGES` key.
+    """
+    children = {
+        segment: _dump_node(child)
+        for segment, child in node.items()
+        if segment is not _PACKAGES
+    }
+    return [node.get(_PACKAGES), children]
+
+
+def _load_node(data: list) -> dict:
+    """
+    Returns the node of a [packages or None, children] pair written by `_dump_node`.
+    """
+    packages, children = data
+    node = {segment: _load_node(child) for segment, child in children.items()}
+    if packages is not None:
+        node[_PACKAGES] = tuple(packages)
+    return node
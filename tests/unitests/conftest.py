@@ -0,0 +1,108 @@
+import os
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from cfdb.models import migrations
+from cfdb.models.schema import Base
+from cfdb.populate.feedstock_outputs import _write_feedstock_outputs
+from cfdb.populate.import_to_package_maps import _write_import_maps
+
+# The PostgreSQL tests run when CF_TEST_DATABASE points to a throwaway database
+POSTGRES_URL = os.environ.get("CF_TEST_DATABASE", "")
+
+HASH = "00" * 20
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "sqlite_only: the test only runs against the SQLite database"
+    )
+
+
+def _backends():
+    yield "sqlite"
+    if POSTGRES_URL.startswith("postgresql"):
+        yield "postgresql"
+
+
+@pytest.fixture(params=list(_backends()))
+def db_url(request, tmp_path):
+    """
+    URL of an empty database at the current schema version, on SQLite and, when
+    configured, on PostgreSQL.
+    """
+    if request.param != "sqlite" and request.node.get_closest_marker("sqlite_only"):
+        pytest.skip("SQLite only")
+    if request.param == "sqlite":
+        db_url = f"sqlite:///{tmp_path / 'cf-database.db'}"
+    else:
+        db_url = POSTGRES_URL
+
+    engine = create_engine(db_url)
+    Base.metadata.drop_all(engine)
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    engine.dispose()
+    yield db_url
+
+    if request.param == "postgresql":
+        engine = create_engine(db_url)
+        Base.metadata.drop_all(engine)
+        engine.dispose()
+
+
+@pytest.fixture
+def engine(db_url):
+    engine = create_engine(db_url)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+@pytest.fixture
+def populate():
+    """
+    Returns a function writing feedstock outputs and import to package maps to a
+    test database, through the updaters' writers.
+
+    The function takes the URL of the database, the feedstock outputs as (package
+    name, feedstocks) pairs, the import to package map partitions as partition to
+    {package name: import names} mappings, and the hash of the blobs.
+    """
+
+    def _populate(db_url, outputs=(), import_maps=None, file_hash=HASH):
+        engine = create_engine(db_url)
+        with sessionmaker(bind=engine)() as session:
+            if outputs:
+                _write_feedstock_outputs(
+                    session,
+                    [
+                        (
+                            Path(f"{package[0]}/{package}.json"),
+                            file_hash,
+                            package,
+                            feedstocks,
+                        )
+                        for package, feedstocks in outputs
+                    ],
+                )
+            if import_maps:
+                _write_import_maps(
+                    session,
+                    [
+                        (partition, file_hash, mapping)
+                        for partition, mapping in import_maps.items()
+                    ],
+                )
+            session.commit()
+        engine.dispose()
+
+    return _populate
@@ -0,0 +1,227 @@
+import asyncio
+import json
+import threading
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("greenlet")
+
+from cfdb.aio import AsyncCFDBHandler, to_async_url
+from cfdb.populate import feedstock_outputs
+from cfdb.models.schema import (
+    Artifacts,
+    ArtifactsFilePaths,
+    FeedstockOutputs,
+    Feedstocks,
+    ImportNames,
+    ImportToPackageMaps,
+    Packages,
+)
+
+
+@pytest.fixture
+def outputs_dir(tmp_path):
+    root_dir = tmp_path / "outputs"
+    blobs = {
+        "n/u/m/numpy.json": ["numpy"],
+        "p/a/n/pandas.json": ["pandas"],
+        "l/i/b/libblas.json": ["blas", "openblas"],
+    }
+    for rel_path, feedstocks in blobs.items():
+        file = root_dir / rel_path
+        file.parent.mkdir(parents=True)
+        file.write_text(json.dumps({"feedstocks": feedstocks}))
+    return root_dir
+
+
+@pytest.fixture
+def import_maps_dir(tmp_path):
+    root_dir = tmp_path / "import_to_pkg_maps"
+    root_dir.mkdir()
+    (root_dir / "nu.json").write_text(
+        json.dumps({"numpy": {"elements": ["numpy", "numpy-base"]}})
+    )
+    (root_dir / "pa.json").write_text(json.dumps({"pandas": {"elements": ["pandas"]}}))
+    return root_dir
+
+
+@pytest.fixture
+def artifacts_dir(tmp_path):
+    root_dir = tmp_path / "artifacts"
+    for name, platform in [("numpy", "linux-64"), ("numpy", "win-64")]:
+        file = root_dir / name / "conda-forge" / platform / f"{name}-1.26.4.json"
+        file.parent.mkdir(parents=True)
+        file.write_text(
+            json.dumps(
+                {
+                    "index": {"name": name, "version": "1.26.4", "subdir": platform},
+                    "files": ["numpy/__init__.py", "numpy/linalg/__init__.py"],
+                }
+            )
+        )
+    return root_dir
+
+
+@pytest.fixture
+def db_url(db_url):
+    if db_url.startswith("postgresql"):
+        pytest.importorskip("asyncpg")
+    return db_url
+
+
+def _query(db_url, *columns, joins=()):
+    engine = create_engine(db_url)
+    with sessionmaker(bind=engine)() as session:
+        query = select(*columns)
+        for target, onclause in joins:
+            query = query.join(target, onclause)
+        rows = session.execute(query).all()
+    engine.dispose()
+    return sorted(tuple(row) for row in rows)
+
+
+def test_to_async_url():
+    assert (
+        to_async_url("sqlite:///cf-database.db") == "sqlite+aiosqlite:///cf-database.db"
+    )
+    assert (
+        to_async_url("postgresql://user:pw@localhost/cfdb")
+        == "postgresql+asyncpg://user:pw@localhost/cfdb"
+    )
+    assert to_async_url("sqlite+aiosqlite:///x.db") == "sqlite+aiosqlite:///x.db"
+
+
+@pytest.mark.sqlite_only
+def test_sqlite_uses_single_writer(db_url):
+    handler = AsyncCFDBHandler(db_url, db_concurrency=8)
+    assert handler.db_concurrency == 1
+
+
+def test_update_feedstock_outputs_async(db_url, outputs_dir):
+    async def _run():
+        async with AsyncCFDBHandler(db_url) as handler:
+            await handler.update_feedstock_outputs(outputs_dir)
+            # a second run over unchanged files is a no-op
+            await handler.update_feedstock_outputs(outputs_dir)
+
+    asyncio.run(_run())
+
+    rows = _query(
+        db_url,
+        Feedstocks.name,
+        Packages.name,
+        joins=[
+            (FeedstockOutputs, FeedstockOutputs.feedstock_id == Feedstocks.id),
+            (Packages, FeedstockOutputs.package_id == Packages.id),
+        ],
+    )
+    assert rows == [
+        ("blas", "libblas"),
+        ("numpy", "numpy"),
+        ("openblas", "libblas"),
+        ("pandas", "pandas"),
+    ]
+
+    # the outputs of removed blobs are deleted
+    (outputs_dir / "p/a/n/pandas.json").unlink()
+    asyncio.run(_run())
+    assert _query(db_url, FeedstockOutputs.path) == [
+        ("l/i/b/libblas.json",),
+        ("l/i/b/libblas.json",),
+        ("n/u/m/numpy.json",),
+    ]
+
+
+def test_feedstock_outputs_workers_bound_the_parsed_batches(
+    db_url, outputs_dir, monkeypatch
+):
+    lock = threading.Lock()
+    parsed = []
+    pending = [0]
+
+    def _parse_output(*args):
+        with lock:
+            pending[0] += 1
+            parsed.append(pending[0])
+        return parse_output(*args)
+
+    def _write_feedstock_outputs(session, records):
+        with lock:
+            pending[0] -= len(records)
+        write_feedstock_outputs(session, records)
+
+    parse_output = feedstock_outputs._parse_output
+    write_feedstock_outputs = feedstock_outputs._write_feedstock_outputs
+    monkeypatch.setattr(feedstock_outputs, "_parse_output", _parse_output)
+    monkeypatch.setattr(
+        feedstock_outputs, "_write_feedstock_outputs", _write_feedstock_outputs
+    )
+
+    async def _run():
+        async with AsyncCFDBHandler(db_url) as handler:
+            await feedstock_outputs.update_async(
+                handler.Session,
+                outputs_dir,
+                handler.file_semaphore,
+                handler.db_semaphore,
+                batch_size=1,
+                num_workers=2,
+            )
+
+    asyncio.run(_run())
+    assert len(parsed) == 3
+    assert max(parsed) <= 2
+    assert _query(db_url, Packages.name) == [("libblas",), ("numpy",), ("pandas",)]
+
+
+def test_update_import_to_package_maps_async(db_url, import_maps_dir):
+    async def _run():
+        async with AsyncCFDBHandler(db_url) as handler:
+            await handler.update_import_to_package_maps(import_maps_dir)
+            await handler.update_import_to_package_maps(import_maps_dir)
+
+    asyncio.run(_run())
+
+    rows = _query(
+        db_url,
+        ImportNames.name,
+        Packages.name,
+        joins=[
+            (ImportToPackageMaps, ImportToPackageMaps.import_id == ImportNames.id),
+            (Packages, ImportToPackageMaps.package_id == Packages.id),
+        ],
+    )
+    assert rows == [
+        ("numpy", "numpy"),
+        ("numpy", "numpy-base"),
+        ("pandas", "pandas"),
+    ]
+    assert _query(db_url, Packages.name) == [
+        ("numpy",),
+        ("numpy-base",),
+        ("pandas",),
+    ]
+
+
+def test_update_artifacts_async(db_url, artifacts_dir):
+    async def _run():
+        async with AsyncCFDBHandler(db_url) as handler:
+            await handler.update_artifacts(artifacts_dir)
+            await handler.update_artifacts(artifacts_dir)
+
+    asyncio.run(_run())
+
+    assert _query(db_url, Artifacts.name, Artifacts.platform) == [
+        ("numpy-1.26.4", "linux-64"),
+        ("numpy-1.26.4", "win-64"),
+    ]
+    assert _query(db_url, ArtifactsFilePaths.dir) == [
+        ("__init__.py",),
+        ("__init__.py",),
+        ("linalg",),
+        ("numpy",),
+    ]
@@ -0,0 +1,109 @@
+import pytest
+from typer.testing import CliRunner
+
+from cfdb import analyze
+from cfdb.main import app
+from cfdb.reader import to_read_only_url
+
+pytest.importorskip("duckdb")
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def db_url(db_url, populate):
+    populate(
+        db_url,
+        [
+            ("numpy", ["numpy"]),
+            ("libblas", ["openblas", "blas"]),
+            ("liblapack", ["openblas"]),
+        ],
+        {
+            "nu": {"numpy": ["numpy", "numpy.linalg"], "numpy-base": ["numpy"]},
+            "sc": {"scipy": ["scipy"]},
+        },
+    )
+    return db_url
+
+
+def test_analyses(engine, tmp_path, monkeypatch):
+    # the copy of other databases than SQLite is made in the working directory
+    monkeypatch.chdir(tmp_path)
+    assert analyze.analyze(engine, "top-feedstocks", limit=2) == (
+        ["feedstock", "packages"],
+        [("openblas", 2), ("blas", 1)],
+    )
+    assert analyze.analyze(engine, "shared-imports") == (
+        ["import_name", "packages", "package_names"],
+        [("numpy", 2, "numpy numpy-base")],
+    )
+    assert analyze.analyze(engine, "partition-sizes") == (
+        ["min_mappings", "partitions", "mappings"],
+        [(1, 1, 1), (2, 1, 3)],
+    )
+    with pytest.raises(ValueError):
+        analyze.analyze(engine, "top-packages")
+
+
+@pytest.mark.sqlite_only
+def test_copy_is_refreshed_after_updates(db_url, engine, populate, tmp_path):
+    duckdb_path = tmp_path / "cf-database.duckdb"
+    assert analyze.default_path(str(engine.url)) == duckdb_path
+    assert analyze.default_path(str(to_read_only_url(str(engine.url)))) == duckdb_path
+
+    assert analyze.analyze(engine, "top-feedstocks")[1][0] == ("openblas", 2)
+    # the copy and the cached results are reused while the data version holds
+    assert not analyze.sync(engine, duckdb_path)
+    with analyze.duckdb.connect(str(duckdb_path)) as connection:
+        assert connection.execute("SELECT count(*) FROM cfdb_results").fetchone() == (
+            1,
+        )
+
+    populate(db_url, [("blas-devel", ["blas"]), ("libcblas", ["blas"])])
+    assert analyze.analyze(engine, "top-feedstocks")[1][0] == ("blas", 3)
+
+
+def test_cli(db_url, tmp_path):
+    duckdb_path = tmp_path / "analysis.duckdb"
+    runner = CliRunner()
+
+    result = runner.invoke(
+        app,
+        [
+            "analyze",
+            "top-feedstocks",
+            "-n",
+            "1",
+            "--duckdb-path",
+            str(duckdb_path),
+            "--db-url",
+            db_url,
+        ],
+    )
+    assert result.exit_code == 0
+    assert result.stdout.splitlines()[-2:] == ["feedstock\tpackages", "openblas\t2"]
+    assert duckdb_path.exists()
+
+    result = runner.invoke(
+        app,
+        ["analyze", "sync", "--duckdb-path", str(duckdb_path), "--db-url", db_url],
+    )
+    assert result.exit_code == 0
+
+
+@pytest.mark.sqlite_only
+def test_cli_defaults_to_the_copy_next_to_the_database(db_url, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db_url = "sqlite:///cf-database.db"
+    runner = CliRunner()
+
+    for name in ("top-feedstocks", "shared-imports", "partition-sizes"):
+        result = runner.invoke(app, ["analyze", name, "--db-url", db_url])
+        assert result.exit_code == 0, result.output
+    result = runner.invoke(app, ["analyze", "sync", "--db-url", db_url])
+    assert result.exit_code == 0, result.output
+
+    # sync and the analyses share the same copy
+    assert sorted(path.name for path in tmp_path.glob("*.duckdb")) == [
+        "cf-database.duckdb"
+    ]
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from typer.testing import CliRunner
+
+from cfdb.bloom import BloomFilter, load_import_filter, update_import_filter
+from cfdb.main import app
+from cfdb.models import migrations
+from cfdb.reader import CFDBReader
+
+
+@pytest.fixture
+def db_url(db_url, populate):
+    populate(
+        db_url,
+        [("numpy", ["numpy"])],
+        {"nu": {"numpy": ["numpy", "numpy.linalg", "Numpy_Doc"]}},
+    )
+    engine = create_engine(db_url)
+    with engine.begin() as connection:
+        update_import_filter(connection)
+    engine.dispose()
+    return db_url
+
+
+def test_no_false_negatives_and_bounded_false_positives():
+    names = [f"module_{idx}" for idx in range(2000)]
+    bloom = BloomFilter.from_items(names, fp_rate=0.01)
+
+    assert all(name in bloom for name in names)
+    false_positives = sum(f"unknown_{idx}" in bloom for idx in range(10000))
+    assert false_positives / 10000 < 0.02
+    assert bloom.false_positive_rate == pytest.approx(0.01, rel=0.5)
+
+    # a tighter rate costs more bits
+    assert BloomFilter.for_capacity(2000, 0.001).num_bits > bloom.num_bits
+    with pytest.raises(ValueError):
+        BloomFilter.for_capacity(2000, 0)
+
+
+def test_serialization():
+    bloom = BloomFilter.from_items(["numpy", "scipy"], fp_rate=0.05)
+    loaded = BloomFilter.from_bytes(bloom.to_bytes())
+
+    assert (loaded.num_bits, loaded.num_hashes, loaded.num_items, loaded.fp_rate) == (
+        bloom.num_bits,
+        bloom.num_hashes,
+        2,
+        0.05,
+    )
+    assert "numpy" in loaded and "scipy" in loaded
+    with pytest.raises(ValueError):
+        BloomFilter.from_bytes(b"\x00" * 64)
+
+
+def test_stale_filters_are_ignored(db_url, populate):
+    engine = create_engine(db_url)
+    with engine.connect() as connection:
+        bloom = load_import_filter(connection)
+    assert "numpy-linalg" in bloom and "numpy-doc" in bloom
+
+    populate(db_url, import_maps={"nu": {"numpy": ["numpy.fft"]}})
+    with engine.connect() as connection:
+        assert load_import_filter(connection) is None
+
+    with engine.begin() as connection:
+        assert "numpy-fft" in update_import_filter(connection)
+        version = migrations.get_data_version(connection)
+    # an up-to-date filter is not rebuilt
+    with engine.begin() as connection:
+        update_import_filter(connection)
+        assert migrations.get_data_version(connection) == version
+    engine.dispose()
+
+
+def test_reader_rejects_misses_without_querying(db_url):
+    with CFDBReader(db_url, check_interval=0) as reader:
+        assert reader.import_filter is not None
+        assert reader.who_provides("Numpy.Linalg") == ("numpy",)
+        assert reader.who_provides("numpy_doc") == ("numpy",)
+
+        assert not reader.may_provide("os.path")
+        assert reader.who_provides("os.path") == ()
+        assert reader.feedstocks_for_import("os.path") == ()
+        assert reader._who_provides.cache_info().currsize == 2
+        assert reader._feedstocks_for_import.cache_info().currsize == 0
+
+        assert list(reader.resolve_imports(["numpy", "os", "sys"])) == ["numpy"]
+
+
+def test_cli_rebuilds_the_filter(tmp_path):
+    maps_dir = tmp_path / "import_maps"
+    maps_dir.mkdir()
+    (maps_dir / "nu.json").write_text(json.dumps({"numpy": {"elements": ["numpy"]}}))
+    db_url = f"sqlite:///{tmp_path / 'cf-database.db'}"
+    runner = CliRunner()
+
+    result = runner.invoke(
+        app,
+        [
+            "update-import-to-package-maps",
+            "--path",
+            str(maps_dir),
+            "--filter-fp-rate",
+            "0.001",
+            "--db-url",
+            db_url,
+        ],
+    )
+    assert result.exit_code == 0
+    with CFDBReader(db_url) as reader:
+        assert reader.import_filter.fp_rate == 0.001
+        assert reader.import_filter.num_items == 1
+
+    result = runner.invoke(
+        app,
+        [
+            "update-import-to-package-maps",
+            "--path",
+            str(maps_dir),
+            "--filter-fp-rate",
+            "1.5",
+            "--db-url",
+            db_url,
+        ],
+    )
+    assert result.exit_code == 2
@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import create_engine, insert
+from typer.testing import CliRunner
+
+from cfdb import export
+from cfdb.main import app
+from cfdb.models.schema import Artifacts
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+HASH = "ab" * 20
+
+
+@pytest.fixture
+def db_url(db_url, populate):
+    populate(
+        db_url,
+        [(f"pkg{idx}", ["openblas"]) for idx in range(10)],
+        {"nu": {"numpy": ["numpy"]}},
+        file_hash=HASH,
+    )
+    engine = create_engine(db_url)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(Artifacts),
+            [
+                {"name": "numpy-1.26.4", "platform": platform, "version": "1.26.4"}
+                for platform in ("linux-64", "osx-arm64", "win-64")
+            ],
+        )
+    engine.dispose()
+    return db_url
+
+
+def test_export_tables(db_url, tmp_path):
+    output_dir = tmp_path / "export"
+    engine = create_engine(db_url)
+    num_rows = export.export_tables(engine, output_dir, row_group_size=4)
+    engine.dispose()
+
+    assert num_rows == {
+        "feedstocks": 1,
+        "packages": 11,
+        "feedstock_outputs": 10,
+        "import_to_package_mapping": 1,
+        "artifacts": 3,
+    }
+    assert sorted(path.name for path in output_dir.iterdir()) == sorted(
+        f"{name}.parquet" for name in num_rows
+    )
+
+    outputs = pq.ParquetFile(output_dir / "feedstock_outputs.parquet")
+    # row groups are the streamed batches
+    assert outputs.metadata.num_row_groups == 3
+    assert outputs.schema_arrow.metadata[b"cfdb_data_version"] == b"2"
+    table = outputs.read()
+    assert table.column("hash").to_pylist() == [bytes.fromhex(HASH)] * 10
+    assert table.column("path").to_pylist()[0] == "p/pkg0.json"
+
+    # the repeated names are dictionary encoded
+    path_column = outputs.metadata.row_group(0).column(2)
+    assert path_column.path_in_schema == "path"
+    assert path_column.has_dictionary_page
+    hash_column = outputs.metadata.row_group(0).column(3)
+    assert not hash_column.has_dictionary_page
+
+    artifacts = pq.read_table(output_dir / "artifacts.parquet")
+    assert artifacts.column("platform").to_pylist() == [
+        "linux-64",
+        "osx-arm64",
+        "win-64",
+    ]
+
+
+def test_cli(db_url, tmp_path):
+    runner = CliRunner()
+    output_dir = tmp_path / "export"
+
+    result = runner.invoke(
+        app,
+        ["export", "--format", "parquet", "-o", str(output_dir), "--db-url", db_url],
+    )
+    assert result.exit_code == 0
+    assert pq.read_table(output_dir / "packages.parquet").num_rows == 11
+
+    result = runner.invoke(
+        app, ["export", "--format", "csv", "-o", str(output_dir), "--db-url", db_url]
+    )
+    assert result.exit_code == 2
@@ -0,0 +1,104 @@
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from typer.testing import CliRunner
+
+from cfdb.export import export_index
+from cfdb.index import LookupIndex, normalize_name
+from cfdb.main import app
+from cfdb.models import migrations, schema
+from cfdb.reader import CFDBReader
+
+
+@pytest.fixture
+def db_url(db_url, populate):
+    populate(
+        db_url,
+        [("numpy", ["numpy"]), ("libblas", ["openblas", "blas"]), ("pytz", ["pytz-ü"])],
+        {"nu": {"numpy": ["numpy", "numpy.linalg"], "numpy-base": ["numpy"]}},
+    )
+    return db_url
+
+
+def test_export_index(engine, tmp_path):
+    index_file = tmp_path / "cf-database.idx"
+    data_version = export_index(engine, index_file)
+
+    with LookupIndex(index_file) as index:
+        assert index.data_version == data_version
+        assert index.who_provides("numpy") == ("numpy", "numpy-base")
+        assert index.who_provides("numpy.linalg") == ("numpy",)
+        assert index.who_provides("scipy") == ()
+        # package names are not import names
+        assert index.who_provides("libblas") == ()
+        assert index.feedstock_of("libblas") == ("blas", "openblas")
+        assert index.feedstock_of("pytz") == ("pytz-ü",)
+        assert index.feedstock_of("numpy-base") == ()
+
+
+def test_lookups_are_normalized(db_url, engine, populate, tmp_path):
+    populate(
+        db_url,
+        import_maps={"pi": {"Pillow": ["PIL"]}, "pi-compat": {"pil-compat": ["pil"]}},
+    )
+    index_file = tmp_path / "cf-database.idx"
+    export_index(engine, index_file)
+
+    with LookupIndex(index_file) as index:
+        assert index.feedstock_of("NumPy") == ("numpy",)
+        assert index.who_provides("Numpy.Linalg") == ("numpy",)
+        # exact matches win over their normalized variants
+        assert index.who_provides("PIL") == ("Pillow",)
+        assert index.who_provides("pil") == ("pil-compat",)
+        assert index.who_provides("Pil") == ("Pillow", "pil-compat")
+        assert index.who_provides("Numpy-Base") == ()
+
+        # the index answers like the database
+        with CFDBReader(db_url) as reader:
+            for name in ("PIL", "pil", "Pil", "NUMPY", "numpy_linalg", "scipy"):
+                assert index.who_provides(name) == reader.who_provides(name)
+            for name in ("LibBlas", "numpy-base", "Pytz"):
+                assert index.feedstock_of(name) == reader.feedstock_of(name)
+
+
+def test_normalize_name_matches_the_schema():
+    for name in ("Scikit_Learn", "ruamel.yaml", "zope..interface", "numpy"):
+        assert normalize_name(name) == schema.normalize_name(name)
+
+
+def test_export_empty_index(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    export_index(engine, tmp_path / "empty.idx")
+
+    with LookupIndex(tmp_path / "empty.idx") as index:
+        assert index.who_provides("numpy") == ()
+
+
+def test_invalid_index(tmp_path):
+    (tmp_path / "invalid.idx").write_bytes(b"\0" * 1024)
+
+    with pytest.raises(ValueError):
+        LookupIndex(tmp_path / "invalid.idx")
+
+
+def test_reader_does_not_import_sqlalchemy():
+    code = (
+        "import sys, cfdb.index; "
+        "assert 'sqlalchemy' not in sys.modules and 'cfdb.log' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_cli_export_index(db_url, tmp_path):
+    index_file = tmp_path / "cli.idx"
+    result = CliRunner().invoke(
+        app, ["export-index", "-o", str(index_file), "--db-url", db_url]
+    )
+
+    assert result.exit_code == 0
+    with LookupIndex(index_file) as index:
+        assert index.feedstock_of("numpy") == ("numpy",)
@@ -0,0 +1,206 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, func, inspect, select, text
+from sqlalchemy.orm import sessionmaker
+
+from cfdb.models.migrations import (
+    get_schema_version,
+    set_metadata,
+    upgrade,
+)
+from cfdb.models.schema import (
+    SCHEMA_VERSION,
+    FeedstockOutputs,
+    Feedstocks,
+    ImportFeedstocks,
+    ImportNames,
+    ImportToPackageMaps,
+    ImportToPackageMapsHistory,
+    Packages,
+)
+from cfdb.populate import import_to_package_maps
+
+# Layout created by cfdb before the schema was versioned
+V1_SCHEMA = """
+CREATE TABLE feedstocks (name VARCHAR NOT NULL, PRIMARY KEY (name));
+CREATE INDEX ix_feedstocks_name ON feedstocks (name);
+CREATE TABLE packages (name VARCHAR NOT NULL, PRIMARY KEY (name));
+CREATE INDEX ix_packages_name ON packages (name);
+CREATE TABLE feedstock_outputs (
+    id BLOB(16) NOT NULL, path VARCHAR, feedstock_name INTEGER, package_name INTEGER,
+    hash VARCHAR, PRIMARY KEY (id),
+    FOREIGN KEY(feedstock_name) REFERENCES feedstocks (name),
+    FOREIGN KEY(package_name) REFERENCES packages (name)
+);
+CREATE UNIQUE INDEX feedstock_output_index ON feedstock_outputs (feedstock_name, package_name);
+CREATE TABLE import_to_package_mapping (
+    id BLOB(16) NOT NULL, import_name VARCHAR, parent_package_name VARCHAR,
+    partition VARCHAR, hash VARCHAR, PRIMARY KEY (id),
+    FOREIGN KEY(parent_package_name) REFERENCES packages (name)
+);
+CREATE UNIQUE INDEX import_to_package_mapping_index ON import_to_package_mapping (import_name, parent_package_name);
+CREATE TABLE artifacts_file_paths (id INTEGER NOT NULL, parent_id INTEGER, dir VARCHAR, PRIMARY KEY (id));
+CREATE TABLE relations_map_file_paths (
+    id INTEGER NOT NULL, file_path VARCHAR, PRIMARY KEY (id),
+    FOREIGN KEY(file_path) REFERENCES artifacts_file_paths (id)
+);
+CREATE TABLE artifacts (
+    name VARCHAR NOT NULL, package_name VARCHAR, platform VARCHAR NOT NULL,
+    version VARCHAR, relational_id INTEGER, PRIMARY KEY (name, platform),
+    FOREIGN KEY(package_name) REFERENCES packages (name),
+    FOREIGN KEY(relational_id) REFERENCES relations_map_file_paths (id)
+);
+CREATE INDEX ix_artifacts_name ON artifacts (name);
+INSERT INTO feedstocks VALUES ('numpy'), ('openblas');
+INSERT INTO packages VALUES ('numpy'), ('libblas'), ('numpy-base');
+INSERT INTO feedstock_outputs VALUES
+    (x'01', 'n/u/m/numpy.json', 'numpy', 'numpy', 'aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa'),
+    (x'02', 'l/i/b/libblas.json', 'openblas', 'libblas', 'bbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbbb');
+INSERT INTO import_to_package_mapping VALUES
+    (x'03', 'numpy', 'numpy', '', 'cccccccccccccccccccccccccccccccccccccccc'),
+    (x'04', 'numpy', 'numpy-base', '', 'cccccccccccccccccccccccccccccccccccccccc');
+"""
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cf-database.db'}")
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def v1_engine(engine):
+    with engine.begin() as connection:
+        for statement in V1_SCHEMA.split(";"):
+            if statement.strip():
+                connection.exec_driver_sql(statement)
+    return engine
+
+
+def test_empty_database_gets_current_schema(engine):
+    with engine.begin() as connection:
+        assert get_schema_version(connection) is None
+        upgrade(connection)
+        assert get_schema_version(connection) == SCHEMA_VERSION
+
+
+def test_detects_v1_layout(v1_engine):
+    with v1_engine.connect() as connection:
+        assert get_schema_version(connection) == 1
+
+
+def test_migrates_v1_layout_in_place(v1_engine):
+    with v1_engine.begin() as connection:
+        upgrade(connection)
+
+    with v1_engine.connect() as connection:
+        assert get_schema_version(connection) == SCHEMA_VERSION
+        assert not [
+            table
+            for table in inspect(connection).get_table_names()
+            if table.startswith("_v1_")
+        ]
+
+        outputs = connection.execute(
+            select(Feedstocks.name, Packages.name, FeedstockOutputs.hash)
+            .join(FeedstockOutputs, FeedstockOutputs.feedstock_id == Feedstocks.id)
+            .join(Packages, FeedstockOutputs.package_id == Packages.id)
+            .order_by(Feedstocks.name)
+        ).all()
+        assert [tuple(row) for row in outputs] == [
+            ("numpy", "numpy", b"\xaa" * 20),
+            ("openblas", "libblas", b"\xbb" * 20),
+        ]
+
+        mappings = connection.execute(
+            select(ImportNames.name, Packages.name)
+            .join(ImportToPackageMaps, ImportToPackageMaps.import_id == ImportNames.id)
+            .join(Packages, ImportToPackageMaps.package_id == Packages.id)
+            .order_by(Packages.name)
+        ).all()
+        assert [tuple(row) for row in mappings] == [
+            ("numpy", "numpy"),
+            ("numpy", "numpy-base"),
+        ]
+
+        normalized_names = connection.execute(
+            select(Packages.normalized_name).order_by(Packages.name)
+        ).scalars()
+        assert list(normalized_names) == ["libblas", "numpy", "numpy-base"]
+
+        ddl = connection.execute(
+            text("SELECT sql FROM sqlite_master WHERE name = 'feedstock_outputs'")
+        ).scalar()
+        assert "WITHOUT ROWID" in ddl
+
+
+def test_update_after_migration_replaces_v1_partitions(v1_engine, tmp_path):
+    with v1_engine.begin() as connection:
+        upgrade(connection)
+
+    root_dir = tmp_path / "import_to_pkg_maps"
+    root_dir.mkdir()
+    (root_dir / "nu.json").write_text(
+        json.dumps(
+            {"numpy": {"elements": ["numpy"]}, "numpy.linalg": {"elements": ["numpy"]}}
+        )
+    )
+    for _ in range(2):
+        with sessionmaker(bind=v1_engine)() as session:
+            import_to_package_maps.update(session, path=root_dir)
+
+    with v1_engine.connect() as connection:
+        mappings = connection.execute(
+            select(ImportNames.name, Packages.name, ImportToPackageMaps.partition)
+            .join(ImportToPackageMaps, ImportToPackageMaps.import_id == ImportNames.id)
+            .join(Packages, ImportToPackageMaps.package_id == Packages.id)
+            .order_by(ImportNames.name)
+        ).all()
+        # numpy-base is no longer listed, and its migrated mapping is gone
+        assert [tuple(row) for row in mappings] == [
+            ("numpy", "numpy", "nu"),
+            ("numpy.linalg", "numpy", "nu"),
+        ]
+
+        lookup = connection.execute(
+            select(ImportNames.name, Feedstocks.name, ImportFeedstocks.num_packages)
+            .join(ImportFeedstocks, ImportFeedstocks.import_id == ImportNames.id)
+            .join(Feedstocks, Feedstocks.id == ImportFeedstocks.feedstock_id)
+            .order_by(ImportNames.name)
+        ).all()
+        assert [tuple(row) for row in lookup] == [
+            ("numpy", "numpy", 1),
+            ("numpy.linalg", "numpy", 1),
+        ]
+
+        open_history = connection.execute(
+            select(func.count())
+            .select_from(ImportToPackageMapsHistory)
+            .where(ImportToPackageMapsHistory.valid_to.is_(None))
+        ).scalar()
+        assert open_history == 2
+
+
+def test_upgrade_is_idempotent(v1_engine):
+    for _ in range(2):
+        with v1_engine.begin() as connection:
+            upgrade(connection)
+
+    with v1_engine.connect() as connection:
+        assert connection.execute(select(Packages.name)).scalars().all() == [
+            "libblas",
+            "numpy",
+            "numpy-base",
+        ]
+
+
+def test_refuses_newer_schema(engine):
+    with engine.begin() as connection:
+        upgrade(connection)
+        set_metadata(connection, "schema_version", SCHEMA_VERSION + 1)
+
+    with engine.begin() as connection:
+        with pytest.raises(RuntimeError):
+            upgrade(connection)
@@ -0,0 +1,336 @@
+import json
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from typer.testing import CliRunner
+
+from cfdb.main import app
+from cfdb.models import migrations
+from cfdb.models.schema import (
+    Artifacts,
+    ArtifactsFilePaths,
+    RelationsMapFilePaths,
+    hash_path,
+)
+from cfdb.populate import artifacts, changelog
+from cfdb.populate.feedstock_outputs import _write_feedstock_outputs
+from cfdb.reader import CFDBReader
+
+SITE_PACKAGES = "lib/python3.11/site-packages"
+NUMPY_FILES = [
+    "bin/f2py",
+    f"{SITE_PACKAGES}/numpy/__init__.py",
+    f"{SITE_PACKAGES}/numpy/linalg/__init__.py",
+    f"{SITE_PACKAGES}/numpy/linalg/linalg.py",
+]
+SCIPY_FILES = [
+    f"{SITE_PACKAGES}/scipy/__init__.py",
+    f"{SITE_PACKAGES}/scipy/linalg/__init__.py",
+]
+
+
+def _write_blob(root_dir, name, version, platform, files):
+    blob = root_dir / name / "conda-forge" / platform / f"{name}-{version}.json"
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    blob.write_text(
+        json.dumps(
+            {
+                "index": {"name": name, "version": version, "subdir": platform},
+                "files": files,
+            }
+        )
+    )
+    return blob
+
+
+@pytest.fixture
+def artifacts_dir(tmp_path):
+    root_dir = tmp_path / "artifacts"
+    _write_blob(root_dir, "numpy", "1.26.4", "linux-64", NUMPY_FILES)
+    _write_blob(root_dir, "numpy", "1.26.4", "osx-arm64", NUMPY_FILES)
+    _write_blob(root_dir, "scipy", "1.12.0", "linux-64", SCIPY_FILES)
+    return root_dir
+
+
+def _count(session, table):
+    return session.execute(select(func.count()).select_from(table)).scalar()
+
+
+def test_file_path_tree_shares_directories(session):
+    tree = artifacts.FilePathTree(session)
+    leaves = [tree.intern(path) for path in NUMPY_FILES + SCIPY_FILES]
+
+    assert len(set(leaves)) == len(NUMPY_FILES + SCIPY_FILES)
+    # bin, lib, python3.11, site-packages, numpy, linalg, scipy, linalg and 6 files
+    assert len(tree) == 14
+    assert tree.intern("/bin/f2py") == leaves[0]
+    assert tree.new_nodes[-1]["path_hash"] == hash_path(SCIPY_FILES[-1])
+    assert tree.flush(session) == 14
+    assert tree.flush(session) == 0
+
+    # a new tree resumes from the stored nodes
+    tree = artifacts.FilePathTree(session)
+    assert len(tree) == 14
+    assert tree.intern(NUMPY_FILES[1]) == leaves[1]
+    assert not tree.new_nodes
+
+
+def test_update(session, artifacts_dir):
+    artifacts.update(session, artifacts_dir)
+
+    rows = session.execute(
+        select(
+            Artifacts.name, Artifacts.platform, Artifacts.package_name, Artifacts.path
+        ).order_by(Artifacts.name, Artifacts.platform)
+    ).all()
+    assert [tuple(row) for row in rows] == [
+        (
+            "numpy-1.26.4",
+            "linux-64",
+            "numpy",
+            "numpy/conda-forge/linux-64/numpy-1.26.4.json",
+        ),
+        (
+            "numpy-1.26.4",
+            "osx-arm64",
+            "numpy",
+            "numpy/conda-forge/osx-arm64/numpy-1.26.4.json",
+        ),
+        (
+            "scipy-1.12.0",
+            "linux-64",
+            "scipy",
+            "scipy/conda-forge/linux-64/scipy-1.12.0.json",
+        ),
+    ]
+    assert artifacts.list_files(session, "numpy-1.26.4", "osx-arm64") == NUMPY_FILES
+    assert artifacts.list_files(session, "scipy-1.12.0", "linux-64") == SCIPY_FILES
+    assert artifacts.list_files(session, "scipy-1.12.0", "win-64") == []
+
+    # the platforms of numpy share their nodes
+    assert _count(session, ArtifactsFilePaths) == 14
+    assert _count(session, RelationsMapFilePaths) == 10
+
+    # unchanged blobs are skipped
+    data_version = migrations.get_data_version(session.connection())
+    artifacts.update(session, artifacts_dir)
+    assert migrations.get_data_version(session.connection()) == data_version
+
+
+def test_update_replaces_listings(session, artifacts_dir):
+    artifacts.update(session, artifacts_dir)
+    files = [f"{SITE_PACKAGES}/scipy/__init__.py", f"{SITE_PACKAGES}/scipy/io.py"]
+    _write_blob(artifacts_dir, "scipy", "1.12.0", "linux-64", files)
+    artifacts.update(session, artifacts_dir)
+
+    assert artifacts.list_files(session, "scipy-1.12.0", "linux-64") == files
+    assert artifacts.list_files(session, "numpy-1.26.4", "linux-64") == NUMPY_FILES
+    assert _count(session, Artifacts) == 3
+    assert _count(session, ArtifactsFilePaths) == 15
+    assert _count(session, RelationsMapFilePaths) == 10
+
+
+def test_flush_rejects_taken_ids(session):
+    tree = artifacts.FilePathTree(session)
+    tree.intern(NUMPY_FILES[0])
+    stale_tree = artifacts.FilePathTree(session)
+    tree.flush(session)
+
+    # a tree that missed the flush of another assigns the same IDs
+    stale_tree.intern(SCIPY_FILES[0])
+    with pytest.raises(IntegrityError):
+        stale_tree.flush(session)
+
+
+def test_failed_batches_reload_the_tree(session, artifacts_dir, monkeypatch):
+    tree = artifacts.FilePathTree(session)
+    records = [
+        artifacts._process_artifact(artifacts_dir, set(), str(file))
+        for file in sorted(artifacts_dir.glob("**/*.json"))
+    ]
+
+    def _fail(session):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(artifacts, "bump_data_version", _fail)
+    with pytest.raises(RuntimeError):
+        artifacts._commit_artifacts(session, tree, records[:1])
+    # the nodes of the rolled back batch are forgotten
+    assert len(tree) == 0 and not tree.new_nodes
+
+    monkeypatch.undo()
+    artifacts._commit_artifacts(session, tree, records)
+    assert artifacts.list_files(session, "numpy-1.26.4", "linux-64") == NUMPY_FILES
+
+
+def test_update_deletes_removed_blobs(session, artifacts_dir):
+    artifacts.update(session, artifacts_dir)
+    data_version = migrations.get_data_version(session.connection())
+    (
+        artifacts_dir / "numpy" / "conda-forge" / "osx-arm64" / "numpy-1.26.4.json"
+    ).unlink()
+
+    # a subset of the blobs does not tell which ones were removed
+    artifacts.update(session, artifacts_dir, files=[])
+    assert _count(session, Artifacts) == 3
+
+    artifacts.update(session, artifacts_dir)
+    assert _count(session, Artifacts) == 2
+    assert artifacts.list_files(session, "numpy-1.26.4", "osx-arm64") == []
+    assert artifacts.list_files(session, "numpy-1.26.4", "linux-64") == NUMPY_FILES
+    assert _count(session, RelationsMapFilePaths) == 6
+    assert migrations.get_data_version(session.connection()) == data_version + 1
+
+
+def _artifact_contents(connection):
+    rows = connection.execute(
+        select(
+            Artifacts.name,
+            Artifacts.platform,
+            Artifacts.package_name,
+            Artifacts.version,
+            Artifacts.path,
+            Artifacts.hash,
+        )
+    )
+    return sorted(
+        tuple(row) + tuple(artifacts.list_files(connection, row[0], row[1]))
+        for row in rows
+    )
+
+
+def test_changesets_replay_the_artifacts(engine, artifacts_dir, tmp_path):
+    with sessionmaker(bind=engine)() as session:
+        artifacts.update(session, artifacts_dir)
+    with engine.connect() as connection:
+        first = changelog.export_changes(connection)
+
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    with replica.begin() as connection:
+        migrations.upgrade(connection)
+    with sessionmaker(bind=replica)() as session:
+        assert changelog.apply_changes(session, first) == 3
+        session.commit()
+
+    # the scipy listing changes twice, and a numpy blob is removed
+    files = [f"{SITE_PACKAGES}/scipy/__init__.py", f"{SITE_PACKAGES}/scipy/io.py"]
+    with sessionmaker(bind=engine)() as session:
+        _write_blob(artifacts_dir, "scipy", "1.12.0", "linux-64", files[:1])
+        artifacts.update(session, artifacts_dir)
+        _write_blob(artifacts_dir, "scipy", "1.12.0", "linux-64", files)
+        (artifacts_dir / "numpy/conda-forge/osx-arm64/numpy-1.26.4.json").unlink()
+        artifacts.update(session, artifacts_dir)
+    with engine.connect() as connection:
+        second = changelog.export_changes(connection, since=first["until"])
+        expected = _artifact_contents(connection)
+
+    # the superseded listing is not exported
+    assert [change[2] for change in second["changes"]] == [
+        "upsert",
+        "upsert",
+        "delete",
+    ]
+    assert second["changes"][0][7] is None
+    assert second["changes"][1][7]["files"] == files
+
+    with sessionmaker(bind=replica)() as session:
+        assert changelog.apply_changes(session, second) == 3
+        session.commit()
+    with replica.connect() as connection:
+        assert _artifact_contents(connection) == expected
+        assert changelog.export_changes(connection, since=first["until"]) == second
+    with CFDBReader(str(replica.url)) as reader:
+        assert reader.who_ships(["io.py"]) == {
+            "io.py": (("scipy-1.12.0", "linux-64", "scipy", ()),)
+        }
+    replica.dispose()
+
+
+def test_who_ships(session, artifacts_dir):
+    _write_feedstock_outputs(
+        session, [(Path("n/numpy.json"), "00" * 20, "numpy", ["numpy"])]
+    )
+    artifacts.update(session, artifacts_dir)
+
+    with CFDBReader(str(session.get_bind().url)) as reader:
+        shipped = reader.who_ships(
+            [f"/{NUMPY_FILES[1]}", "__init__.py", "linalg.py", "linalg", "missing.py"]
+        )
+    numpy_artifacts = (
+        ("numpy-1.26.4", "linux-64", "numpy", ("numpy",)),
+        ("numpy-1.26.4", "osx-arm64", "numpy", ("numpy",)),
+    )
+    scipy_artifacts = (("scipy-1.12.0", "linux-64", "scipy", ()),)
+    # directories are not shipped files
+    assert shipped == {
+        NUMPY_FILES[1]: numpy_artifacts,
+        "__init__.py": numpy_artifacts + scipy_artifacts,
+        "linalg.py": numpy_artifacts,
+    }
+
+
+def test_migration_hashes_stored_paths(artifacts_dir, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cf-database.db'}")
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    with sessionmaker(bind=engine)() as session:
+        artifacts.update(session, artifacts_dir)
+
+    # back to the layout of schema version 10
+    with engine.begin() as connection:
+        for index in (
+            "ix_artifacts_file_paths_path_hash",
+            "ix_artifacts_file_paths_dir",
+            "ix_relations_map_file_paths_file_path",
+        ):
+            connection.exec_driver_sql(f"DROP INDEX {index}")
+        connection.exec_driver_sql(
+            "ALTER TABLE artifacts_file_paths DROP COLUMN path_hash"
+        )
+        migrations.set_metadata(connection, "schema_version", 10)
+
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    engine.dispose()
+
+    with CFDBReader(str(engine.url)) as reader:
+        shipped = reader.who_ships(SCIPY_FILES)
+    assert shipped == {
+        path: (("scipy-1.12.0", "linux-64", "scipy", ()),) for path in SCIPY_FILES
+    }
+
+
+def test_cli(artifacts_dir, tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'cf-database.db'}"
+    runner = CliRunner()
+
+    result = runner.invoke(
+        app, ["update-artifacts", "-p", str(artifacts_dir), "--db-url", db_url]
+    )
+    assert result.exit_code == 0
+
+    engine = create_engine(db_url)
+    with engine.connect() as connection:
+        assert artifacts.list_files(connection, "numpy-1.26.4", "linux-64") == (
+            NUMPY_FILES
+        )
+    engine.dispose()
+
+    paths_file = tmp_path / "paths.txt"
+    paths_file.write_text(f"{SCIPY_FILES[0]}\n\nmissing.py\n")
+    result = runner.invoke(
+        app, ["who-ships", "f2py", "-f", str(paths_file), "--db-url", db_url]
+    )
+    assert result.exit_code == 0
+    assert result.stdout.splitlines()[-3:] == [
+        "f2py\tnumpy-1.26.4\tlinux-64\tnumpy\t",
+        "f2py\tnumpy-1.26.4\tosx-arm64\tnumpy\t",
+        f"{SCIPY_FILES[0]}\tscipy-1.12.0\tlinux-64\tscipy\t",
+    ]
+    assert "No artifact ships: missing.py" in result.stderr
+
+    result = runner.invoke(app, ["who-ships", "missing.py", "--db-url", db_url])
+    assert result.exit_code == 1
@@ -0,0 +1,94 @@
+import json
+import sqlite3
+from pathlib import Path
+
+from cfdb.populate import feedstock_outputs
+from cfdb.populate.cache import ParseCache
+
+
+def test_get_or_parse_counts_hits_and_misses():
+    cache = ParseCache()
+    calls = []
+
+    def parse():
+        calls.append(1)
+        return ["feedstock"]
+
+    assert cache.get_or_parse("outputs", "abc", parse) == ["feedstock"]
+    assert cache.get_or_parse("outputs", "abc", parse) == ["feedstock"]
+    # the namespace is part of the key
+    cache.get_or_parse("import_maps", "abc", parse)
+
+    assert len(calls) == 2
+    assert (cache.hits, cache.disk_hits, cache.misses) == (1, 0, 2)
+    assert cache.summary() == (
+        "Parse cache: 3 lookups, 1 memory hits, 0 disk hits, 2 misses "
+        "(33.3% hit rate)."
+    )
+
+
+def test_lru_eviction():
+    cache = ParseCache(maxsize=2)
+    cache.get_or_parse("ns", "a", lambda: 1)
+    cache.get_or_parse("ns", "b", lambda: 2)
+    cache.get_or_parse("ns", "a", lambda: 1)  # "b" is now the least recently used
+    cache.get_or_parse("ns", "c", lambda: 3)
+
+    assert len(cache) == 2
+    assert cache.get_or_parse("ns", "a", lambda: None) == 1
+    assert cache.get_or_parse("ns", "b", lambda: None) is None
+
+
+def test_size_eviction():
+    cache = ParseCache(maxbytes=100)
+    cache.get_or_parse("ns", "a", lambda: 1, size=60)
+    cache.get_or_parse("ns", "b", lambda: 2, size=30)
+    cache.get_or_parse("ns", "c", lambda: 3, size=30)  # evicts "a"
+    # larger than the whole cache, never held in memory
+    cache.get_or_parse("ns", "d", lambda: 4, size=101)
+
+    assert len(cache) == 2
+    assert cache.get_or_parse("ns", "b", lambda: None) == 2
+    assert cache.get_or_parse("ns", "a", lambda: None) is None
+    assert cache.get_or_parse("ns", "d", lambda: None) is None
+
+
+def test_persistence(tmp_path):
+    cache_file = tmp_path / "parse-cache.db"
+    cache = ParseCache(path=cache_file)
+    cache.get_or_parse("ns", "a", lambda: {"package": ["module"]})
+    cache.close()
+
+    cache = ParseCache(path=cache_file)
+    assert cache.get_or_parse("ns", "a", lambda: None) == {"package": ["module"]}
+    assert (cache.hits, cache.disk_hits, cache.misses) == (0, 1, 0)
+    cache.close()
+
+    # payloads are persisted as JSON, never as pickles
+    with sqlite3.connect(cache_file) as connection:
+        assert connection.execute("SELECT key, value FROM parsed_blobs").fetchall() == [
+            ("ns:a", '{"package":["module"]}')
+        ]
+    connection.close()
+
+
+def test_parse_output_deduplicates_identical_blobs(monkeypatch):
+    blob = json.dumps({"feedstocks": ["feedstock0"]}).encode()
+
+    calls = []
+    decode = feedstock_outputs.decode_output_blob
+
+    def _decode(data):
+        calls.append(data)
+        return decode(data)
+
+    monkeypatch.setattr(feedstock_outputs, "decode_output_blob", _decode)
+    cache = ParseCache()
+    records = [
+        feedstock_outputs._parse_output(Path(f"{package}.json"), "ff", blob, cache)
+        for package in ("package0", "package1")
+    ]
+
+    assert len(calls) == 1
+    assert [record[2] for record in records] == ["package0", "package1"]
+    assert [record[3] for record in records] == [["feedstock0"], ["feedstock0"]]
@@ -0,0 +1,200 @@
+import shutil
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from typer.testing import CliRunner
+
+from cfdb.main import app
+from cfdb.models import migrations
+from cfdb.models.schema import (
+    ChangeLog,
+    FeedstockOutputs,
+    FeedstockOutputsHistory,
+    Feedstocks,
+    ImportFeedstocks,
+    ImportNames,
+    ImportToPackageMaps,
+    Packages,
+)
+from cfdb.populate import changelog
+from cfdb.populate.feedstock_outputs import _write_feedstock_outputs
+from cfdb.populate.import_to_package_maps import _write_import_maps
+from cfdb.reader import CFDBReader
+
+HASH_1 = "11" * 20
+HASH_2 = "22" * 20
+
+
+def _first_update(session):
+    _write_feedstock_outputs(
+        session,
+        [
+            (Path("n/numpy.json"), HASH_1, "numpy", ["numpy"]),
+            (Path("l/libblas.json"), HASH_1, "libblas", ["openblas", "blas"]),
+        ],
+    )
+    _write_import_maps(session, [("nu", HASH_1, {"numpy": ["numpy", "numpy.linalg"]})])
+    session.commit()
+
+
+def _second_update(session):
+    _write_feedstock_outputs(
+        session,
+        [
+            (Path("l/libblas.json"), HASH_2, "libblas", ["blas"]),
+            (Path("s/scipy.json"), HASH_1, "scipy", ["scipy"]),
+        ],
+    )
+    _write_import_maps(
+        session,
+        [("nu", HASH_2, {"numpy": ["numpy"], "numpy-base": ["numpy.linalg"]})],
+    )
+    session.commit()
+
+
+def _contents(connection):
+    """
+    The fact tables, the lookup and the open history rows, by name.
+    """
+    outputs = connection.execute(
+        select(Feedstocks.name, Packages.name, FeedstockOutputs.path)
+        .select_from(FeedstockOutputs)
+        .join(Feedstocks, Feedstocks.id == FeedstockOutputs.feedstock_id)
+        .join(Packages, Packages.id == FeedstockOutputs.package_id)
+    )
+    mappings = connection.execute(
+        select(ImportNames.name, Packages.name, ImportToPackageMaps.partition)
+        .select_from(ImportToPackageMaps)
+        .join(ImportNames, ImportNames.id == ImportToPackageMaps.import_id)
+        .join(Packages, Packages.id == ImportToPackageMaps.package_id)
+    )
+    lookup = connection.execute(
+        select(ImportNames.name, Feedstocks.name, ImportFeedstocks.num_packages)
+        .select_from(ImportFeedstocks)
+        .join(ImportNames, ImportNames.id == ImportFeedstocks.import_id)
+        .join(Feedstocks, Feedstocks.id == ImportFeedstocks.feedstock_id)
+    )
+    open_history = connection.execute(
+        select(Feedstocks.name, Packages.name)
+        .select_from(FeedstockOutputsHistory)
+        .join(Feedstocks, Feedstocks.id == FeedstockOutputsHistory.feedstock_id)
+        .join(Packages, Packages.id == FeedstockOutputsHistory.package_id)
+        .where(FeedstockOutputsHistory.valid_to.is_(None))
+    )
+    return [
+        sorted(tuple(row) for row in rows)
+        for rows in (outputs, mappings, lookup, open_history)
+    ]
+
+
+def test_changesets_replay_the_updates(engine, tmp_path):
+    source = engine
+    with sessionmaker(bind=source)() as session:
+        _first_update(session)
+    with source.connect() as connection:
+        first = changelog.export_changes(connection)
+
+    # the replica starts from the state after the first update
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    with replica.begin() as connection:
+        migrations.upgrade(connection)
+    with sessionmaker(bind=replica)() as session:
+        assert changelog.apply_changes(session, first) == len(first["changes"])
+        session.commit()
+
+    with sessionmaker(bind=source)() as session:
+        _second_update(session)
+    with source.connect() as connection:
+        second = changelog.export_changes(connection, since=first["until"])
+        expected = _contents(connection)
+
+    assert second["since"] == first["until"]
+    assert {change[2] for change in second["changes"]} == {"upsert", "delete"}
+    with sessionmaker(bind=replica)() as session:
+        assert changelog.apply_changes(session, second) == len(second["changes"])
+        # replaying a changeset is a no-op
+        assert changelog.apply_changes(session, second) == 0
+        session.commit()
+
+    with replica.connect() as connection:
+        assert _contents(connection) == expected
+        assert changelog.last_seq(connection) == second["until"]
+        # the replica serves the same changes
+        assert changelog.export_changes(connection, since=first["until"]) == second
+    replica.dispose()
+
+
+def test_gaps_are_rejected(engine, tmp_path):
+    with sessionmaker(bind=engine)() as session:
+        _first_update(session)
+        _second_update(session)
+    with engine.connect() as connection:
+        until = changelog.last_seq(connection)
+        changeset = changelog.export_changes(connection, since=2)
+        with pytest.raises(ValueError):
+            changelog.export_changes(connection, since=until + 1)
+
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    with replica.begin() as connection:
+        migrations.upgrade(connection)
+    with sessionmaker(bind=replica)() as session:
+        with pytest.raises(ValueError):
+            changelog.apply_changes(session, changeset)
+        with pytest.raises(ValueError):
+            changelog.apply_changes(session, {"changes": []})
+        assert session.execute(select(ChangeLog.seq)).first() is None
+    replica.dispose()
+
+
+def test_cli_round_trip(tmp_path):
+    source_url = f"sqlite:///{tmp_path / 'source.db'}"
+    engine = create_engine(source_url)
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    with sessionmaker(bind=engine)() as session:
+        _first_update(session)
+    engine.dispose()
+    shutil.copy(tmp_path / "source.db", tmp_path / "replica.db")
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+
+    engine = create_engine(source_url)
+    with sessionmaker(bind=engine)() as session:
+        _second_update(session)
+    with engine.connect() as connection:
+        since = changelog.last_seq(connection)
+    engine.dispose()
+
+    runner = CliRunner()
+    changes_file = tmp_path / "changes.json.gz"
+    with create_engine(replica_url).connect() as connection:
+        replica_seq = changelog.last_seq(connection)
+    result = runner.invoke(
+        app,
+        [
+            "changes",
+            "--since",
+            str(replica_seq),
+            "-o",
+            str(changes_file),
+            "--db-url",
+            source_url,
+        ],
+    )
+    assert result.exit_code == 0
+    assert changelog.read_changeset(changes_file)["until"] == since
+
+    result = runner.invoke(
+        app, ["apply-changes", str(changes_file), "--db-url", replica_url]
+    )
+    assert result.exit_code == 0
+    with CFDBReader(replica_url) as reader:
+        assert reader.feedstock_of("libblas") == ("blas",)
+        assert reader.who_provides("numpy.linalg") == ("numpy-base",)
+        assert reader.import_filter is not None
+
+    result = runner.invoke(
+        app, ["changes", "--since", str(since + 5), "--db-url", source_url]
+    )
+    assert result.exit_code == 2
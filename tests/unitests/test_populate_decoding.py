@@ -0,0 +1,74 @@
+import io
+import json
+
+import pytest
+
+from cfdb.populate.decoding import (
+    LOADERS,
+    decode_artifact,
+    decode_import_map,
+    decode_output_blob,
+    iter_import_map,
+)
+
+
+@pytest.mark.parametrize("backend", list(LOADERS))
+def test_decode_output_blob(backend):
+    data = json.dumps({"feedstocks": ["feedstock1", "feedstock2"]}).encode()
+
+    assert decode_output_blob(data, backend) == ["feedstock1", "feedstock2"]
+
+
+@pytest.mark.parametrize("backend", list(LOADERS))
+def test_decode_import_map(backend):
+    data = json.dumps(
+        {
+            "numpy": {"__set__": True, "elements": ["numpy", "numpy-base"]},
+            "numpy.linalg": {"__set__": True, "elements": ["numpy"]},
+            "scipy": {"__set__": True, "elements": []},
+        }
+    ).encode()
+
+    assert decode_import_map(data, backend) == {
+        "numpy": ["numpy", "numpy.linalg"],
+        "numpy-base": ["numpy"],
+    }
+
+
+@pytest.mark.parametrize("backend", list(LOADERS))
+def test_decode_artifact(backend):
+    data = json.dumps(
+        {
+            "index": {"name": "numpy", "version": "1.26.4", "subdir": "linux-64"},
+            "files": ["bin/f2py", "lib/python3.11/site-packages/numpy/__init__.py"],
+            "rendered_recipe": {"package": {"name": "numpy"}},
+        }
+    ).encode()
+
+    assert decode_artifact(data, backend) == (
+        "numpy",
+        "1.26.4",
+        "linux-64",
+        ["bin/f2py", "lib/python3.11/site-packages/numpy/__init__.py"],
+    )
+    data = json.dumps({"index": {"name": "numpy", "version": "1.26.4"}}).encode()
+    assert decode_artifact(data, backend) == ("numpy", "1.26.4", "", [])
+
+
+def test_json_fallback_is_always_available():
+    assert "json" in LOADERS
+
+
+def test_iter_import_map():
+    data = json.dumps(
+        {
+            "numpy": {"__set__": True, "elements": ["numpy", "numpy-base"]},
+            "numpy.linalg": {"__set__": True, "elements": ["numpy"]},
+        }
+    ).encode()
+
+    assert list(iter_import_map(io.BytesIO(data))) == [
+        ("numpy", "numpy"),
+        ("numpy-base", "numpy"),
+        ("numpy", "numpy.linalg"),
+    ]
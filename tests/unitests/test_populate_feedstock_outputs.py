@@ -1,7 +1,19 @@
 from pathlib import Path
 import pytest
-from cfdb.populate.feedstock_outputs import traverse_files, _compare_files
-from cfdb.populate.utils import hash_file
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from cfdb.models.schema import (
+    Base,
+    ChangeLog,
+    FeedstockOutputs,
+    FeedstockOutputsHistory,
+    Feedstocks,
+    ImportFeedstocks,
+    Packages,
+)
+from cfdb.populate.feedstock_outputs import update
+from cfdb.populate.import_to_package_maps import _write_import_maps
 
 
 @pytest.fixture
@@ -25,46 +37,56 @@ def json_dir(tmpdir):
     root_dir.remove()
 
 
-def test_traverse_files(json_dir):
-    # Call the traverse_files function
-    output_dir = json_dir  # Use the same directory as the input for simplicity
-    stored_files = traverse_files(json_dir, output_dir)
-
-    # Assert that the returned value is a list of paths
-    assert isinstance(stored_files, list)
-    assert all(isinstance(file, Path) for file in stored_files)
-
-    # Assert that the number of stored files matches the expected count
-    expected_num_files = 1  # The total number of batch files created
-    assert len(stored_files) == expected_num_files
-
-    # Assert that each stored file is a valid path
-    assert all(file.exists() for file in stored_files)
-    assert all(file.is_file() for file in stored_files)
-
-    # Assert the contents of the stored files (optional)
-    for file in stored_files:
-        assert (
-            "batch_" in file.name
-        )  # Check if the file name matches the expected pattern
-
-    file_contents = []
-    for file in stored_files:
-        with open(file, "r") as f:
-            for line in f:
-                file_contents.append(line.strip().split(","))
-
-    # Assert the contents of the stored files (optional)
-    assert all(Path(file[0]).exists() for file in file_contents)
-
-    # Assert the hashes of the stored files (optional)
-    for file, hash in file_contents:
-        with open(file, "rb") as f:
-            assert hash == hash_file(file)
-
-    # Assert the number of feedstocks in each file corresponds to the expected count
-    assert len(file_contents) == 3
-
-
-def test_compare_files():
-    ...
+def test_update(json_dir):
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    update(session, path=json_dir)
+    # running twice must not violate the unique (feedstock, package) index
+    update(session, path=json_dir)
+
+    rows = (
+        session.query(Feedstocks.name, Packages.name)
+        .join(FeedstockOutputs, FeedstockOutputs.feedstock_id == Feedstocks.id)
+        .join(Packages, FeedstockOutputs.package_id == Packages.id)
+        .all()
+    )
+    assert sorted(rows) == [
+        ("feedstock1", "file1"),
+        ("feedstock2", "file1"),
+        ("feedstock3", "file2"),
+        ("feedstock4", "file3"),
+        ("feedstock5", "file3"),
+        ("feedstock6", "file3"),
+    ]
+    session.close()
+
+
+def test_removed_blobs_are_deleted(json_dir, session):
+    update(session, path=json_dir)
+    _write_import_maps(session, [("fi", "00" * 20, {"file3": ["file3"]})])
+    session.commit()
+    (json_dir / "subdir" / "file3.json").unlink()
+
+    # a partial listing does not delete the blobs it does not list
+    update(session, path=json_dir, files=[str(json_dir / "file1.json")])
+    assert session.query(FeedstockOutputs).count() == 6
+
+    update(session, path=json_dir)
+    paths = session.execute(select(FeedstockOutputs.path).distinct()).scalars()
+    assert sorted(paths) == ["file1.json", "file2.json"]
+    assert session.query(ImportFeedstocks).count() == 0
+    assert (
+        session.query(FeedstockOutputsHistory)
+        .filter(FeedstockOutputsHistory.valid_to.isnot(None))
+        .count()
+        == 3
+    )
+    deletions = session.execute(
+        select(ChangeLog.key_id).where(
+            ChangeLog.table_name == "feedstock_outputs",
+            ChangeLog.operation == "delete",
+        )
+    )
+    assert len(deletions.all()) == 3
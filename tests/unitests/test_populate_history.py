@@ -0,0 +1,170 @@
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, func, select, text
+from sqlalchemy.orm import sessionmaker
+from typer.testing import CliRunner
+
+from cfdb.main import app
+from cfdb.models import migrations
+from cfdb.models.schema import (
+    FeedstockOutputs,
+    FeedstockOutputsHistory,
+    ImportToPackageMaps,
+    ImportToPackageMapsHistory,
+)
+from cfdb.populate import history
+from cfdb.populate.feedstock_outputs import _write_feedstock_outputs
+from cfdb.populate.import_to_package_maps import _write_import_maps
+from cfdb.reader import CFDBReader
+
+HASH_1 = "11" * 20
+HASH_2 = "22" * 20
+
+JANUARY = datetime(2024, 1, 1)
+FEBRUARY = datetime(2024, 2, 1)
+MARCH = datetime(2024, 3, 1)
+
+
+@pytest.fixture
+def db_url(db_url):
+    engine = create_engine(db_url)
+    _populate(engine)
+    engine.dispose()
+    return db_url
+
+
+def _at(when):
+    return lambda: when
+
+
+def _populate(engine):
+    """
+    January: libblas is built by openblas and blas, numpy.linalg is mapped.
+    February: libblas is only built by blas.
+    March: numpy.linalg is no longer mapped, and comes back to numpy-base.
+    """
+    with sessionmaker(bind=engine)() as session, pytest.MonkeyPatch.context() as mp:
+        mp.setattr(history, "utcnow", _at(JANUARY))
+        _write_feedstock_outputs(
+            session,
+            [
+                (Path("n/numpy.json"), HASH_1, "numpy", ["numpy"]),
+                (Path("l/libblas.json"), HASH_1, "libblas", ["openblas", "blas"]),
+            ],
+        )
+        _write_import_maps(
+            session, [("nu", HASH_1, {"numpy": ["numpy", "numpy.linalg"]})]
+        )
+        session.commit()
+
+        mp.setattr(history, "utcnow", _at(FEBRUARY))
+        _write_feedstock_outputs(
+            session, [(Path("l/libblas.json"), HASH_2, "libblas", ["blas"])]
+        )
+        session.commit()
+
+        mp.setattr(history, "utcnow", _at(MARCH))
+        _write_import_maps(
+            session,
+            [("nu", HASH_2, {"numpy": ["numpy"], "numpy-base": ["numpy.linalg"]})],
+        )
+        session.commit()
+
+
+def test_as_of_lookups(db_url):
+    with CFDBReader(db_url) as reader:
+        assert reader.feedstock_of("libblas", as_of=datetime(2023, 12, 31)) == ()
+        assert reader.feedstock_of("libblas", as_of=JANUARY) == ("blas", "openblas")
+        assert reader.feedstock_of("LibBlas", as_of=datetime(2024, 1, 31)) == (
+            "blas",
+            "openblas",
+        )
+        assert reader.feedstock_of("libblas", as_of=FEBRUARY) == ("blas",)
+        assert reader.feedstock_of("libblas") == ("blas",)
+
+        assert reader.who_provides("numpy.linalg", as_of=datetime(2024, 2, 15)) == (
+            "numpy",
+        )
+        assert reader.who_provides("numpy.linalg", as_of=MARCH) == ("numpy-base",)
+        assert reader.who_provides("numpy.linalg") == ("numpy-base",)
+        assert reader.who_provides("numpy", as_of=datetime(2025, 1, 1)) == ("numpy",)
+
+
+def test_history_follows_the_facts(db_url):
+    engine = create_engine(db_url)
+    with engine.connect() as connection:
+        for fact, history_table in (
+            (FeedstockOutputs, FeedstockOutputsHistory),
+            (ImportToPackageMaps, ImportToPackageMapsHistory),
+        ):
+            open_rows = connection.execute(
+                select(func.count())
+                .select_from(history_table)
+                .where(history_table.valid_to.is_(None))
+            ).scalar()
+            rows = connection.execute(select(func.count()).select_from(fact)).scalar()
+            assert open_rows == rows
+
+        closed = connection.execute(
+            select(
+                FeedstockOutputsHistory.valid_from, FeedstockOutputsHistory.valid_to
+            ).where(FeedstockOutputsHistory.valid_to.is_not(None))
+        ).all()
+    engine.dispose()
+    assert [tuple(row) for row in closed] == [(JANUARY, FEBRUARY)]
+
+
+def test_migration_opens_the_existing_rows(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cf-database.db'}")
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    with sessionmaker(bind=engine)() as session:
+        _write_feedstock_outputs(
+            session, [(Path("n/numpy.json"), HASH_1, "numpy", ["numpy"])]
+        )
+        session.commit()
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE feedstock_outputs_history"))
+        connection.execute(text("DROP TABLE import_to_package_mapping_history"))
+        migrations.set_metadata(connection, "schema_version", 7)
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+        rows = connection.execute(
+            select(FeedstockOutputsHistory.valid_from, FeedstockOutputsHistory.valid_to)
+        ).all()
+    engine.dispose()
+
+    assert len(rows) == 1
+    assert rows[0].valid_from <= history.utcnow()
+    assert rows[0].valid_to is None
+
+
+def test_cli_as_of(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'cf-database.db'}"
+    engine = create_engine(db_url)
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    _populate(engine)
+    engine.dispose()
+
+    runner = CliRunner()
+    result = runner.invoke(
+        app, ["feedstock-of", "libblas", "--as-of", "2024-01-15", "--db-url", db_url]
+    )
+    assert result.exit_code == 0
+    assert result.stdout.splitlines()[-2:] == ["blas", "openblas"]
+
+    result = runner.invoke(
+        app,
+        ["who-provides", "numpy.linalg", "--as-of", "2024-02-15", "--db-url", db_url],
+    )
+    assert result.exit_code == 0
+    assert result.stdout.splitlines()[-1] == "numpy"
+
+    result = runner.invoke(
+        app, ["feedstock-of", "libblas", "--as-of", "last month", "--db-url", db_url]
+    )
+    assert result.exit_code == 2
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from cfdb.models import migrations
+from cfdb.models.schema import ImportNames, ImportToPackageMaps, Packages
+from cfdb.populate import import_to_package_maps
+
+
+@pytest.fixture
+def import_maps_dir(tmp_path):
+    root_dir = tmp_path / "import_to_pkg_maps"
+    root_dir.mkdir()
+    for prefix in ("nu", "sc"):
+        payload = {
+            f"{prefix}{idx}": {
+                "__set__": True,
+                "elements": [f"{prefix}-package", "common"],
+            }
+            for idx in range(50)
+        }
+        (root_dir / f"{prefix}.json").write_text(json.dumps(payload))
+    return root_dir
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def _mappings(session):
+    rows = session.execute(
+        select(ImportNames.name, Packages.name, ImportToPackageMaps.partition)
+        .join(ImportToPackageMaps, ImportToPackageMaps.import_id == ImportNames.id)
+        .join(Packages, ImportToPackageMaps.package_id == Packages.id)
+    ).all()
+    return sorted(tuple(row) for row in rows)
+
+
+def test_streamed_partitions_match_in_memory_partitions(
+    import_maps_dir, session, monkeypatch
+):
+    import_to_package_maps.update(session, path=import_maps_dir, stream_threshold=None)
+    expected = _mappings(session)
+    assert len(expected) == 200
+
+    session.execute(ImportToPackageMaps.__table__.delete())
+    session.commit()
+
+    # every partition is streamed, in batches smaller than a partition
+    monkeypatch.setattr(import_to_package_maps, "STREAM_BATCH_SIZE", 7)
+    import_to_package_maps.update(session, path=import_maps_dir, stream_threshold=0)
+    assert _mappings(session) == expected
+
+
+def test_unchanged_streamed_partitions_are_skipped(import_maps_dir, session):
+    import_to_package_maps.update(session, path=import_maps_dir, stream_threshold=0)
+    db_files = import_to_package_maps._database_files(session)
+
+    for file in import_maps_dir.iterdir():
+        assert not import_to_package_maps._stream_import_map(
+            session, import_maps_dir, db_files, str(file)
+        )
+
+
+def test_streamed_partitions_bump_the_data_version_once(
+    import_maps_dir, session, monkeypatch
+):
+    data_version = migrations.get_data_version(session.connection())
+
+    monkeypatch.setattr(import_to_package_maps, "STREAM_BATCH_SIZE", 7)
+    import_to_package_maps.update(session, path=import_maps_dir, stream_threshold=0)
+    assert migrations.get_data_version(session.connection()) == data_version + 2
@@ -0,0 +1,100 @@
+from sqlalchemy import select
+
+from cfdb.models.schema import FeedstockOutputs, Feedstocks, Packages
+from cfdb.populate.loaders import (
+    _copy_text_value,
+    _CopyStream,
+    chunked,
+    ensure_ids,
+    upsert,
+)
+
+
+def _output(feedstock_id, package_id, file_hash):
+    return {
+        "feedstock_id": feedstock_id,
+        "package_id": package_id,
+        "path": f"{package_id}.json",
+        "hash": bytes.fromhex(file_hash * 20),
+    }
+
+
+def test_upsert_ignores_conflicts(session):
+    upsert(session, Packages.__table__, [{"name": "numpy"}], ["name"])
+    upsert(
+        session, Packages.__table__, [{"name": "numpy"}, {"name": "scipy"}], ["name"]
+    )
+    session.commit()
+
+    assert session.execute(select(Packages.name)).scalars().all() == [
+        "numpy",
+        "scipy",
+    ]
+
+
+def test_upsert_updates_columns(session):
+    package_id = ensure_ids(session, Packages.__table__, ["numpy"])["numpy"]
+    feedstock_id = ensure_ids(session, Feedstocks.__table__, ["numpy"])["numpy"]
+    for file_hash in ("00", "ff"):
+        upsert(
+            session,
+            FeedstockOutputs.__table__,
+            [_output(feedstock_id, package_id, file_hash)],
+            index_elements=["feedstock_id", "package_id"],
+            update_columns=["hash"],
+        )
+    session.commit()
+
+    rows = session.execute(
+        select(FeedstockOutputs.package_id, FeedstockOutputs.hash)
+    ).all()
+    assert [tuple(row) for row in rows] == [(package_id, b"\xff" * 20)]
+
+
+def test_ensure_ids(session):
+    first = ensure_ids(session, Packages.__table__, ["numpy", "scipy"])
+    second = ensure_ids(session, Packages.__table__, ["scipy", "pandas", "scipy"])
+    session.commit()
+
+    assert set(first) == {"numpy", "scipy"}
+    assert set(second) == {"scipy", "pandas"}
+    assert first["scipy"] == second["scipy"]
+    assert len(set(first.values()) | set(second.values())) == 3
+
+
+def test_ensure_ids_normalizes_names(session):
+    ensure_ids(session, Packages.__table__, ["Scikit_Learn", "ruamel.yaml"])
+    session.commit()
+
+    rows = session.execute(
+        select(Packages.name, Packages.normalized_name).order_by(Packages.name)
+    ).all()
+    assert [tuple(row) for row in rows] == [
+        ("Scikit_Learn", "scikit-learn"),
+        ("ruamel.yaml", "ruamel-yaml"),
+    ]
+
+
+def test_copy_text_value():
+    assert _copy_text_value(None) == "\\N"
+    assert _copy_text_value("a\tb\nc\\d") == "a\\tb\\nc\\\\d"
+    assert _copy_text_value(b"\x01\xff") == "\\\\x01ff"
+
+
+def test_copy_stream_reads_in_chunks():
+    rows = [{"a": "x", "b": None}, {"a": "y", "b": "z"}]
+    stream = _CopyStream(rows, ["a", "b"])
+
+    chunks = []
+    chunk = stream.read(3)
+    while chunk:
+        chunks.append(chunk)
+        chunk = stream.read(3)
+
+    assert b"".join(chunks) == b"x\t\\N\ny\tz\n"
+    assert all(len(chunk) <= 3 for chunk in chunks)
+
+
+def test_chunked():
+    assert chunked([1, 2, 3, 4, 5], 2) == [[1, 2], [3, 4], [5]]
+    assert chunked([], 2) == []
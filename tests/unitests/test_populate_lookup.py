@@ -0,0 +1,193 @@
+import json
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+from typer.testing import CliRunner
+
+from cfdb.main import app
+from cfdb.models import migrations
+from cfdb.models.schema import FeedstockStats, ImportFeedstocks
+from cfdb.populate import import_to_package_maps, lookup
+from cfdb.populate.feedstock_outputs import _write_feedstock_outputs
+from cfdb.populate.import_to_package_maps import _write_import_maps
+from cfdb.reader import CFDBReader
+
+HASH_1 = "11" * 20
+HASH_2 = "22" * 20
+
+EXPECTED_LOOKUP = """
+SELECT m.import_id, o.feedstock_id, count(*)
+FROM import_to_package_mapping m
+JOIN feedstock_outputs o ON o.package_id = m.package_id
+GROUP BY m.import_id, o.feedstock_id
+"""
+EXPECTED_STATS = """
+SELECT o.feedstock_id, count(*),
+    (SELECT count(*) FROM import_feedstocks l WHERE l.feedstock_id = o.feedstock_id)
+FROM feedstock_outputs o
+GROUP BY o.feedstock_id
+"""
+
+
+def _assert_consistent(bind):
+    lookup = bind.execute(
+        select(
+            ImportFeedstocks.import_id,
+            ImportFeedstocks.feedstock_id,
+            ImportFeedstocks.num_packages,
+        )
+    ).all()
+    assert sorted(map(tuple, lookup)) == sorted(
+        map(tuple, bind.execute(text(EXPECTED_LOOKUP)).all())
+    )
+
+    stats = bind.execute(
+        select(
+            FeedstockStats.feedstock_id,
+            FeedstockStats.num_packages,
+            FeedstockStats.num_imports,
+        ).where((FeedstockStats.num_packages != 0) | (FeedstockStats.num_imports != 0))
+    ).all()
+    assert sorted(map(tuple, stats)) == sorted(
+        map(tuple, bind.execute(text(EXPECTED_STATS)).all())
+    )
+
+
+def _output(name, feedstocks, file_hash=HASH_1):
+    return (Path(f"{name[0]}/{name}.json"), file_hash, name, feedstocks)
+
+
+def test_lookup_follows_the_changes(session):
+    _write_feedstock_outputs(
+        session,
+        [
+            _output("numpy", ["numpy"]),
+            _output("numpy-base", ["numpy"]),
+            _output("libblas", ["openblas", "blas"]),
+        ],
+    )
+    _assert_consistent(session)
+
+    _write_import_maps(
+        session,
+        [
+            (
+                "nu",
+                HASH_1,
+                {"numpy": ["numpy", "numpy.linalg"], "numpy-base": ["numpy"]},
+            ),
+            ("li", HASH_1, {"libblas": ["blas"], "scipy": ["scipy"]}),
+        ],
+    )
+    session.commit()
+    _assert_consistent(session)
+
+    # a feedstock stops building a package, and another package appears
+    _write_feedstock_outputs(
+        session,
+        [_output("libblas", ["blas"], HASH_2), _output("scipy", ["scipy"])],
+    )
+    session.commit()
+    _assert_consistent(session)
+
+    # a partition no longer lists some of its mappings
+    _write_import_maps(session, [("nu", HASH_2, {"numpy": ["numpy"]})])
+    session.commit()
+    _assert_consistent(session)
+
+    mappings = session.execute(text("SELECT count(*) FROM import_feedstocks")).scalar()
+    assert mappings == 3
+
+
+def test_writers_serialize_the_lookup(engine, session):
+    if engine.dialect.name != "postgresql":
+        pytest.skip("SQLite only has a single writer")
+    try_lock = text("SELECT pg_try_advisory_xact_lock(:key)")
+
+    _write_feedstock_outputs(session, [_output("numpy", ["numpy"])])
+    # the other writers wait until the transaction ends
+    with engine.connect() as connection:
+        assert not connection.execute(try_lock, {"key": lookup.LOCK_KEY}).scalar()
+    session.commit()
+    with engine.connect() as connection:
+        assert connection.execute(try_lock, {"key": lookup.LOCK_KEY}).scalar()
+
+
+def test_streamed_partitions_delete_stale_mappings(tmp_path, session):
+    _write_feedstock_outputs(session, [_output("numpy", ["numpy"])])
+    _write_import_maps(
+        session, [("nu", HASH_1, {"numpy": ["numpy", "numpy.linalg", "numpy.fft"]})]
+    )
+    session.commit()
+
+    (tmp_path / "nu.json").write_text(
+        json.dumps(
+            {
+                "numpy": {"elements": ["numpy"]},
+                "numpy.fft": {"elements": ["numpy"]},
+            }
+        )
+    )
+    import_to_package_maps.update(session, path=tmp_path, stream_threshold=0)
+    session.commit()
+
+    _assert_consistent(session)
+    import_names = session.execute(
+        text(
+            "SELECT i.name FROM import_feedstocks l "
+            "JOIN import_names i ON i.id = l.import_id ORDER BY i.name"
+        )
+    ).scalars()
+    assert list(import_names) == ["numpy", "numpy.fft"]
+
+
+def test_migration_materializes_the_lookup(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cf-database.db'}")
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    with sessionmaker(bind=engine)() as session:
+        _write_feedstock_outputs(session, [_output("numpy", ["numpy"])])
+        _write_import_maps(session, [("nu", HASH_1, {"numpy": ["numpy"]})])
+        session.commit()
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE import_feedstocks"))
+        connection.execute(text("DROP TABLE feedstock_stats"))
+        migrations.set_metadata(connection, "schema_version", 4)
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+        _assert_consistent(connection)
+    engine.dispose()
+
+
+def test_reader_and_cli(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'cf-database.db'}"
+    engine = create_engine(db_url)
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    with sessionmaker(bind=engine)() as session:
+        _write_feedstock_outputs(
+            session,
+            [_output("numpy", ["numpy"]), _output("libblas", ["openblas", "blas"])],
+        )
+        _write_import_maps(
+            session, [("nu", HASH_1, {"numpy": ["numpy"], "libblas": ["numpy"]})]
+        )
+        session.commit()
+    engine.dispose()
+
+    with CFDBReader(db_url) as reader:
+        assert reader.feedstocks_for_import("numpy") == ("blas", "numpy", "openblas")
+        assert reader.feedstocks_for_import("scipy") == ()
+        assert reader.feedstock_stats("openblas") == (1, 1)
+        assert reader.feedstock_stats("scipy") is None
+
+    result = CliRunner().invoke(app, ["feedstocks-for", "numpy", "--db-url", db_url])
+    assert result.exit_code == 0
+    assert result.stdout.splitlines()[-3:] == [
+        "blas (1 packages, 1 imports)",
+        "numpy (1 packages, 1 imports)",
+        "openblas (1 packages, 1 imports)",
+    ]
@@ -0,0 +1,170 @@
+import json
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from cfdb.models import migrations
+from cfdb.models.schema import (
+    FeedstockOutputs,
+    FeedstockOutputsHistory,
+    Feedstocks,
+    FeedstockStats,
+    ImportFeedstocks,
+    ImportNames,
+    ImportToPackageMaps,
+    ImportToPackageMapsHistory,
+    Packages,
+)
+from cfdb.populate import feedstock_outputs, import_to_package_maps, shards
+
+
+@pytest.fixture
+def outputs_dir(tmp_path):
+    root_dir = tmp_path / "outputs"
+    for idx in range(20):
+        package = f"package{idx}"
+        file = root_dir / package[-1] / f"{package}.json"
+        file.parent.mkdir(parents=True, exist_ok=True)
+        # feedstock0 is shared by several shards
+        file.write_text(json.dumps({"feedstocks": ["feedstock0", f"feedstock{idx}"]}))
+    return root_dir
+
+
+@pytest.fixture
+def import_maps_dir(tmp_path):
+    root_dir = tmp_path / "import_to_pkg_maps"
+    root_dir.mkdir()
+    for idx in range(6):
+        payload = {
+            f"module{idx}": {"elements": [f"package{idx}", "common"]},
+            f"module{idx}.sub": {"elements": [f"package{idx}"]},
+        }
+        (root_dir / f"{idx}.json").write_text(json.dumps(payload))
+    return root_dir
+
+
+def _engine(db_file):
+    engine = create_engine(f"sqlite:///{db_file}")
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+    return engine
+
+
+def _outputs(engine):
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(Feedstocks.name, Packages.name, FeedstockOutputs.hash)
+            .join(FeedstockOutputs, FeedstockOutputs.feedstock_id == Feedstocks.id)
+            .join(Packages, FeedstockOutputs.package_id == Packages.id)
+        ).all()
+    return sorted(tuple(row) for row in rows)
+
+
+def _mappings(engine):
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(ImportNames.name, Packages.name, ImportToPackageMaps.partition)
+            .join(ImportToPackageMaps, ImportToPackageMaps.import_id == ImportNames.id)
+            .join(Packages, ImportToPackageMaps.package_id == Packages.id)
+        ).all()
+    return sorted(tuple(row) for row in rows)
+
+
+def _open_history(engine):
+    with engine.connect() as connection:
+        return tuple(
+            connection.execute(
+                select(func.count()).select_from(table).where(table.valid_to.is_(None))
+            ).scalar()
+            for table in (FeedstockOutputsHistory, ImportToPackageMapsHistory)
+        )
+
+
+def _lookup(engine):
+    with engine.connect() as connection:
+        imports = connection.execute(
+            select(ImportNames.name, Feedstocks.name, ImportFeedstocks.num_packages)
+            .join(ImportNames, ImportNames.id == ImportFeedstocks.import_id)
+            .join(Feedstocks, Feedstocks.id == ImportFeedstocks.feedstock_id)
+        ).all()
+        stats = connection.execute(
+            select(
+                Feedstocks.name, FeedstockStats.num_packages, FeedstockStats.num_imports
+            )
+            .join(Feedstocks, Feedstocks.id == FeedstockStats.feedstock_id)
+            .where(FeedstockStats.num_packages > 0)
+        ).all()
+    return sorted(map(tuple, imports)), sorted(map(tuple, stats))
+
+
+def test_partition_files_groups_by_directory(outputs_dir):
+    files = [str(file) for file in outputs_dir.rglob("*.json")]
+    partitions = shards.partition_files(outputs_dir, files, 3)
+
+    assert len(partitions) == 3
+    assert sorted(f for shard in partitions for f in shard) == sorted(files)
+    for shard in partitions:
+        parents = {Path(file).parent for file in shard}
+        for other in partitions:
+            if other is not shard:
+                assert not parents & {Path(file).parent for file in other}
+
+
+def test_partition_files_splits_flat_trees(import_maps_dir):
+    files = [str(file) for file in import_maps_dir.glob("*.json")]
+    partitions = shards.partition_files(import_maps_dir, files, 4)
+
+    assert sorted(len(shard) for shard in partitions) == [1, 1, 2, 2]
+
+
+def test_sharded_build_matches_sequential_update(
+    tmp_path, outputs_dir, import_maps_dir
+):
+    sequential = _engine(tmp_path / "sequential.db")
+    session = sessionmaker(bind=sequential)()
+    feedstock_outputs.update(session, path=outputs_dir)
+    import_to_package_maps.update(session, path=import_maps_dir)
+    session.close()
+
+    sharded = _engine(tmp_path / "sharded.db")
+    shards.build(sharded, "feedstock_outputs", outputs_dir, jobs=3)
+    shards.build(sharded, "import_to_package_maps", import_maps_dir, jobs=3)
+
+    assert _outputs(sharded) == _outputs(sequential)
+    assert _mappings(sharded) == _mappings(sequential)
+    assert _lookup(sharded) == _lookup(sequential)
+    assert _lookup(sharded)[0]
+    assert _open_history(sharded) == (
+        len(_outputs(sequential)),
+        len(_mappings(sequential)),
+    )
+    with sharded.connect() as connection:
+        packages = connection.execute(select(Packages.name)).scalars().all()
+    assert len(packages) == len(set(packages)) == 21
+
+    sequential.dispose()
+    sharded.dispose()
+
+
+def test_rebuild_drops_emptied_and_removed_partitions(tmp_path, import_maps_dir):
+    sequential = _engine(tmp_path / "sequential.db")
+    sharded = _engine(tmp_path / "sharded.db")
+    session = sessionmaker(bind=sequential)()
+    import_to_package_maps.update(session, path=import_maps_dir)
+    shards.build(sharded, "import_to_package_maps", import_maps_dir, jobs=3)
+
+    (import_maps_dir / "0.json").write_text("{}")
+    (import_maps_dir / "1.json").unlink()
+    import_to_package_maps.update(session, path=import_maps_dir)
+    session.close()
+    shards.build(sharded, "import_to_package_maps", import_maps_dir, jobs=3)
+
+    assert {partition for _, _, partition in _mappings(sharded)} == {"2", "3", "4", "5"}
+    assert _mappings(sharded) == _mappings(sequential)
+    assert _lookup(sharded) == _lookup(sequential)
+    assert _open_history(sharded) == (0, len(_mappings(sequential)))
+
+    sequential.dispose()
+    sharded.dispose()
@@ -0,0 +1,186 @@
+import json
+import re
+import sqlite3
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from cfdb.bloom import update_import_filter
+from cfdb.models import migrations
+from cfdb.populate import artifacts, feedstock_outputs, import_to_package_maps
+from cfdb.reader import CFDBReader
+
+# A full scan of a table, as opposed to "SCAN t USING COVERING INDEX i" or "SEARCH"
+TABLE_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def _trace(engine, statements):
+    """
+    Records the SQL, with its parameters expanded, of every statement the engine's
+    connections run, including those run on raw DBAPI connections.
+    """
+
+    @event.listens_for(engine, "connect")
+    def _set_trace_callback(dbapi_connection, connection_record):
+        dbapi_connection.set_trace_callback(statements.append)
+
+
+def _query_plan(db_file, sql):
+    with sqlite3.connect(db_file) as connection:
+        return [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def _queries(statements):
+    queries = []
+    for sql in statements:
+        if sql.split(None, 1)[0].upper() in ("SELECT", "DELETE", "UPDATE"):
+            if sql not in queries:
+                queries.append(sql)
+    return queries
+
+
+def _write_sources(root_dir, outputs, import_maps):
+    for package, feedstocks in outputs.items():
+        file = root_dir / "outputs" / package[0] / f"{package}.json"
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_text(json.dumps({"feedstocks": feedstocks}))
+    for partition, mappings in import_maps.items():
+        file = root_dir / "import_maps" / f"{partition}.json"
+        file.parent.mkdir(parents=True, exist_ok=True)
+        file.write_text(
+            json.dumps(
+                {name: {"elements": packages} for name, packages in mappings.items()}
+            )
+        )
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    db_file = tmp_path / "cf-database.db"
+    with create_engine(f"sqlite:///{db_file}").begin() as connection:
+        migrations.upgrade(connection)
+    return db_file
+
+
+def test_updaters_use_indexes(tmp_path, db_file):
+    statements = []
+    engine = create_engine(f"sqlite:///{db_file}")
+    _trace(engine, statements)
+
+    # a first load, then a second one adding, changing and dropping rows
+    for outputs, import_maps in (
+        (
+            {"numpy": ["numpy"], "libblas": ["openblas", "blas"]},
+            {"nu": {"numpy": ["numpy"], "numpy.linalg": ["numpy"]}},
+        ),
+        (
+            {"numpy": ["numpy"], "libblas": ["blas"], "scipy": ["scipy"]},
+            {"nu": {"numpy": ["numpy"]}, "sc": {"scipy": ["scipy"]}},
+        ),
+    ):
+        _write_sources(tmp_path, outputs, import_maps)
+        with sessionmaker(bind=engine)() as session:
+            feedstock_outputs.update(session, path=tmp_path / "outputs")
+            import_to_package_maps.update(session, path=tmp_path / "import_maps")
+            update_import_filter(session)
+            session.commit()
+    engine.dispose()
+
+    queries = _queries(statements)
+    assert any("DELETE FROM import_to_package_mapping" in sql for sql in queries)
+    for sql in queries:
+        plan = _query_plan(db_file, sql)
+        assert not [step for step in plan if TABLE_SCAN.match(step)], (sql, plan)
+
+
+def test_lookups_use_covering_indexes(tmp_path, db_file):
+    _write_sources(
+        tmp_path,
+        {"numpy": ["numpy"], "libblas": ["openblas", "blas"]},
+        {"nu": {"numpy": ["numpy", "libblas"], "numpy.linalg": ["numpy"]}},
+    )
+    with sessionmaker(bind=create_engine(f"sqlite:///{db_file}"))() as session:
+        feedstock_outputs.update(session, path=tmp_path / "outputs")
+        import_to_package_maps.update(session, path=tmp_path / "import_maps")
+        session.commit()
+
+    statements = []
+    with CFDBReader(f"sqlite:///{db_file}") as reader:
+        _trace(reader.engine, statements)
+        assert reader.who_provides("Numpy") == ("libblas", "numpy")
+        assert reader.feedstock_of("LibBlas") == ("blas", "openblas")
+        assert reader.feedstocks_for_import("numpy.linalg") == ("numpy",)
+        assert reader.feedstock_stats("openblas") == (1, 1)
+        assert reader.resolve_imports(["numpy", "os"])
+        assert reader.who_provides("numpy", as_of=datetime(2999, 1, 1))
+        assert reader.feedstock_of("libblas", as_of=datetime(2999, 1, 1))
+
+    queries = _queries(statements)
+    assert len(queries) >= 7
+    for sql in queries:
+        plan = _query_plan(db_file, sql)
+        assert not [step for step in plan if TABLE_SCAN.match(step)], (sql, plan)
+        # names are looked up in an index holding everything the query reads
+        if "normalized_name" in sql:
+            assert "USING COVERING INDEX" in plan[0], (sql, plan)
+
+
+def test_migration_replaces_the_indexes(db_file):
+    engine = create_engine(f"sqlite:///{db_file}")
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_packages_normalized_name_name")
+        connection.exec_driver_sql(
+            "CREATE INDEX ix_packages_normalized_name ON packages (normalized_name)"
+        )
+        migrations.set_metadata(connection, "schema_version", 6)
+
+    with engine.begin() as connection:
+        migrations.upgrade(connection)
+        indexes = {
+            row[0]
+            for row in connection.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE tbl_name = 'packages' "
+                "AND type = 'index'"
+            )
+        }
+    engine.dispose()
+
+    assert "ix_packages_normalized_name" not in indexes
+    assert "ix_packages_normalized_name_name" in indexes
+
+
+def test_who_ships_uses_indexes(tmp_path, db_file):
+    for name, files in (
+        (
+            "numpy",
+            ["lib/python3.11/site-packages/numpy/__init__.py", "lib/libssl.so.3"],
+        ),
+        ("openssl", ["lib/libssl.so.3", "bin/openssl"]),
+    ):
+        file = tmp_path / "artifacts" / name / "linux-64" / f"{name}-1.json"
+        file.parent.mkdir(parents=True)
+        file.write_text(
+            json.dumps({"index": {"name": name, "version": "1"}, "files": files})
+        )
+    _write_sources(tmp_path, {"openssl": ["openssl"]}, {})
+    with sessionmaker(bind=create_engine(f"sqlite:///{db_file}"))() as session:
+        feedstock_outputs.update(session, path=tmp_path / "outputs")
+        artifacts.update(session, path=tmp_path / "artifacts")
+        session.commit()
+
+    statements = []
+    with CFDBReader(f"sqlite:///{db_file}") as reader:
+        _trace(reader.engine, statements)
+        shipped = reader.who_ships(["libssl.so.3", "bin/openssl"])
+    assert shipped["bin/openssl"] == (
+        ("openssl-1", "linux-64", "openssl", ("openssl",)),
+    )
+    assert len(shipped["libssl.so.3"]) == 2
+
+    queries = _queries(statements)
+    assert len(queries) == 2
+    for sql in queries:
+        plan = _query_plan(db_file, sql)
+        assert not [step for step in plan if TABLE_SCAN.match(step)], (sql, plan)
@@ -0,0 +1,163 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+from typer.testing import CliRunner
+
+from cfdb.main import app
+from cfdb.reader import CFDBReader, to_read_only_url
+from cfdb.trie import ImportTrie
+
+
+@pytest.fixture
+def db_url(db_url, populate):
+    populate(
+        db_url,
+        [
+            ("numpy", ["numpy"]),
+            ("numpy-base", ["numpy"]),
+            ("libblas", ["openblas", "blas"]),
+        ],
+        {"nu": {"numpy": ["numpy", "numpy.linalg"], "numpy-base": ["numpy"]}},
+    )
+    return db_url
+
+
+def test_to_read_only_url():
+    assert to_read_only_url("sqlite:///cf-database.db").query == {
+        "mode": "ro",
+        "uri": "true",
+    }
+    assert to_read_only_url("sqlite://").database is None
+    assert str(to_read_only_url("postgresql://localhost/cfdb")) == (
+        "postgresql://localhost/cfdb"
+    )
+
+
+def test_lookups(db_url):
+    with CFDBReader(db_url) as reader:
+        assert reader.who_provides("numpy") == ("numpy", "numpy-base")
+        assert reader.who_provides("numpy.linalg") == ("numpy",)
+        assert reader.who_provides("scipy") == ()
+        assert reader.feedstock_of("libblas") == ("blas", "openblas")
+        assert reader.feedstock_of("numpy-base") == ("numpy",)
+
+
+def test_lookups_are_normalized(db_url, populate):
+    populate(db_url, import_maps={"nu": {"Pillow": ["PIL"]}})
+    populate(db_url, import_maps={"nu": {"pil-compat": ["pil"]}})
+
+    with CFDBReader(db_url) as reader:
+        assert reader.feedstock_of("NumPy_Base") == ("numpy",)
+        assert reader.feedstock_of("numpy.base") == ("numpy",)
+        assert reader.who_provides("Numpy.Linalg") == ("numpy",)
+        # exact matches win over their normalized variants
+        assert reader.who_provides("PIL") == ("Pillow",)
+        assert reader.who_provides("pil") == ("pil-compat",)
+        assert reader.who_provides("Pil") == ("Pillow", "pil-compat")
+
+
+def test_resolve_imports(db_url):
+    with CFDBReader(db_url) as reader:
+        assert reader.resolve_imports(
+            ["numpy", "numpy.linalg", "scipy", "numpy"], chunk_size=1
+        ) == {
+            "numpy": {"numpy": ("numpy",), "numpy-base": ("numpy",)},
+            "numpy.linalg": {"numpy": ("numpy",)},
+        }
+
+
+def test_resolve_imports_agrees_with_who_provides(db_url, populate):
+    populate(db_url, import_maps={"nu": {"Pillow": ["PIL"]}})
+    populate(db_url, import_maps={"nu": {"pil-compat": ["pil"]}})
+
+    names = ["PIL", "pil", "Pil", "Numpy.Linalg", "scipy"]
+    with CFDBReader(db_url) as reader:
+        resolved = reader.resolve_imports(names)
+        assert {name: tuple(packages) for name, packages in resolved.items()} == {
+            name: reader.who_provides(name)
+            for name in names
+            if reader.who_provides(name)
+        }
+        assert resolved["Numpy.Linalg"] == {"numpy": ("numpy",)}
+
+
+def test_caches_are_invalidated_by_the_data_version(db_url, populate):
+    with CFDBReader(db_url, check_interval=3600) as reader:
+        assert reader.who_provides("scipy") == ()
+        version = reader.data_version
+
+        populate(db_url, import_maps={"nu": {"scipy": ["scipy"]}})
+        # the version is not checked again before the interval elapsed
+        assert reader.who_provides("scipy") == ()
+
+        reader.refresh()
+        assert reader.data_version > version
+        assert reader.who_provides("scipy") == ("scipy",)
+
+
+def test_match_import_uses_the_trie_cache(db_url, populate, tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    with CFDBReader(db_url, check_interval=0, cache_dir=cache_dir) as reader:
+        assert reader.match_import("numpy.linalg.lapack_lite") == (
+            "numpy.linalg",
+            ("numpy",),
+        )
+        assert reader.match_imports(["numpy.fft", "scipy"]) == {
+            "numpy.fft": ("numpy", ("numpy", "numpy-base")),
+            "scipy": (None, ()),
+        }
+        (trie_file,) = cache_dir.iterdir()
+
+        populate(db_url, import_maps={"nu": {"scipy": ["scipy"]}})
+        assert reader.match_import("scipy.sparse") == ("scipy", ("scipy",))
+        # the trie of the previous data version is replaced
+        assert list(cache_dir.iterdir()) != [trie_file]
+        assert len(list(cache_dir.iterdir())) == 1
+
+    # another reader loads the cached trie instead of querying the database
+    monkeypatch.setattr(ImportTrie, "from_mappings", None)
+    with CFDBReader(db_url, cache_dir=cache_dir) as reader:
+        assert reader.match_import("scipy.sparse") == ("scipy", ("scipy",))
+
+
+@pytest.mark.sqlite_only
+def test_reader_is_read_only(db_url):
+    with CFDBReader(db_url) as reader:
+        with reader.engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql("DELETE FROM packages")
+
+
+def test_cli_lookups(db_url):
+    runner = CliRunner()
+
+    result = runner.invoke(app, ["who-provides", "numpy", "--db-url", db_url])
+    assert result.exit_code == 0
+    assert result.stdout.split() == ["numpy", "numpy-base"]
+
+    result = runner.invoke(app, ["feedstock-of", "libblas", "--db-url", db_url])
+    assert result.exit_code == 0
+    assert result.stdout.split() == ["blas", "openblas"]
+
+    result = runner.invoke(app, ["who-provides", "scipy", "--db-url", db_url])
+    assert result.exit_code == 1
+
+    result = runner.invoke(app, ["who-provides", "numpy.fft", "--db-url", db_url])
+    assert result.exit_code == 0
+    assert result.stdout.split() == ["numpy", "numpy-base"]
+
+
+def test_cli_resolve_imports(db_url, tmp_path):
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "main.py").write_text("import numpy\nimport scipy.sparse\nimport os\n")
+
+    result = CliRunner().invoke(
+        app, ["resolve-imports", str(project), "-j", "1", "--db-url", db_url]
+    )
+    assert result.exit_code == 0
+    assert result.stdout.splitlines()[-4:] == [
+        "numpy: numpy (numpy), numpy-base (numpy)",
+        "Unresolved imports: scipy",
+        "Suggested packages: numpy numpy-base",
+        "Suggested feedstocks: numpy",
+    ]
@@ -0,0 +1,50 @@
+import sys
+import textwrap
+
+import pytest
+
+from cfdb.scan import extract_imports, scan_imports, stdlib_modules
+
+
+def test_extract_imports(tmp_path):
+    file = tmp_path / "module.py"
+    file.write_text(textwrap.dedent("""
+            import os, numpy.linalg as la
+            from scipy import sparse
+            from . import sibling
+            from .sibling import helper
+
+            def f():
+                import pandas
+            """))
+
+    assert extract_imports(str(file)) == {"os", "numpy", "scipy", "pandas"}
+
+
+def test_extract_imports_skips_invalid_files(tmp_path):
+    file = tmp_path / "broken.py"
+    file.write_text("import numpy\ndef (:\n")
+
+    assert extract_imports(str(file)) == set()
+
+
+def test_scan_imports(tmp_path):
+    (tmp_path / "project").mkdir()
+    (tmp_path / "project" / "__init__.py").write_text("import numpy\n")
+    (tmp_path / "project" / "core.py").write_text(
+        "import json\nimport project.utils\nfrom requests import get\n"
+    )
+    (tmp_path / "setup.py").write_text("import setuptools\n")
+
+    assert scan_imports(tmp_path, jobs=2) == {"numpy", "requests", "setuptools"}
+
+
+@pytest.mark.parametrize("listed", [True, False])
+def test_stdlib_modules(listed, monkeypatch):
+    # Python < 3.10 lists the standard library directories instead
+    if not listed:
+        monkeypatch.delattr(sys, "stdlib_module_names", raising=False)
+
+    modules = stdlib_modules()
+    assert {"json", "collections", "os", "sys", "asyncio"} <= modules
+    assert not {"numpy", "pytest", "sqlalchemy"} & modules
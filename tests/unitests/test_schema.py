@@ -11,22 +11,21 @@ from cfdb.models.schema import (
 
 @pytest.fixture
 def sample_feedstock() -> Feedstocks:
-    return Feedstocks(name="feedstock_1")
+    return Feedstocks(id=1, name="feedstock_1")
 
 
 @pytest.fixture
 def sample_package() -> Packages:
-    return Packages(name="package_1")
+    return Packages(id=2, name="package_1")
 
 
 @pytest.fixture
 def sample_feedstock_output(sample_feedstock, sample_package) -> FeedstockOutputs:
     return FeedstockOutputs(
-        id="output_1",
         path="/path/to/output_1",
-        feedstock_name=sample_feedstock.name,
-        package_name=sample_package.name,
-        hash="123456",
+        feedstock_id=sample_feedstock.id,
+        package_id=sample_package.id,
+        hash=bytes.fromhex("12" * 20),
     )
 
 
@@ -48,19 +47,20 @@ def sample_relations_map_file_path() -> RelationsMapFilePaths:
 
 
 def test_feedstocks(sample_feedstock):
+    assert sample_feedstock.id == 1
     assert sample_feedstock.name == "feedstock_1"
 
 
 def test_packages(sample_package):
+    assert sample_package.id == 2
     assert sample_package.name == "package_1"
 
 
 def test_feedstock_outputs(sample_feedstock_output, sample_feedstock, sample_package):
-    assert sample_feedstock_output.id == "output_1"
     assert sample_feedstock_output.path == "/path/to/output_1"
-    assert sample_feedstock_output.feedstock_name == sample_feedstock.name
-    assert sample_feedstock_output.package_name == sample_package.name
-    assert sample_feedstock_output.hash == "123456"
+    assert sample_feedstock_output.feedstock_id == sample_feedstock.id
+    assert sample_feedstock_output.package_id == sample_package.id
+    assert len(sample_feedstock_output.hash) == 20
 
 
 def test_artifacts(sample_artifact):
@@ -0,0 +1,104 @@
+import pytest
+from sqlalchemy import create_engine
+from typer.testing import CliRunner
+
+from cfdb.main import app
+from cfdb.models.schema import Base
+from cfdb.reader import CFDBReader
+from cfdb.search import has_search_index, search, similarity
+
+OUTPUTS = [
+    ("scikit-learn", ["scikit-learn"]),
+    ("pillow", ["pillow"]),
+    ("numpy", ["numpy"]),
+]
+IMPORT_MAPS = {"sc": {"scikit-learn": ["sklearn"], "pillow": ["PIL"]}}
+
+
+@pytest.fixture
+def db_url(db_url, populate):
+    populate(db_url, OUTPUTS, IMPORT_MAPS)
+    return db_url
+
+
+@pytest.fixture
+def search_index(db_url):
+    engine = create_engine(db_url)
+    with engine.connect() as connection:
+        indexed = has_search_index(connection)
+    engine.dispose()
+    if not indexed:
+        pytest.skip("The database does not support the trigram search indexes.")
+
+
+def test_similarity():
+    assert similarity("numpy", "NumPy") == 1.0
+    assert similarity("scikit_learn", "scikit-learn") == 10 / 16
+    assert similarity("PIL", "pillow") > 0.3
+    assert similarity("numpy", "pillow") == 0.0
+
+
+@pytest.mark.usefixtures("search_index")
+def test_search(db_url):
+    with CFDBReader(db_url) as reader:
+        with reader.engine.connect() as connection:
+            assert has_search_index(connection)
+
+        assert reader.search("scikit_learn")[:2] == [
+            ("feedstock", "scikit-learn", 10 / 16),
+            ("package", "scikit-learn", 10 / 16),
+        ]
+        assert [name for _, name, _ in reader.search("PIL", kinds=["import"])] == [
+            "PIL"
+        ]
+        assert ("package", "pillow") in [
+            (kind, name) for kind, name, _ in reader.search("PIL")
+        ]
+        assert reader.search("tensorflow") == []
+        assert reader.search("  ") == []
+        with pytest.raises(ValueError):
+            reader.search("numpy", kinds=["artifact"])
+
+
+def test_search_index_is_maintained_by_the_updaters(db_url, populate):
+    populate(db_url, import_maps={"sc": {"scikit-image": ["skimage"]}})
+
+    with CFDBReader(db_url) as reader:
+        assert reader.search("scikit-imag", kinds=["package"], limit=1) == [
+            (
+                "package",
+                "scikit-image",
+                pytest.approx(similarity("scikit-imag", "scikit-image")),
+            )
+        ]
+
+
+def test_search_without_index(tmp_path, populate):
+    db_url = f"sqlite:///{tmp_path / 'cf-database.db'}"
+    engine = create_engine(db_url)
+    Base.metadata.create_all(engine)
+    populate(db_url, OUTPUTS, IMPORT_MAPS)
+
+    with engine.connect() as connection:
+        assert not has_search_index(connection)
+        assert [name for _, name, _ in search(connection, "kit", ["package"])] == [
+            "scikit-learn"
+        ]
+    engine.dispose()
+
+
+@pytest.mark.usefixtures("search_index")
+def test_cli_search(db_url):
+    runner = CliRunner()
+
+    result = runner.invoke(
+        app, ["search", "scikit_learn", "-k", "package", "--db-url", db_url]
+    )
+    assert result.exit_code == 0
+    assert result.stdout.splitlines()[-1] == "package: scikit-learn (0.62)"
+
+    result = runner.invoke(app, ["search", "tensorflow", "--db-url", db_url])
+    assert result.exit_code == 1
+
+    result = runner.invoke(app, ["search", "numpy", "-k", "nope", "--db-url", db_url])
+    assert result.exit_code == 2
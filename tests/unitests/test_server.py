@@ -0,0 +1,98 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from cfdb.reader import CFDBReader
+from cfdb.server import CFDBServer, etag
+
+
+@pytest.fixture
+def db_url(db_url, populate):
+    populate(
+        db_url,
+        [("libblas", ["openblas", "blas"])],
+        {"nu": {"numpy": ["numpy"], "numpy-base": ["numpy"]}},
+    )
+    return db_url
+
+
+@pytest.fixture
+def server(db_url):
+    with CFDBReader(db_url, check_interval=0) as reader:
+        with CFDBServer(("127.0.0.1", 0), reader) as server:
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            yield server
+            server.shutdown()
+            thread.join()
+
+
+def _request(server, path, data=None, headers=None):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{server.server_port}{path}",
+        data=data,
+        headers=headers or {},
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def test_get_lookups(server):
+    status, headers, body = _request(server, "/who-provides/numpy")
+    assert status == 200
+    assert json.loads(body) == {"numpy": ["numpy", "numpy-base"]}
+    assert headers["ETag"] == etag(server.reader.data_version)
+
+    status, _, body = _request(server, "/feedstock-of/libblas")
+    assert json.loads(body) == {"libblas": ["blas", "openblas"]}
+
+    status, _, body = _request(server, "/who-provides/scipy")
+    assert status == 200
+    assert json.loads(body) == {"scipy": []}
+
+    status, _, body = _request(server, "/version")
+    assert json.loads(body) == {"data_version": server.reader.data_version}
+
+    status, _, _ = _request(server, "/unknown/numpy")
+    assert status == 404
+
+
+def test_batched_lookups(server):
+    status, _, body = _request(
+        server, "/who-provides", data=json.dumps(["scipy", "numpy", "numpy"]).encode()
+    )
+    assert status == 200
+    assert json.loads(body) == {"numpy": ["numpy", "numpy-base"], "scipy": []}
+
+    status, _, _ = _request(server, "/who-provides", data=b"{not json")
+    assert status == 400
+    status, _, _ = _request(server, "/feedstock-of", data=b'{"names": []}')
+    assert status == 400
+
+
+def test_revalidation(server, db_url, populate):
+    _, headers, _ = _request(server, "/who-provides/scipy")
+    tag = headers["ETag"]
+
+    status, headers, body = _request(
+        server, "/who-provides/scipy", headers={"If-None-Match": tag}
+    )
+    assert status == 304
+    assert body == b""
+    assert headers["ETag"] == tag
+
+    populate(db_url, import_maps={"nu": {"scipy": ["scipy"]}})
+
+    # the cached response is stale once the data version changed
+    status, headers, body = _request(
+        server, "/who-provides/scipy", headers={"If-None-Match": tag}
+    )
+    assert status == 200
+    assert headers["ETag"] != tag
+    assert json.loads(body) == {"scipy": ["scipy"]}
@@ -0,0 +1,48 @@
+import json
+
+from cfdb.trie import ImportTrie
+
+
+def _trie():
+    return ImportTrie.from_mappings(
+        [
+            ("google", "protobuf"),
+            ("google.cloud.storage", "google-cloud-storage"),
+            ("google.cloud.storage", "google-cloud-storage-legacy"),
+            ("numpy", "numpy"),
+        ]
+    )
+
+
+def test_match_longest_prefix():
+    trie = _trie()
+
+    assert trie.match("google.cloud.storage.blob") == (
+        "google.cloud.storage",
+        ("google-cloud-storage", "google-cloud-storage-legacy"),
+    )
+    assert trie.match("google.cloud.storage") == (
+        "google.cloud.storage",
+        ("google-cloud-storage", "google-cloud-storage-legacy"),
+    )
+    # google.cloud itself is not mapped, google is
+    assert trie.match("google.cloud.bigquery") == ("google", ("protobuf",))
+    assert trie.match("numpy.linalg") == ("numpy", ("numpy",))
+    assert trie.match("scipy.sparse") == (None, ())
+
+
+def test_match_many():
+    assert _trie().match_many(["numpy.fft", "pandas"]) == {
+        "numpy.fft": ("numpy", ("numpy",)),
+        "pandas": (None, ()),
+    }
+
+
+def test_save_and_load(tmp_path):
+    trie_file = tmp_path / "import-trie.json"
+    _trie().save(trie_file)
+
+    assert ImportTrie.load(trie_file).root == _trie().root
+    # the cache holds data only, never pickled objects
+    assert json.loads(trie_file.read_text())[1]["numpy"] == [["numpy"], {}]
+    assert list(tmp_path.iterdir()) == [trie_file]